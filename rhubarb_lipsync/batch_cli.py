@@ -0,0 +1,58 @@
+"""Command line entry point of the batch pipeline. Captures a folder of sound files and bakes them without the UI:
+
+    blender --background scene.blend --python <addon folder>/batch_cli.py -- --sounds takes/ --output out/ --object Face [--mapping preset.json]
+
+The addon has to be enabled in the Blender preferences (or use the `--addons rhubarb_lipsync` flag).
+Exits with non-zero code when any of the sound files failed. See the report.json in the output folder for details.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+
+import bpy
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="batch_cli.py", description="Rhubarb Lipsync NG batch capture and bake")
+    parser.add_argument("--sounds", required=True, help="Folder with the sound files (ogg or wav)")
+    parser.add_argument("--output", required=True, help="Folder for the json cue files, the baked .blend files and the report")
+    parser.add_argument("--object", required=True, help="Name of the object with the mapping to bake the cues on")
+    parser.add_argument("--mapping", default="", help="Json file mapping the cue keys to Action names. The object's mapping is used when not set")
+    parser.add_argument("--report", default="", help="Where to save the json report. Defaults to report.json in the output folder")
+    parser.add_argument("--jobs", type=int, default=0, help="Max parallel rhubarb processes. Defaults to the addon preferences")
+    return parser.parse_args(argv)
+
+
+def addon_preferences() -> bpy.types.AddonPreferences:
+    # Installed as an extension the addon module name has the bl_ext.<repo> prefix
+    for name, addon in bpy.context.preferences.addons.items():
+        if name.split(".")[-1] == "rhubarb_lipsync":
+            return addon.preferences
+    sys.exit("The rhubarb_lipsync addon is not enabled")
+
+
+def main() -> None:
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    args = parse_args(argv)
+    prefs = addon_preferences()
+    if args.jobs > 0:
+        prefs.capture_concurrency = args.jobs
+    report_path = pathlib.Path(args.report or pathlib.Path(args.output) / "report.json")
+    ret = bpy.ops.rhubarb.run_batch_pipeline(
+        sound_folder=args.sounds,
+        output_folder=args.output,
+        target_object=args.object,
+        mapping_preset=args.mapping,
+        report_file=str(report_path),
+    )
+    if 'FINISHED' not in ret:
+        sys.exit(2)
+    failed = json.loads(report_path.read_text(encoding="utf-8"))["failed"]
+    if failed:
+        sys.exit(f"{failed} sound files failed. See {report_path}")
+
+
+if __name__ == "__main__":
+    main()
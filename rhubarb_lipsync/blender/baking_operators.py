@@ -1,13 +1,16 @@
 import logging
 import textwrap
+import time
+from typing import Iterator, Optional
 
 import bpy
-from bpy.props import BoolProperty, EnumProperty
-from bpy.types import Context, Object, UILayout
+from bpy.props import BoolProperty, EnumProperty, FloatProperty
+from bpy.types import Context, UILayout
 
 from .. import IconsManager
-from ..rhubarb.mouth_cues import MouthCue, frame2time, time2frame_float
-from . import baking_utils, ui_utils
+from ..rhubarb.mouth_cues import frame2time, time2frame_float
+from ..rhubarb.placement_plan import PlacementPlan, PlannedStrip
+from . import action_support, baking_utils, keyframe_baking, ui_utils
 from .capture_properties import CaptureListProperties, CaptureProperties, ResultLogListProperties
 from .mapping_operators import StopAllPreview
 from .mapping_properties import MappingProperties
@@ -74,6 +77,8 @@ class RemoveCapturedNlaStrips(bpy.types.Operator):
         try:
             for o in b.object_iter():
                 self.on_object(b)
+            b.baked_plan = None  # The strips of the last bake are gone, the dirty range can't be rebaked anymore
+            b.interrupted_bake = None
 
         except Exception as e:
             self.report({'ERROR'}, str(e))
@@ -226,6 +231,37 @@ class BakeToNLA(bpy.types.Operator):
         default="MANUAL",
     )
 
+    strip_write_mode: EnumProperty(  # type: ignore
+        name="Strip writing",
+        description="How the attributes of the new strips are written",
+        items=[
+            ("BULK", "Bulk", "Write the strip attributes of the whole track at once. Faster for many cues or objects"),
+            ("PER_STRIP", "Per strip", "Set the attributes of each strip right after it is created"),
+        ],
+        default="BULK",
+    )
+
+    only_changed: BoolProperty(  # type: ignore
+        name="Only changed cues",
+        description="Re-bake only the strips of the cues which changed since the last bake of the capture. The other strips are kept",
+        default=False,
+    )
+
+    background: BoolProperty(  # type: ignore
+        name="Bake in background",
+        description="Bake in short time slices so Blender stays responsive. Press ESC to cancel, the strips of the not finished object are removed",
+        default=False,
+    )
+    resume: BoolProperty(  # type: ignore
+        name="Resume",
+        description="Continue the interrupted bake of the capture. The objects baked before the interruption are skipped",
+        default=False,
+    )
+
+    # Time budget of a single timer tick when baking in the background
+    slice_seconds = 0.008
+    last_op = None  # To support unit tests. No good way to find running ops in Blender API
+
     @classmethod
     def disabled_reason(cls, context: Context) -> str:
         error_common = CaptureProperties.sound_selection_validation(context, False, False)
@@ -248,151 +284,314 @@ class BakeToNLA(bpy.types.Operator):
         rll.clear()  # Clear log entries from last bake
         bctx = baking_utils.BakingContext(context)
         bctx.migrate_obj_mapping_to_slots()
+        if self.only_changed or self.resume:
+            return self.execute(context)  # Nothing to confirm, the existing strips are reused
         wm = context.window_manager
         return wm.invoke_props_dialog(self, width=480)
 
-    def to_strip(self) -> None:
-        b = self.bctx
-        cf = b.current_cue
-        cue: MouthCue = cf and cf.cue or None
-        if not b.current_mapping_action:
-            with b.rlog.check_dups() as log:
-                log.warning(f"There is no mapping for the cue {cue.key} in the capture. Ignoring", self.bctx.current_traceback)
-            return
-
-        # start = cue_frames.pre_start_frame_float  # The clip starts slightly before the cue start driven by the blend-in value
-
-        bir: float = b.strip_placement_props.blend_inout_ratio
-        prev_cf = b.preceding_cue
-
-        if b.cue_processor.is_cue_silence(prev_cf) or b.strip_placement_props.inout_blend_type == "NO_BLENDING":
-            # When the previous cue is silence, this cue should blend-in without overlap
-            start = cf.start_frame_float
-            blend_in = cf.get_middle_start_frame(bir) - start
-        else:
-            # The clip starts (blending in) after the end of the middle section of the previous clip.
-            start = prev_cf.get_middle_end_frame_float(bir)
-            blend_in = cf.get_middle_start_frame(bir) - start
-
-        next_cf = b.following_cue
-        if b.cue_processor.is_cue_silence(next_cf) or b.strip_placement_props.inout_blend_type == "NO_BLENDING":
-            # When the following cue is silence, this cue should blend out without overlap
-            end = cf.end_frame_float
-            blend_out = cf.end_frame_float - cf.get_middle_end_frame_float(bir)
-        else:
-            end = next_cf.get_middle_start_frame(bir)
-            blend_out = end - cf.get_middle_end_frame_float(bir)
-
-        desired_strip_duration = end - start
-        assert desired_strip_duration > 0, f"desired_strip_duration={desired_strip_duration} [{b.current_traceback}]"
-        assert blend_in >= 0, f"blend_in={blend_in} [{b.current_traceback}]"
-        assert blend_out >= 0, f"blend_out={blend_out} [{b.current_traceback}]"
-        # Try to scale the strip to the cue duration
-        scale = b.current_mapping_action_scale(desired_strip_duration)
-
-        self.place_strip(start, end, blend_in, blend_out, scale)
-
-    def place_strip(self, start: float, end: float, blend_in: float, blend_out: float, scale: float) -> None:
+    def place_strip(
+        self, track: bpy.types.NlaTrack, strip_index: baking_utils.StripIndex, src: baking_utils.StripSource, ps: PlannedStrip, scale: float
+    ) -> bpy.types.NlaStrip:
+        """Creates the strip and sets its frame range"""
         b = self.bctx
-        cf = b.current_cue
-        cue: MouthCue = cf and cf.cue or None
         # Crop the previous strip-end to make room for the current strip start (if needed)
-        if baking_utils.trim_strip_end_at(b.current_track, start):
+        _, prev = strip_index.find_at(ps.start)
+        if prev and prev.as_pointer() not in self.object_placed:  # A strip which was on the track before the bake, restored on the rollback
+            self.object_trims.setdefault(prev.as_pointer(), (prev, prev.frame_end))
+        if strip_index.trim_end_at(ps.start):
             b.rlog.warning("Had to trim previous strip to make room for this one", self.bctx.current_traceback)
         # Create new strip. Start frame is mandatory but int only, so round it up to avoid clashing with previous one because of rouding error
-        name = f"{cue.info.key_displ}.{str(b.cue_index).zfill(3)}"
-        strip = b.current_track.strips.new(name, int(start + 1), b.current_mapping_action)
-        if b.current_mapping_item.custom_frame_ranage:
-            strip.action_frame_start = b.current_mapping_item.frame_start
-            strip.action_frame_end = b.current_mapping_item.frame_end
-        strip.frame_start = start  # Set start frame again as float (ctor takes only int)
+        strip = track.strips.new(ps.name, int(ps.start + 1), src.action)
+        if src.custom_frame_range:
+            strip.action_frame_start, strip.action_frame_end = src.custom_frame_range
+        strip.frame_start = ps.start  # Set start frame again as float (ctor takes only int)
         strip.scale = scale
-        if b.current_mapping_item.slot:
-            strip.action_slot = b.current_mapping_item.slot
+        if src.slot:
+            strip.action_slot = src.slot
         # if b.ctx.scene.show_subframe:
-        strip.frame_end = end
+        strip.frame_end = ps.end
         self.strips_added += 1
-        strip.name = name
-        strip.blend_type = b.strip_placement_props.strip_blend_type
-        strip.extrapolation = b.strip_placement_props.extrapolation
-        strip.use_sync_length = b.strip_placement_props.use_sync_length
-        # Autoblend when forced by option, otherwise only autobled the silence cues (X or A)
-        auto_blend = b.cue_processor.is_cue_silence(cf)  # Silence auto-blend by default
-        if b.strip_placement_props.inout_blend_type == "ALWAYS_AUTOBLEND":
-            auto_blend = True  # Auto-blend is forced
-        if b.strip_placement_props.inout_blend_type == "NO_BLENDING":
-            auto_blend = False  # Auto-blend disabled for all (even silence)
-
-        if auto_blend:
+        self.object_placed.add(strip.as_pointer())
+        return strip
+
+    def setup_strip(self, strip: bpy.types.NlaStrip, ps: PlannedStrip) -> None:
+        """Sets the remaining strip attributes one by one"""
+        sp = self.bctx.strip_placement_props
+        strip.name = ps.name
+        strip.blend_type = sp.strip_blend_type
+        strip.extrapolation = sp.extrapolation
+        strip.use_sync_length = sp.use_sync_length
+
+        if ps.auto_blend:
             strip.use_auto_blend = True
             strip.frame_end = strip.frame_end - 0.001  # To avoid strips touching, which would effectivelly disable autoblend
         else:
             # No autoblending
-            if b.strip_placement_props.inout_blend_type == "BY_RATIO":
-                strip.blend_in = blend_in
-                strip.blend_out = blend_out
-
-    def bake_cue_on_object(self, obj: Object) -> None:
+            if sp.inout_blend_type == "BY_RATIO":
+                strip.blend_in = ps.blend_in
+                strip.blend_out = ps.blend_out
+
+    def setup_strip_bulk(self, writer: baking_utils.BulkStripWriter, strip: bpy.types.NlaStrip, ps: PlannedStrip) -> None:
+        """Same as the `setup_strip` but the plain attributes are only collected, the `writer` writes them later for the whole track.
+        The blends are still set right away, they depend on the strip length (clamped) which can still change by the trim.
+        And the auto-blend setter resets the blends, so it can't be written in bulk to all the strips of the track"""
+        writer.add(strip, **self.bulk_attrs)
+        if ps.auto_blend:
+            strip.use_auto_blend = True
+            strip.frame_end = strip.frame_end - 0.001  # To avoid strips touching, which would effectivelly disable autoblend
+        elif self.blend_by_ratio:
+            strip.blend_in = ps.blend_in
+            strip.blend_out = ps.blend_out
+
+    def remove_changed_strips(self, baked_plan: PlacementPlan, plan: PlacementPlan, dirty: tuple[int, int, int]) -> None:
+        """Removes the strips of the dirty range of the last bake from the current object.
+        The kept strips after the range are renamed when the cue indexes shifted"""
+        tracks = self.bctx.track_pair
+        if not tracks:
+            return
+        start, baked_end, end = dirty
+        strips_by_name = [{s.name: s for s in t.strips} for t in tracks]
+        for ps in baked_plan.strips[start:baked_end]:
+            strip = strips_by_name[ps.track_slot].pop(ps.name, None)
+            if strip:
+                tracks[ps.track_slot].strips.remove(strip)
+        kept = list(zip(baked_plan.strips[baked_end:], plan.strips[end:]))
+        if end > baked_end:
+            kept.reverse()  # Rename from the last one so the new name is not taken yet
+        for baked_ps, ps in kept:
+            strip = strips_by_name[baked_ps.track_slot].get(baked_ps.name)
+            if strip and baked_ps.name != ps.name:
+                strip.name = ps.name
+
+    def refresh_auto_blends(self, plan: PlacementPlan, first: int, last: int) -> None:
+        """Blender recalculates the auto-blends of a strip when the strip itself is changed. The strips around the rebaked range
+        could be overlapping different strips now"""
+        tracks = self.bctx.track_pair
+        if not tracks:
+            return
+        strips_by_name = [{s.name: s for s in t.strips} for t in tracks]
+        for ps in plan.strips[max(0, first - 2) : last + 2]:
+            strip = ps.auto_blend and strips_by_name[ps.track_slot].get(ps.name)
+            if strip:
+                strip.frame_end = strip.frame_end  # Triggers the update
+
+    def bake_plan_on_object(self, plan: PlacementPlan, first=0, last=-1) -> Iterator[None]:
+        """Replays the placement plan (or its `first`-`last` range) on the current object. Only the mapped Action and the strip scale are object specific.
+        Yields after each placed cue, so the bake can be split to time slices"""
         b = self.bctx
-
-        track = b.current_track
-        if not track:
-            if b.cue_index <= 0:  # Only log the error 1x
-                b.rlog.error(f"{obj and obj.name} has no NLA track selected. Ignoring", self.bctx.current_traceback)
+        obj = b.current_object
+        tracks = b.track_pair
+        if not tracks:
+            b.rlog.error(f"{obj and obj.name} has no NLA track selected. Ignoring", self.bctx.current_traceback)
             return
-        self.to_strip()
-
-    def bake_cue(self) -> None:
-        for obj in self.bctx.object_iter():
-            assert self.bctx.current_cue, "No cue selected"
-            # print(self.bctx.cue_index)
-            if log.isEnabledFor(logging.TRACE):  # type: ignore
-                log.trace(f"Baking on object {obj} ")  # type: ignore
-            self.bake_cue_on_object(obj)
+        start_time = time.perf_counter()
+        strips_before = self.strips_added
+        strip_indexes = [b.strip_index(t) for t in tracks]
+        bulk = self.strip_write_mode == "BULK"
+        writers = {t.as_pointer(): baking_utils.BulkStripWriter(t) for t in tracks} if bulk else {}
+        slot_writers = [writers.get(t.as_pointer()) for t in tracks]  # Same writer for both slots when there is a single track
+        sources = [baking_utils.StripSource.from_mapping_item(mi) for mi in b.mprops.items]
+        self.object_strips: list[tuple[bpy.types.NlaTrack, bpy.types.NlaStrip]] = []  # To roll back a not finished object
+        self.object_placed: set[int] = set()  # Pointers of the `object_strips`
+        self.object_trims: dict[int, tuple[bpy.types.NlaStrip, float]] = {}  # The trimmed strips of the track and their original end
+        wm = b.ctx.window_manager
+        for ps in plan.strips[first : last if last >= 0 else len(plan)]:
+            b.cue_index, b.track_index = ps.cue_index, ps.track_slot  # For the log traceback
+            if ps.cue_index % 100 == 0 and not self.background:  # The progress bar is not used in the background
+                wm.progress_update(b.object_index * len(plan) + ps.cue_index)
+            src = sources[ps.key_index]
+            if not src.action:
+                with b.rlog.check_dups() as rlog:
+                    rlog.warning(f"There is no mapping for the cue {ps.key} in the capture. Ignoring", self.bctx.current_traceback)
+                yield
+                continue
+            # Try to scale the strip to the cue duration
+            scale = b.action_scale(src.length_frames, ps.duration)
+            strip = self.place_strip(tracks[ps.track_slot], strip_indexes[ps.track_slot], src, ps, scale)
+            if bulk:
+                self.setup_strip_bulk(slot_writers[ps.track_slot], strip, ps)
+            else:
+                self.setup_strip(strip, ps)
+            strip_indexes[ps.track_slot].add(strip)
+            self.object_strips.append((tracks[ps.track_slot], strip))
+            yield
+        for w in writers.values():
+            w.flush()
+        self.object_strips, self.object_placed, self.object_trims = [], set(), {}
+        log.info(f"{obj.name}: placed {self.strips_added - strips_before} strips in {time.perf_counter() - start_time:.3f}s ({self.strip_write_mode})")
+
+    def bake_steps(self, plan: PlacementPlan, baked_plan: Optional[PlacementPlan], dirty: tuple[int, int, int], skip_objects: set[str]) -> Iterator[None]:
+        """The whole bake, one cue at a time"""
+        b = self.bctx
+        for obj in b.object_iter():
+            if obj.name in skip_objects:
+                continue  # Already baked before the bake got interrupted
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"Baking on object {obj} ")
+            if baked_plan:
+                self.remove_changed_strips(baked_plan, plan, dirty)
+            yield from self.bake_plan_on_object(plan, dirty[0], dirty[2])
+            if baked_plan:
+                self.refresh_auto_blends(plan, dirty[0], dirty[2])
+            self.objects_done.append(obj.name)
+
+    def rollback_object(self) -> None:
+        """Removes the strips placed on the object which didn't finish baking and restores the ends of the trimmed strips"""
+        strips = getattr(self, "object_strips", [])
+        for track, strip in reversed(strips):
+            track.strips.remove(strip)
+            self.strips_added -= 1
+        if strips:
+            log.info(f"Removed {len(strips)} strips of the not finished object")
+        trims = getattr(self, "object_trims", {})
+        for strip, frame_end in trims.values():  # There is a room again, the strips placed after them were removed
+            strip.frame_end = frame_end
+        if trims:
+            log.info(f"Restored the end of {len(trims)} trimmed strips")
+        self.object_strips, self.object_placed, self.object_trims = [], set(), {}
 
     def execute(self, ctx: Context) -> ui_utils.OperatorReturnSet:
         self.bctx = baking_utils.BakingContext(ctx)
         self.strips_added = 0
+        self.objects_done: list[str] = []
+        if self.background and self.only_changed:
+            self.report({'INFO'}, "Re-baking only the changed cues is quick, not baking in the background")
+            self.background = False
+        self.steps: Optional[Iterator[None]] = None
         b = self.bctx
+        sp = b.strip_placement_props
+        # Same for all the strips, read the preferences only once
+        self.bulk_attrs = {"blend_type": sp.strip_blend_type, "extrapolation": sp.extrapolation, "use_sync_length": sp.use_sync_length}
+        self.blend_by_ratio = sp.inout_blend_type == "BY_RATIO"
 
         # Check strip removal mode and perform auto-removal if needed
         prefs = RhubarbAddonPreferences.from_context(ctx)
-        if prefs.strip_removal_mode == "AUTO":
+        if prefs.strip_removal_mode == "AUTO" and not self.only_changed and not self.resume:
             log.info("Auto-removing existing NLA strips before baking")
             bpy.ops.rhubarb.remove_captured_nla_strips()
         if prefs.stop_preview_mode == "AUTO":
             bpy.ops.rhubarb.stop_all_preview()
 
-        wm = ctx.window_manager
         l = len(b.mouth_cue_items)
         log.info(f"About to optimize {l} cues")
-        wm.progress_begin(0, l)
         try:
             b.optimize_cues()
-            # Loop over cues and for each cue alternate between the two tracks and for each track loop over all objects
-            log.debug("Optimization done. Placing NLA strips")
-            for i, cue_frames in enumerate(b.cue_iter()):
-                # print(b.cue_index)
-                wm.progress_update(i)
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug(f"Baking cue {cue_frames.cue} ({i}/{l}) ")
-                self.bctx.next_track()
-                self.bake_cue()
-
-            msg = f"Baked {l} cues to {self.strips_added} action strips"
-            self.bctx.rlog.info(msg, self.bctx.current_traceback)
-            self.report({'INFO'}, msg)
+            # The strip timing is the same for all the objects. Compute it once, then replay it on each object
+            self.plan = plan = b.placement_plan()
+            dirty = (0, 0, len(plan))
+            baked_plan = b.baked_plan if self.only_changed else None
+            if self.only_changed:
+                if not baked_plan:
+                    raise ValueError("There is no previous bake of this capture. Bake all the cues first")
+                dirty = plan.dirty_range(baked_plan)
+                if not dirty:
+                    self.report({'INFO'}, "No cue changed since the last bake")
+                    self.finished(ctx)
+                    return {'FINISHED'}
+                l = dirty[2] - dirty[0]
+            self.cues_baked = l
+            skip_objects = self.objects_to_resume_from(plan) if self.resume else set()
+            self.objects_done = list(skip_objects)
+            log.debug(f"Optimization done. Placing {l} NLA strips on {len(b.objects) - len(skip_objects)} objects")
+            self.steps = self.bake_steps(plan, baked_plan, dirty, skip_objects)
+            self.steps_total = (dirty[2] - dirty[0]) * (len(b.objects) - len(skip_objects))
+            if self.background:
+                return self.start_background(ctx)
+            ctx.window_manager.progress_begin(0, len(plan) * len(b.objects))
+            for _ in self.steps:
+                pass
+            self.bake_done()
         except Exception as e:
             self.report({'ERROR'}, str(e))
             log.exception(e)
             self.bctx.rlog.error(str(e), self.bctx.current_traceback)
+            self.finished(ctx)
             return {'CANCELLED'}
-        finally:
-            del self.bctx
-            ui_utils.redraw_3dviews(ctx)
+        self.finished(ctx)
+        return {'FINISHED'}
+
+    def objects_to_resume_from(self, plan: PlacementPlan) -> set[str]:
+        """Names of the objects already baked by the interrupted bake"""
+        interrupted = self.bctx.interrupted_bake
+        if not interrupted:
+            raise ValueError("There is no interrupted bake of this capture")
+        if interrupted.get("plan") != self.plan_key(plan):
+            raise ValueError("The cues or the strip placement settings changed since the bake got interrupted. Bake again")
+        return set(interrupted.get("objects", []))
+
+    def plan_key(self, plan: PlacementPlan) -> str:
+        return PlacementPlan.cache_key(self.bctx.cue_processor, plan.blend_inout_ratio, plan.inout_blend_type)
+
+    def bake_done(self) -> None:
+        b = self.bctx
+        b.baked_plan = self.plan
+        b.interrupted_bake = None
+        msg = f"Baked {self.cues_baked} cues to {self.strips_added} action strips"
+        b.rlog.info(msg, b.current_traceback)
+        self.report({'INFO'}, msg)
+
+    def bake_interrupted(self, reason: str) -> None:
+        """Removes the strips of the not finished object. The finished ones are kept and the bake can be resumed later"""
+        b = self.bctx
+        self.rollback_object()
+        b.interrupted_bake = {"plan": self.plan_key(self.plan), "objects": self.objects_done}
+        b.rlog.warning(f"{reason}. Baked {len(self.objects_done)} of {len(b.objects)} objects, the bake can be resumed", b.current_traceback)
+
+    def start_background(self, ctx: Context) -> ui_utils.OperatorReturnSet:
+        self.steps_done = 0
+        self.bctx.rlog.progress = 0
+        wm = ctx.window_manager
+        wm.modal_handler_add(self)
+        self.timer = wm.event_timer_add(0.01, window=ctx.window)
+        BakeToNLA.last_op = self  # type: ignore
+        self.report({'INFO'}, "Baking in the background. Press ESC to cancel")
+        return {'RUNNING_MODAL'}
 
+    # Events passed to Blender while baking in the background. Only the view navigation, the scene can't be changed in the middle of the bake
+    navigation_events = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MOUSEMOVE', 'TRACKPADPAN', 'TRACKPADZOOM', 'NDOF_MOTION'}
+
+    def modal(self, ctx: Context, event: bpy.types.Event) -> set[str]:
+        b = self.bctx
+        b.ctx = ctx  # The context of the `execute` is not valid anymore
+        if event and event.type == 'ESC':
+            self.bake_interrupted("Bake cancelled")
+            self.report({'WARNING'}, "Bake cancelled")
+            self.finished(ctx)
+            return {'CANCELLED'}
+        if event and event.type != 'TIMER':
+            return {'PASS_THROUGH'} if event.type in BakeToNLA.navigation_events else {'RUNNING_MODAL'}
+        deadline = time.perf_counter() + BakeToNLA.slice_seconds
+        try:
+            for _ in self.steps:
+                self.steps_done += 1
+                if time.perf_counter() >= deadline:
+                    b.rlog.progress = min(99, int(100 * self.steps_done / max(1, self.steps_total)))
+                    ui_utils.redraw_3dviews(ctx)
+                    return {'RUNNING_MODAL'}
+            self.bake_done()
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            log.exception(e)
+            b.rlog.error(str(e), b.current_traceback)
+            self.bake_interrupted("Bake failed")
+            self.finished(ctx)
+            return {'CANCELLED'}
+        self.finished(ctx)
         return {'FINISHED'}
 
+    def finished(self, ctx: Context) -> None:
+        wm = ctx.window_manager
+        if getattr(self, "timer", None):
+            wm.event_timer_remove(self.timer)
+            del self.timer
+            BakeToNLA.last_op = None
+        else:
+            wm.progress_end()
+        self.bctx.rlog.progress = -1
+        del self.bctx
+        self.steps = None
+        ui_utils.redraw_3dviews(ctx)
+
     def draw_error_inbox(self, l: UILayout, text: str) -> None:
         ui_utils.draw_error(l, text, False)
 
@@ -481,7 +680,7 @@ class BakeToNLA(bpy.types.Operator):
             return
         box = None
         for o in b.object_iter():
-            errs = b.validate_current_object()
+            errs = b.validate_current_object_cached()
 
             if not errs:
                 continue
@@ -507,5 +706,111 @@ class BakeToNLA(bpy.types.Operator):
         if self.bctx.cue_processor.the_last_cue:
             row.label(text=f"End frame: {self.bctx.cue_processor.the_last_cue.end_frame_str}")
         layout.prop(self.bctx.mprefs, "object_selection_filter_type", text="Objects to bake")  # type: ignore
+        layout.prop(self, "strip_write_mode")  # type: ignore
+        row = layout.row()
+        row.enabled = not self.only_changed  # Only changed cues are always baked right away
+        row.prop(self, "background")  # type: ignore
         self.draw_info()
         self.draw_validation()
+
+
+class BakeToKeyframes(bpy.types.Operator):
+    """Bake the selected objects directly to keyframes of a single Action, without creating any NLA strips"""
+
+    bl_idname = "rhubarb.bake_to_keyframes"
+    bl_label = "Bake to Keyframes"
+    bl_options = {'UNDO'}
+
+    frame_step: FloatProperty(  # type: ignore
+        name="Frame step",
+        description="Distance between the baked keyframes. Lower values follow the blending more precisely but create more keyframes",
+        default=1,
+        min=0.1,
+        max=10,
+    )
+
+    @classmethod
+    def disabled_reason(cls, context: Context) -> str:
+        return BakeToNLA.disabled_reason(context)
+
+    @classmethod
+    def poll(cls, context: Context) -> bool:
+        return ui_utils.validation_poll(cls, context)
+
+    def invoke(self, context: Context, event: bpy.types.Event) -> set:
+        rll: ResultLogListProperties = CaptureListProperties.from_context(context).last_resut_log
+        rll.clear()
+        baking_utils.BakingContext(context).migrate_obj_mapping_to_slots()
+        return context.window_manager.invoke_props_dialog(self, width=320)
+
+    def bake_plan_on_object(self, plan: PlacementPlan) -> bool:
+        b = self.bctx
+        obj = b.current_object
+        sp = b.strip_placement_props
+        sources = [baking_utils.StripSource.from_mapping_item(mi) for mi in b.mprops.items]
+        strips = keyframe_baking.place_strips(plan, sources, b.action_scale, sp.inout_blend_type == "BY_RATIO")
+        if not strips:
+            b.rlog.warning(f"{obj.name} has no mapping for any of the cues. Ignoring", b.current_traceback)
+            return False
+        shape_keys = b.mprops.only_shapekeys
+        id_data = obj.data.shape_keys if shape_keys else obj
+        if not id_data:
+            b.rlog.error(f"{obj.name} has no shape keys. Ignoring", b.current_traceback)
+            return False
+        action_name = f"{obj.name}.lipsync"
+        previous = bpy.data.actions.get(action_name)  # Of the last bake, replaced
+        active = id_data.animation_data and id_data.animation_data.action
+        if active and active != previous:  # Don't lose the user's animation
+            b.rlog.error(f"{obj.name} has the Action '{active.name}' active, it would be replaced by the baked one. Ignoring", b.current_traceback)
+            return False
+        baker = keyframe_baking.KeyframeBaker(id_data, strips, blend_type=sp.strip_blend_type)
+        action = baker.bake(action_name, self.frame_step, "KEY" if shape_keys else "OBJECT")
+        if not action:
+            b.rlog.warning(f"{obj.name} has nothing to bake. Ignoring", b.current_traceback)
+            return False
+        if previous:
+            previous.user_remap(action)
+            bpy.data.actions.remove(previous)
+            action.name = action_name
+        ad = id_data.animation_data or id_data.animation_data_create()
+        ad.action = action
+        slot_keys = action_support.get_action_slot_keys(action)
+        if slot_keys:
+            action_support.set_animdata_slot_key(ad, slot_keys[0])
+        self.actions_created += 1
+        return True
+
+    def execute(self, ctx: Context) -> ui_utils.OperatorReturnSet:
+        self.bctx = baking_utils.BakingContext(ctx)
+        self.actions_created = 0
+        b = self.bctx
+        prefs = RhubarbAddonPreferences.from_context(ctx)
+        if prefs.stop_preview_mode == "AUTO":
+            bpy.ops.rhubarb.stop_all_preview()
+        wm = ctx.window_manager
+        try:
+            b.optimize_cues()
+            plan = b.placement_plan()
+            wm.progress_begin(0, len(b.objects))
+            for obj in b.object_iter():
+                start_time = time.perf_counter()
+                if self.bake_plan_on_object(plan):
+                    log.info(f"{obj.name}: baked {len(plan)} cues to keyframes in {time.perf_counter() - start_time:.3f}s")
+                wm.progress_update(b.object_index)
+
+            msg = f"Baked {len(plan)} cues to {self.actions_created} Actions"
+            b.rlog.info(msg, b.current_traceback)
+            self.report({'INFO'}, msg)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            log.exception(e)
+            b.rlog.error(str(e), b.current_traceback)
+            return {'CANCELLED'}
+        finally:
+            wm.progress_end()
+            del self.bctx
+            ui_utils.redraw_3dviews(ctx)
+        return {'FINISHED'}
+
+    def draw(self, ctx: Context) -> None:
+        self.layout.prop(self, "frame_step")  # type: ignore
@@ -1,9 +1,10 @@
+import json
 import logging
-from bisect import bisect_left
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from functools import cached_property
-from typing import Iterator, List, Optional, Tuple
+from typing import Any, ClassVar, Iterator, List, Optional, Tuple
 
 import bpy
 from bpy.types import Context, NlaStrip, NlaTrack, Object
@@ -11,7 +12,8 @@ from bpy.types import Context, NlaStrip, NlaTrack, Object
 from ..rhubarb.cue_processor import CueProcessor
 from ..rhubarb.mouth_cues import FrameConfig, MouthCueFrames, duration_scale_rate, frame2time, time2frame_float
 from ..rhubarb.mouth_shape_info import MouthShapeInfos
-from . import action_support, mapping_utils, ui_utils
+from ..rhubarb.placement_plan import PlacementPlan
+from . import action_support, mapping_utils
 from .capture_properties import CaptureListProperties, CaptureProperties, MouthCueList, MouthCueListItem, ResultLogListProperties
 from .mapping_properties import MappingItem, MappingProperties, NlaTrackRef
 from .mapping_utils import objects_with_mapping
@@ -22,32 +24,68 @@ log = logging.getLogger(__name__)
 
 
 def find_strip_at(track: NlaTrack, at_frame: float) -> tuple[int, NlaStrip]:
-    """Finds the strip at the given frame. Effectively utilizing the fact the strips are always ordered and can't overlap"""
+    """Finds the strip at the given frame. Effectively utilizing the fact the strips are always ordered and can't overlap.
+    Reads all the strip ranges of the track. Use the `StripIndex` for repeated lookups on the same track"""
     if not track or not track.strips:
         return -1, None
-    # index = bisect_left(track.strips, at_frame, key=lambda strip: strip.frame_start)
-    frame_starts = [strip.frame_start for strip in track.strips]  # Old python
-    index = bisect_left(frame_starts, at_frame)
-
-    if index > 0:  # After the first
-        index -= 1
-    assert len(track.strips) > index >= 0
-    strip = track.strips[index]
-    # strip is now the one which starts just before (or at) the `at_frame`
-    if at_frame < strip.frame_start or at_frame >= strip.frame_end:
-        return -1, None  # But it ends/start before/after the `at_frame` (frame_end is exclusive/opened interval)
-    return index, strip
+    return StripIndex(track).find_at(at_frame)
 
 
 def trim_strip_end_at(track: NlaTrack, at_frame: float) -> bool:
     """Finds if there is a strip on the provided `track` at the given `at_frame` frame.
     If so it would trim the strip end up to the `at_frame` point.
     """
-    _, strip = find_strip_at(track, at_frame)
-    if not strip:
-        return False  # No matching strip found, no op
-    strip.frame_end = at_frame  # Trim the end
-    return True
+    return StripIndex(track).trim_end_at(at_frame)
+
+
+class StripIndex:
+    """Frame ranges of the strips on a single track kept in plain python lists. The strips are ordered and can't overlap,
+    so the strip at a frame is found by a binary search without touching the (slow) RNA api.
+    The index has to be updated (`add`, `trim_end_at`) on every change made to the track while it is in use."""
+
+    def __init__(self, track: NlaTrack) -> None:
+        self.track = track
+        self.strips: list[NlaStrip] = list(track.strips) if track else []
+        self.starts: list[float] = [s.frame_start for s in self.strips]
+        self.ends: list[float] = [s.frame_end for s in self.strips]
+
+    def __len__(self) -> int:
+        return len(self.strips)
+
+    def find_at(self, at_frame: float) -> tuple[int, NlaStrip]:
+        """Index and the strip at the given frame. Or (-1, None) when there is no strip there"""
+        if not self.strips:
+            return -1, None
+        index = bisect_left(self.starts, at_frame)
+        if index > 0:  # After the first
+            index -= 1
+        # The strip which starts just before (or at) the `at_frame`
+        if at_frame < self.starts[index] or at_frame >= self.ends[index]:
+            return -1, None  # But it ends/start before/after the `at_frame` (frame_end is exclusive/opened interval)
+        return index, self.strips[index]
+
+    def trim_end_at(self, at_frame: float) -> bool:
+        """Trims the end of the strip at the given frame (if any) up to the `at_frame`"""
+        index, strip = self.find_at(at_frame)
+        if not strip:
+            return False  # No matching strip found, no op
+        strip.frame_end = at_frame  # Trim the end
+        self.ends[index] = strip.frame_end  # Read back, Blender could have adjusted the value
+        return True
+
+    def add(self, strip: NlaStrip) -> None:
+        """Registers a newly created strip. Should be called once the final strip frame range is set"""
+        start = strip.frame_start
+        index = bisect_left(self.starts, start)  # Typically the bake appends at the end
+        self.starts.insert(index, start)
+        self.ends.insert(index, strip.frame_end)
+        self.strips.insert(index, strip)
+
+    def count_in_range(self, start: float, end: float) -> int:
+        """Number of strips overlapping the closed frame range. The strips can't overlap, so the ends are ordered too"""
+        first = bisect_left(self.ends, start)  # The first strip not ending before the `start`
+        last = bisect_right(self.starts, end)  # After the last strip not starting after the `end`
+        return max(0, last - first)
 
 
 def strips_on_track(track: NlaTrack, start: int, end: int) -> Iterator[NlaStrip]:
@@ -60,6 +98,96 @@ def strips_on_track(track: NlaTrack, start: int, end: int) -> Iterator[NlaStrip]
         yield s
 
 
+@dataclass
+class StripSource:
+    """Values of a mapping item needed for each strip created from it. Read once per baked object instead of once per strip"""
+
+    action: Optional[bpy.types.Action]
+    slot: Optional[Any]  # ActionSlot, since Blender 4.4
+    custom_frame_range: Optional[tuple[float, float]]
+    length_frames: float
+
+    @staticmethod
+    def from_mapping_item(mi: MappingItem) -> "StripSource":
+        if not mi.action:
+            return StripSource(None, None, None, 0)
+        start, end = mi.frame_range
+        custom = (mi.frame_start, mi.frame_end) if mi.custom_frame_ranage else None
+        return StripSource(mi.action, mi.slot, custom, end - start)
+
+
+class BulkStripWriter:
+    """Collects the attribute values of the strips placed on a track and writes them all at once, with a single `foreach_set`
+    per attribute. Instead of setting each attribute of each strip separately through the RNA"""
+
+    def __init__(self, track: NlaTrack) -> None:
+        self.track = track
+        self.pending: list[tuple[NlaStrip, dict[str, Any]]] = []
+
+    def add(self, strip: NlaStrip, **values: Any) -> None:
+        self.pending.append((strip, values))
+
+    enum_values: dict[tuple[str, str], int] = {}
+
+    @staticmethod
+    def raw_value(attr: str, value: Any) -> Any:
+        if not isinstance(value, str):
+            return value
+        # Enums are written as their int values
+        key = (attr, value)
+        ret = BulkStripWriter.enum_values.get(key)
+        if ret is None:
+            ret = NlaStrip.bl_rna.properties[attr].enum_items[value].value
+            BulkStripWriter.enum_values[key] = ret
+        return ret
+
+    def flush(self) -> int:
+        """Writes the collected values. Returns the number of strips updated"""
+        if not self.pending:
+            return 0
+        strips = self.track.strips
+        # The collection covers all the strips of the track (not only the new ones), find where the new strips are
+        position = {s.as_pointer(): i for i, s in enumerate(strips)}
+        attrs: dict[str, None] = {}  # Keep the order the attributes were provided in
+        for _, values in self.pending:
+            attrs.update(dict.fromkeys(values))
+        for attr in attrs:
+            buf = [0.0] * len(strips)
+            strips.foreach_get(attr, buf)
+            for strip, values in self.pending:
+                if attr in values:
+                    buf[position[strip.as_pointer()]] = BulkStripWriter.raw_value(attr, values[attr])
+            strips.foreach_set(attr, buf)
+        count = len(self.pending)
+        self.pending = []
+        return count
+
+
+class ValidationCache:
+    """Validation errors of the Objects, so the bake dialog doesn't validate all the mappings and tracks on every redraw.
+    Any depsgraph update (Object, mapping, Action, NLA track or Capture change) or undo drops all the results (see the `DepsgraphHandler`).
+    The settings which don't generate a depsgraph update (preferences, current frame) and the revisions of the mapping and of the cues are part of the key"""
+
+    # (Object session_uid, Capture, settings, revisions) -> errors
+    results: ClassVar[dict[tuple, list[str]]] = {}
+    # Track pointer -> index of its strips
+    strip_indexes: ClassVar[dict[int, StripIndex]] = {}
+
+    @staticmethod
+    def strip_index(track: NlaTrack) -> StripIndex:
+        """Strip index of the track, rebuilt when the number of the strips changes (a strip added or removed without any depsgraph update yet)"""
+        key = track.as_pointer()
+        index = ValidationCache.strip_indexes.get(key)
+        if index is None or len(index) != len(track.strips):
+            index = ValidationCache.strip_indexes[key] = StripIndex(track)
+        return index
+
+    @staticmethod
+    def invalidate() -> None:
+        ValidationCache.results.clear()
+        ValidationCache.strip_indexes.clear()
+
+
 @dataclass
 class BakingContext:
     """Ease navigation and iteration over various stuff needed for baking"""
@@ -70,6 +198,7 @@ class BakingContext:
     object_index: int = -1
     track_index: int = 0
     last_object_selection_type: str = ""
+    _strip_indexes: dict[int, StripIndex] = field(default_factory=dict)
 
     # def __post_init__(self) -> None:
     #     self.clear_obj_cache()
@@ -178,7 +307,10 @@ class BakingContext:
 
     @cached_property
     def cue_processor(self) -> CueProcessor:
-        cfs = [MouthCueFrames(ci.cue, self.frame_cfg) for ci in self.mouth_cue_items]
+        if self.cprops and self.cprops.cue_list:
+            cfs = self.cprops.cue_list.cue_table(self.frame_cfg).to_cue_frames()  # Read by the foreach_get
+        else:
+            cfs = []
         return CueProcessor(self.frame_cfg, cfs, use_extended_shapes=self.prefs.use_extended_shapes)
 
     def cue_iter(self) -> Iterator[MouthCueFrames]:
@@ -223,6 +355,35 @@ class BakingContext:
         if res:
             self.rlog.info(f"Optimization result: {res}")
 
+    def placement_plan(self) -> PlacementPlan:
+        """Strip timing of the (already optimized) cues. Reused when the same cues are baked again with the same settings"""
+        sp = self.strip_placement_props
+        return PlacementPlan.cached(self.cue_processor, sp.blend_inout_ratio, sp.inout_blend_type)
+
+    @property
+    def baked_plan(self) -> Optional[PlacementPlan]:
+        """Placement plan of the last bake of the current capture. Or None when there was no bake (or the strips were removed since)"""
+        if not self.cprops or not self.cprops.baked_plan:
+            return None
+        return PlacementPlan.from_json(json.loads(self.cprops.baked_plan))
+
+    @baked_plan.setter
+    def baked_plan(self, plan: Optional[PlacementPlan]) -> None:
+        if self.cprops:
+            self.cprops.baked_plan = json.dumps(plan.to_json()) if plan else ""
+
+    @property
+    def interrupted_bake(self) -> Optional[dict[str, Any]]:
+        """State of the cancelled (or failed) bake of the current capture. The plan key and the names of the objects finished"""
+        if not self.cprops or not self.cprops.interrupted_bake:
+            return None
+        return json.loads(self.cprops.interrupted_bake)
+
+    @interrupted_bake.setter
+    def interrupted_bake(self, state: Optional[dict[str, Any]]) -> None:
+        if self.cprops:
+            self.cprops.interrupted_bake = json.dumps(state) if state else ""
+
     @cached_property
     def total_frame_range(self) -> Optional[tuple[int, int]]:
         """Frame range of the final output after all the Actions are placed"""
@@ -269,11 +430,15 @@ class BakingContext:
 
     def current_mapping_action_scale(self, desired_len_frames: float, scale_min: float = -1, scale_max: float = -1) -> float:
         """Scale factor to use on the strip, so it's length matches the current mapping item action's length."""
+        return self.action_scale(self.current_mapping_action_length_frames, desired_len_frames, scale_min, scale_max)
+
+    def action_scale(self, action_len_frames: float, desired_len_frames: float, scale_min: float = -1, scale_max: float = -1) -> float:
+        """Scale factor to use on the strip, so the action of the `action_len_frames` length fits the desired length"""
         if scale_min < 0:
             scale_min = self.strip_placement_props.scale_min
         if scale_max < 0:
             scale_max = self.strip_placement_props.scale_max
-        l = self.current_mapping_action_length_frames
+        l = action_len_frames
         if l <= 1:  # No mapping item selected or the action has no frames or the action only has single frame
             return 1
         return duration_scale_rate(l, desired_len_frames, scale_min, scale_max)
@@ -321,6 +486,20 @@ class BakingContext:
             return None
         return self.track_pair[self.track_index % 2]
 
+    def strip_index(self, track: NlaTrack) -> StripIndex:
+        """Strip index of the track. Built on the first access and then kept (and updated by the bake) for the whole context life"""
+        key = track.as_pointer()
+        index = self._strip_indexes.get(key)
+        if index is None:
+            index = StripIndex(track)
+            self._strip_indexes[key] = index
+        return index
+
+    @property
+    def current_strip_index(self) -> Optional[StripIndex]:
+        t = self.current_track
+        return t and self.strip_index(t)
+
     def next_track(self) -> Optional[NlaTrack]:
         """Alternates between non-null track_pair. If only one track is non-null it would always be the current track"""
         self.track_index = (self.track_index + 1) % 2
@@ -341,14 +520,15 @@ class BakingContext:
         ret: list[str] = []
         if self.track1 == self.track2:
             ret += ["Track1 and Track2 are the same"]
-        limit = 5000
         strips = 0
-        for t in self.unique_tracks:
-            strips += ui_utils.len_limited(self.strips_on_track(t), limit)
+        if self.total_frame_range is not None:
+            start, end = self.total_frame_range
+            for t in self.unique_tracks:
+                # Not the `strip_index` of the context, the strips could have been changed since it was built
+                strips += ValidationCache.strip_index(t).count_in_range(start, end)
 
         if strips > 0:
-            extra = "+" if strips >= limit else ""
-            ret += [f"Clash with {strips}{extra} existing strips. #!RemoveStrips"]
+            ret += [f"Clash with {strips} existing strips. #!RemoveStrips"]
         return ret
 
     def validate_selection(self) -> str:
@@ -415,3 +595,23 @@ class BakingContext:
         ret += self.validate_current_object_mapping()
         ret += self.validate_track()
         return ret
+
+    def validate_current_object_cached(self) -> list[str]:
+        """Same as the `validate_current_object`, but the errors are reused until something relevant changes"""
+        o = self.current_object
+        mprops = self.mprops
+        cue_list = self.cprops and self.cprops.cue_list
+        # Only an Action with a custom frame range is considered active (or not) based on the current frame
+        frame_dependent = bool(mprops) and any(mi.custom_frame_ranage for mi in mprops.items)
+        key = (
+            o.session_uid if o else 0,
+            self.cprops.as_pointer() if self.cprops else 0,
+            self.prefs.use_extended_shapes,
+            mprops.revision if mprops else -1,
+            cue_list.revision if cue_list else -1,
+            self.ctx.scene.frame_current if frame_dependent else None,
+        )
+        ret = ValidationCache.results.get(key)
+        if ret is None:
+            ret = ValidationCache.results[key] = self.validate_current_object()
+        return ret
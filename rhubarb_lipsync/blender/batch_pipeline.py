@@ -0,0 +1,312 @@
+import json
+import logging
+import pathlib
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, Optional
+
+import bpy
+from bpy.props import StringProperty
+from bpy.types import Context, NlaTrack, Object
+
+from ..rhubarb.rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandPool
+from . import ui_utils
+from .capture_properties import CaptureListProperties, CaptureProperties, MouthCueList
+from .mapping_properties import MappingItem, MappingProperties, NlaTrackRef
+from .preferences import RhubarbAddonPreferences
+from .rhubarb_operators import find_dialog_file
+
+log = logging.getLogger(__name__)
+
+sound_file_suffixes = (".ogg", ".wav")
+
+
+@contextmanager
+def timed(timings: dict[str, float], stage: str) -> Iterator[None]:
+    """Adds the wall-clock time (seconds) of the with-block to the `stage` entry of the timings"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+@dataclass
+class TakeReport:
+    """Outcome of a single sound file processed by the pipeline"""
+
+    name: str
+    sound_file: str
+    status: str = "Pending"
+    error: str = ""
+    cues: int = 0
+    strips: int = 0
+    outputs: dict[str, str] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def fail(self, error: str) -> None:
+        self.status = "Failed"
+        self.error = error
+        log.error(f"Take {self.name} failed: {error}")
+
+
+@dataclass
+class PipelineReport:
+    """Machine-readable outcome of the whole run. Saved as json next to the outputs"""
+
+    sound_folder: str
+    output_folder: str
+    target_object: str
+    takes: list[TakeReport] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def failed_count(self) -> int:
+        return sum(1 for t in self.takes if t.status != "Done")
+
+    def to_json(self) -> str:
+        d = asdict(self)
+        d["failed"] = self.failed_count
+        return json.dumps(d, indent=2)
+
+
+def load_mapping_preset(mprops: MappingProperties, obj: Object, preset_path: pathlib.Path) -> list[str]:
+    """Maps the cue keys to Actions listed in a json preset file. Returns the keys whose Action was not found.
+    The preset maps the cue key either to an Action name or to an object with the mapping item details:
+    `{"A": "Mouth_A", "B": {"action": "Mouth_sheet", "slot": "OBMouth", "frame_start": 10, "frame_count": 5}}`"""
+    preset: dict = json.loads(preset_path.read_text(encoding="utf-8"))
+    mprops.build_items(obj)
+    missing: list[str] = []
+    for _item in mprops.items:
+        mi: MappingItem = _item
+        entry = preset.get(mi.key)
+        if entry is None:
+            continue
+        if isinstance(entry, str):
+            entry = {"action": entry}
+        action = bpy.data.actions.get(entry.get("action", ""))
+        if not action:
+            missing.append(mi.key)
+            continue
+        mi.action = action
+        if "frame_start" in entry or "frame_count" in entry:
+            mi.custom_frame_ranage = True
+            mi.frame_start = entry.get("frame_start", mi.frame_start)
+            mi.frame_count = entry.get("frame_count", mi.frame_count)
+        if entry.get("slot"):
+            mi.slot_key = entry["slot"]
+        else:
+            mi.migrate_to_slots()
+    return missing
+
+
+class BatchPipeline:
+    """Captures all the sound files of a folder and bakes each of them to the NLA tracks of the target object.
+    Runs blocking, meant for the background (no UI) mode. The sounds are captured in parallel by a process pool,
+    each take is baked as soon as its capture finishes. For each take the cues are exported to a json file (rhubarb-cli format)
+    and a copy of the .blend file is saved with the take baked on the NLA tracks."""
+
+    def __init__(self, ctx: Context, sound_folder: pathlib.Path, output_folder: pathlib.Path, target: Object) -> None:
+        self.ctx = ctx
+        self.sound_folder = sound_folder
+        self.output_folder = output_folder
+        self.target = target
+        self.report = PipelineReport(str(sound_folder), str(output_folder), target.name)
+        self.capture_indices: dict[int, int] = {}  # Take index => capture index
+
+    @property
+    def prefs(self) -> RhubarbAddonPreferences:
+        return RhubarbAddonPreferences.from_context(self.ctx)
+
+    @property
+    def clist_props(self) -> CaptureListProperties:
+        return CaptureListProperties.from_context(self.ctx)
+
+    @property
+    def mprops(self) -> MappingProperties:
+        return MappingProperties.from_object(self.target)
+
+    def discover(self) -> list[pathlib.Path]:
+        return sorted(p for p in self.sound_folder.iterdir() if p.is_file() and p.suffix.lower() in sound_file_suffixes)
+
+    def ensure_capture(self, sound_path: pathlib.Path) -> int:
+        """Index of the capture of the sound file. Reuses an existing capture of the same file, so re-running the pipeline doesn't pile up captures"""
+        rootProps = self.clist_props
+        for i, _props in enumerate(rootProps.items):
+            props: CaptureProperties = _props
+            if props.sound and pathlib.Path(ui_utils.to_abs_path(props.sound.filepath)) == sound_path:
+                return i
+        rootProps.items.add()
+        rootProps.index = len(rootProps.items) - 1
+        rootProps.selected_item.sound = bpy.data.sounds.load(str(sound_path), check_existing=True)
+        return rootProps.index
+
+    def ensure_tracks(self) -> None:
+        """Creates the two NLA tracks on the target when there are none selected in the mapping"""
+        if self.mprops.has_NLA_track_selected:
+            return
+        for i in (1, 2):
+            ui_utils.assert_op_ret(bpy.ops.rhubarb.new_nla_track(name=f"RLPS Track {i}", track_field_name=f"nla_track{i}"))
+
+    @property
+    def tracks(self) -> list[NlaTrack]:
+        refs: list[NlaTrackRef] = [self.mprops.nla_track1, self.mprops.nla_track2]
+        return list({id(t): t for t in (r.selected_item for r in refs) if t}.values())
+
+    def capture(self, pool: RhubarbCommandPool[int], take_index: int, sound_path: pathlib.Path) -> None:
+        capture_index = self.ensure_capture(sound_path)
+        self.capture_indices[take_index] = capture_index
+        props: CaptureProperties = self.clist_props.items[capture_index]
+        props.cue_list.clear()
+        job = RhubarbCommandAsyncJob(self.prefs.new_command_handler())
+        pool.submit(take_index, job, str(sound_path), find_dialog_file(props, str(sound_path)))
+
+    def capture_finished(self, pool: RhubarbCommandPool[int], take_index: int) -> None:
+        take = self.report.takes[take_index]
+        job = pool.jobs[take_index]
+        if job.failed:
+            take.fail(str(job.last_exception or f"Rhubarb exited with the code {job.cmd.last_exit_code}"))
+            return
+        cues = job.get_lipsync_output_cues()
+        props: CaptureProperties = self.clist_props.items[self.capture_indices[take_index]]
+        lst: MouthCueList = props.cue_list
+        lst.add_cues(cues)
+        take.cues = len(cues)
+        try:
+            self.bake(take_index)
+            self.save_outputs(take_index)
+        except Exception as e:
+            log.exception(e)
+            take.fail(str(e))
+            return
+        take.status = "Done"
+
+    def bake(self, take_index: int) -> None:
+        """Bakes the take on the NLA tracks of the target. The tracks are cleared first so they only contain the current take.
+        Note the cues optimization (trimming, merging of the double X) is part of the bake operator."""
+        take = self.report.takes[take_index]
+        with timed(take.timings, "bake"):
+            self.clist_props.index = self.capture_indices[take_index]
+            for t in self.tracks:
+                for strip in list(t.strips):
+                    t.strips.remove(strip)
+            rlog = self.clist_props.last_resut_log
+            rlog.clear()
+            ret = bpy.ops.rhubarb.bake_to_nla()
+            errors = [e.msg for e in rlog.errors]
+            if 'FINISHED' not in ret or errors:
+                raise RuntimeError(f"Bake failed: {'; '.join(errors) or ret}")
+            take.strips = sum(len(t.strips) for t in self.tracks)
+
+    def save_outputs(self, take_index: int) -> None:
+        take = self.report.takes[take_index]
+        json_path = self.output_folder / f"{take.name}.json"
+        with timed(take.timings, "export_json"):
+            ui_utils.assert_op_ret(bpy.ops.rhubarb.export_cue_list2json(filepath=str(json_path)))
+        take.outputs["json"] = str(json_path)
+        blend_path = self.output_folder / f"{take.name}.blend"
+        with timed(take.timings, "save_blend"):
+            # Save as copy, the current file (path) stays unchanged and is used for the next take
+            ui_utils.assert_op_ret(bpy.ops.wm.save_as_mainfile(filepath=str(blend_path), copy=True))
+        take.outputs["blend"] = str(blend_path)
+
+    def run(self) -> PipelineReport:
+        timings = self.report.timings
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        mprefs = self.prefs.mapping_prefs
+        orig_filter = mprefs.object_selection_filter_type
+        self.ctx.view_layer.objects.active = self.target
+        mprefs.object_selection_filter_type = "Active"  # Bake only on the target
+        try:
+            with timed(timings, "total"):
+                with timed(timings, "discover"):
+                    sound_paths = self.discover()
+                log.info(f"Found {len(sound_paths)} sound files in {self.sound_folder}")
+                self.ensure_tracks()
+                self.run_captures(sound_paths)
+        finally:
+            mprefs.object_selection_filter_type = orig_filter
+        return self.report
+
+    def run_captures(self, sound_paths: list[pathlib.Path]) -> None:
+        timings = self.report.timings
+        pool: RhubarbCommandPool[int] = RhubarbCommandPool(self.prefs.capture_concurrency)
+        started: dict[int, float] = {}
+        for p in sound_paths:
+            self.report.takes.append(TakeReport(p.stem, str(p)))
+            self.capture(pool, len(self.report.takes) - 1, p)
+        start = time.perf_counter()
+        pool.start_pending()
+        while not pool.has_finished:
+            now = time.perf_counter()
+            for key in pool.running:
+                started.setdefault(key, now)
+            for key in pool.check_progress():
+                take = self.report.takes[key]
+                take.timings["capture"] = time.perf_counter() - started.get(key, now)
+                bake_start = time.perf_counter()
+                self.capture_finished(pool, key)
+                timings["bake_and_save"] = timings.get("bake_and_save", 0.0) + time.perf_counter() - bake_start
+            time.sleep(0.05)
+        timings["capture"] = time.perf_counter() - start - timings.get("bake_and_save", 0.0)
+
+
+class RunBatchPipeline(bpy.types.Operator):
+    """Capture all the sound files of a folder and bake each one to the NLA tracks of the target object.
+    Saves the cues (json) and the baked .blend file per sound and a json report. Blocks until done, meant for the background mode"""
+
+    bl_idname = "rhubarb.run_batch_pipeline"
+    bl_label = "Batch capture and bake"
+
+    sound_folder: StringProperty(name="Sound folder", subtype='DIR_PATH')  # type: ignore
+    output_folder: StringProperty(name="Output folder", subtype='DIR_PATH')  # type: ignore
+    target_object: StringProperty(name="Target object", description="Object with the mapping to bake the cues on")  # type: ignore
+    mapping_preset: StringProperty(  # type: ignore
+        name="Mapping preset",
+        description="Optional json file mapping the cue keys to Action names. Otherwise the existing mapping of the target object is used",
+        subtype='FILE_PATH',
+    )
+    report_file: StringProperty(name="Report file", description="Where to save the json report. Defaults to report.json in the output folder")  # type: ignore
+
+    last_report: Optional[PipelineReport] = None  # For the command line and tests
+
+    def validate(self, context: Context) -> str:
+        if not self.sound_folder or not pathlib.Path(self.sound_folder).is_dir():
+            return f"The sound folder '{self.sound_folder}' doesn't exist"
+        if not self.output_folder:
+            return "No output folder"
+        obj = bpy.data.objects.get(self.target_object)
+        if not obj:
+            return f"Object '{self.target_object}' not found"
+        if context.scene.objects.get(obj.name) is None:
+            return f"Object '{self.target_object}' is not in the current scene"
+        if self.mapping_preset and not pathlib.Path(self.mapping_preset).is_file():
+            return f"The mapping preset '{self.mapping_preset}' doesn't exist"
+        return ""
+
+    def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
+        RunBatchPipeline.last_report = None
+        error = self.validate(context)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        obj = bpy.data.objects[self.target_object]
+        mprops = MappingProperties.from_object(obj)
+        if self.mapping_preset:
+            missing = load_mapping_preset(mprops, obj, pathlib.Path(self.mapping_preset))
+            if missing:
+                self.report({'WARNING'}, f"Actions not found for the cues: {' '.join(missing)}")
+        if not mprops.has_any_mapping:
+            self.report({'ERROR'}, f"Object '{obj.name}' has no mapping")
+            return {'CANCELLED'}
+
+        output = pathlib.Path(self.output_folder)
+        pipeline = BatchPipeline(context, pathlib.Path(self.sound_folder), output, obj)
+        report = pipeline.run()
+        report_path = pathlib.Path(self.report_file) if self.report_file else output / "report.json"
+        report_path.write_text(report.to_json(), encoding="utf-8")
+        RunBatchPipeline.last_report = report
+        msg = f"Processed {len(report.takes)} sound files in {report.timings['total']:.1f}s, {report.failed_count} failed. Report: {report_path}"
+        self.report({'WARNING'} if report.failed_count else {'INFO'}, msg)
+        return {'FINISHED'}
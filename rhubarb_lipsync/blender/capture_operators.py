@@ -4,9 +4,11 @@ import bpy
 from bpy.props import StringProperty
 from bpy.types import Context
 
-from ..rhubarb.rhubarb_command import RhubarbParser
+from ..rhubarb.cue_io import CueBinary, iter_json_cues, write_json_cues
+from ..rhubarb.cue_table import CueTable
+from ..rhubarb.mouth_cues import FrameConfig
 from . import ui_utils
-from .capture_properties import CaptureListProperties, MouthCueList
+from .capture_properties import CaptureIndex, CaptureListProperties, MouthCueList
 
 log = logging.getLogger(__name__)
 
@@ -51,6 +53,7 @@ class DeleteCaptureProps(bpy.types.Operator):
     def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
         rootProps = CaptureListProperties.from_context(context)
         rootProps.items.remove(rootProps.index)
+        CaptureIndex.invalidate()
         rootProps.index = rootProps.index - 1
         rootProps.dropdown_helper(context).index2name()
         return {'FINISHED'}
@@ -84,19 +87,20 @@ class ClearCueList(bpy.types.Operator):
     def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
         props = CaptureListProperties.capture_from_context(context)
         cl: MouthCueList = props.cue_list
-        cl.items.clear()
+        cl.clear()
 
         return {'FINISHED'}
 
 
 class ExportCueList2Json(bpy.types.Operator):
-    """Export the current cue list of the selected capture to a json file following the rhubarb-cli format"""
+    """Export the current cue list of the selected capture to a json file following the rhubarb-cli format.
+    Or to the compact binary format when the file has the `.rlpscues` extension"""
 
     bl_idname = "rhubarb.export_cue_list2json"
     bl_label = "Export to JSON"
 
     filepath: StringProperty(subtype="FILE_PATH")  # type: ignore
-    filter_glob: StringProperty(default='*.json;', options={'HIDDEN'})  # type: ignore
+    filter_glob: StringProperty(default=f'*.json;*{CueBinary.file_suffix}', options={'HIDDEN'})  # type: ignore
 
     @classmethod
     def disabled_reason(cls, context: Context) -> str:
@@ -122,25 +126,27 @@ class ExportCueList2Json(bpy.types.Operator):
     def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
         cprops = CaptureListProperties.capture_from_context(context)
         cl: MouthCueList = cprops.cue_list
-        cues = [c.cue for c in cl.items]
-        json = RhubarbParser.unparse_mouth_cues(cues, f"{cprops.sound_file_basename}.{cprops.sound_file_extension}")
-        log.debug(f"Saving {len(json)} char to {self.filepath} ")
-        with open(self.filepath, 'w', encoding='utf-8') as file:
-            file.write(json)
-        self.report(type={"INFO"}, message=f"Exported {len(cues)} to {self.filepath}")
+        table = cl.cue_table(FrameConfig(1))  # Read by the foreach_get, no per-item access
+        if CueBinary.is_binary_path(self.filepath):
+            CueBinary.write_table(self.filepath, table)
+        else:
+            with open(self.filepath, 'w', encoding='utf-8') as file:
+                written = write_json_cues(file, table.to_cues(), f"{cprops.sound_file_basename}.{cprops.sound_file_extension}")
+            log.debug(f"Saved {written} char to {self.filepath} ")
+        self.report(type={"INFO"}, message=f"Exported {len(table)} to {self.filepath}")
         # cl: MouthCueList = props.cue_list
 
         return {'FINISHED'}
 
 
 class ImportJsonCueList(bpy.types.Operator):
-    """Import json file in the rhubarb-cli format"""
+    """Import json file in the rhubarb-cli format. Or a binary cue file (`.rlpscues` extension)"""
 
     bl_idname = "rhubarb.import_json_cue_list"
     bl_label = "Import from JSON"
 
     filepath: StringProperty(subtype="FILE_PATH")  # type: ignore
-    filter_glob: StringProperty(default='*.json;', options={'HIDDEN'})  # type: ignore
+    filter_glob: StringProperty(default=f'*.json;*{CueBinary.file_suffix}', options={'HIDDEN'})  # type: ignore
 
     @classmethod
     def disabled_reason(cls, context: Context) -> str:
@@ -164,17 +170,22 @@ class ImportJsonCueList(bpy.types.Operator):
         if not (self.filepath):
             return {'CANCELLED'}
 
-        with open(self.filepath, 'r', encoding='utf-8') as file:
-            json = file.read()
-        log.debug(f"Parsing {len(json)} char from {self.filepath} ")
-        json_parsed = RhubarbParser.parse_lipsync_json(json)
-        cues = RhubarbParser.lipsync_json2MouthCues(json_parsed)
-        log.debug(f"Parsed {len(cues)} adding them to the uilist")
+        try:
+            if CueBinary.is_binary_path(self.filepath):
+                keys, starts, ends = CueBinary.read_columns(self.filepath)
+            else:
+                with open(self.filepath, 'r', encoding='utf-8') as file:
+                    table = CueTable.from_cues(FrameConfig(1), list(iter_json_cues(file)))
+                keys, starts, ends = table.keys, table.starts, table.ends
+        except ValueError as e:  # Including the json.JSONDecodeError
+            self.report({"ERROR"}, f"Failed to parse {self.filepath}: {e}")
+            return {'CANCELLED'}
+        log.debug(f"Parsed {len(keys)} adding them to the uilist")
         cprops = CaptureListProperties.capture_from_context(context)
         cl: MouthCueList = cprops.cue_list
-        cl.add_cues(cues)
+        cl.add_cue_columns(keys, starts, ends)
 
-        self.report(type={"INFO"}, message=f"Imported {len(cues)} from {self.filepath}")
+        self.report(type={"INFO"}, message=f"Imported {len(keys)} from {self.filepath}")
         # cl: MouthCueList = props.cue_list
 
         return {'FINISHED'}
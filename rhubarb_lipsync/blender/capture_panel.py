@@ -5,7 +5,6 @@ import bpy
 from bpy.types import Context, Sound
 
 from .. import IconsManager
-from ..rhubarb import mouth_cues
 from . import capture_operators, rhubarb_operators, sound_operators, ui_utils
 from .capture_properties import CaptureListProperties, JobProperties, MouthCueList, MouthCueListItem
 from .cue_uilist import MouthCueUIList
@@ -279,8 +278,8 @@ class CaptureMouthCuesPanel(bpy.types.Panel):
             # https://blender.stackexchange.com/questions/211184/how-to-tag-a-redraw-in-all-viewports
             # self.ctx.area.tag_redraw()  # Force redraw
             ui_utils.redraw_3dviews(self.ctx)
-            f = self.ctx.scene.frame_current_final
-            t = mouth_cues.frame2time(f, self.ctx.scene.render.fps, self.ctx.scene.render.fps_base)
+            props = CaptureListProperties.capture_from_context(self.ctx)
+            t = props.frame2cue_time(self.ctx, self.ctx.scene.frame_current_final)
             cue = cue_list.find_cue_by_time(t)
             if cue:  # Time resolved to a cue, show its icon
                 return IconsManager.cue_icon(cue.key)
@@ -321,6 +320,20 @@ class CaptureMouthCuesPanel(bpy.types.Panel):
         if jprops.error:
             ui_utils.draw_error(layout, jprops.error)
 
+    def draw_batch_job(self) -> None:
+        rootProps = CaptureListProperties.from_context(self.ctx)
+        bjprops: JobProperties = rootProps.batch_job
+        if bjprops.running:
+            row = self.layout.row(align=True)
+            r = row.row(align=True)
+            r.enabled = False
+            r.prop(bjprops, "progress", text=f"Batch capture {bjprops.status}", slider=True)
+            r = row.row(align=True)
+            r.enabled = not bjprops.cancel_request
+            r.prop(bjprops, "cancel_request", text="", icon="PANEL_CLOSE")
+        if bjprops.error:
+            ui_utils.draw_error(self.layout, bjprops.error)
+
     def draw_capture_toolbar(self) -> None:
         prefs = RhubarbAddonPreferences.from_context(self.ctx)
         cpref: CueListPreferences = prefs.cue_list_prefs
@@ -330,6 +343,7 @@ class CaptureMouthCuesPanel(bpy.types.Panel):
         toolRow = row.row(align=True)
         toolRow.prop(cpref, 'preview', icon="UV_SYNC_SELECT", icon_only=True)
         toolRow.prop(cpref, 'sync_on_select', icon="RESTRICT_SELECT_OFF", icon_only=True)
+        toolRow.prop(cpref, 'follow_playhead', icon="PLAY", icon_only=True)
 
         actionRow = row.row(align=True)
         actionRow.label(text="")  # Spacer to force icons alight to the right
@@ -386,6 +400,8 @@ class CaptureMouthCuesPanel(bpy.types.Panel):
                 # row.prop(rootProps, 'index', text="")
                 row.operator(capture_operators.CreateCaptureProps.bl_idname, text="", icon="DUPLICATE")
                 row.operator(capture_operators.DeleteCaptureProps.bl_idname, text="", icon="PANEL_CLOSE")
+                row.operator_menu_enum(rhubarb_operators.ProcessSoundFilesBatch.bl_idname, 'captures_filter', text="", icon="RENDER_ANIMATION")
+                self.draw_batch_job()
             else:
                 layout.operator(capture_operators.CreateCaptureProps.bl_idname, icon="DUPLICATE")
 
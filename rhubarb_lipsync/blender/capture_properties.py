@@ -1,18 +1,18 @@
-import bisect
 import logging
 import pathlib
 from contextlib import contextmanager
 from functools import cached_property
-from operator import attrgetter
-from typing import Any, Callable, Generator, Iterable, Optional
+from typing import Any, Callable, ClassVar, Generator, Iterable, Optional, Sequence
 
 import bpy
 import bpy.utils.previews
+import numpy as np
 from bpy.props import BoolProperty, CollectionProperty, EnumProperty, FloatProperty, IntProperty, PointerProperty, StringProperty
 from bpy.types import Context, PropertyGroup, Sound
 
-from ..rhubarb.mouth_cues import FrameConfig, MouthCue, MouthCueFrames, MouthShapeInfos
-from ..rhubarb.rhubarb_command import RhubarbCommandAsyncJob
+from ..rhubarb.cue_table import CueTable
+from ..rhubarb.mouth_cues import FrameConfig, MouthCue, MouthCueFrames, MouthShapeInfos, frame2time
+from ..rhubarb.rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandPool
 from . import ui_utils
 from .dropdown_helper import DropdownHelper
 from .preferences import CueListPreferences, RhubarbAddonPreferences
@@ -45,15 +45,24 @@ class MouthCueListItem(PropertyGroup):
 
     def get_key_enum(self) -> int:
         raw_val = self.get("key")
-        if isinstance(raw_val, str):
+        if isinstance(raw_val, str):  # Stored as string by the older versions
             info = MouthShapeInfos.userkey2info(raw_val)
             return MouthShapeInfos.key2index(info.key)
-        return 0  # Default to the first item if the string isn't found or is missing
+        return self.key_index
 
     def set_key_enum(self, value: int) -> None:
-        info = MouthShapeInfos.index2Info(value)
-        self["key"] = info.key
-
+        if "key" in self:
+            del self["key"]  # Drop the string stored by the older versions
+        self.key_index = value
+        cue_list = self.cue_list
+        if cue_list:
+            cue_list.touch()
+
+    key_index: IntProperty(  # type: ignore
+        name="key index",
+        description="Storage of the key. Index of the mouth shape, see the MouthShapeInfos.key2index",
+        options={'HIDDEN'},
+    )
     key: EnumProperty(  # type: ignore
         name="key",
         items=key_search,
@@ -84,12 +93,45 @@ class MouthCueListItem(PropertyGroup):
         frame_cfg = MouthCueListItem.frame_config_from_context(ctx)
         return MouthCueFrames(self.cue, frame_cfg)
 
+    @property
+    def cue_list(self) -> Optional['MouthCueList']:
+        """The list this item belongs to"""
+        path = self.path_from_id()  # For example rhubarb_lipsync_captures.items[0].cue_list.items[5]
+        i = path.rfind(".items[")
+        if i < 0:
+            return None
+        return self.id_data.path_resolve(path[:i])
+
     def set_from_cue(self, cue: MouthCue) -> None:
         self.key = cue.key
         self.start = cue.start
         self.end = cue.end
 
 
+class CueTimeIndex:
+    """Start and end times of the cues of the cue lists. So a cue can be looked-up by time (bisected) without accessing the RNA items.
+    The PropertyGroups can't keep any python state, so the times are kept here by the cue-list pointer.
+    Read at once by the `foreach_get` and rebuilt only when the list changes (the list revision or the number of cues)"""
+
+    # MouthCueList pointer -> ((revision, cue count), starts, ends)
+    times: ClassVar[dict[int, tuple[tuple[int, int], np.ndarray, np.ndarray]]] = {}
+
+    @staticmethod
+    def of(cue_list: "MouthCueList") -> tuple[np.ndarray, np.ndarray]:
+        ptr = cue_list.as_pointer()
+        key = (cue_list.revision, len(cue_list.items))
+        cached = CueTimeIndex.times.get(ptr)
+        if cached and cached[0] == key:
+            return cached[1], cached[2]
+        _, starts, ends = cue_list.cue_columns()
+        CueTimeIndex.times[ptr] = (key, starts, ends)
+        return starts, ends
+
+    @staticmethod
+    def invalidate() -> None:
+        CueTimeIndex.times.clear()
+
+
 class MouthCueList(PropertyGroup):
     """List of the captured mouth cues."""
 
@@ -100,9 +142,60 @@ class MouthCueList(PropertyGroup):
     index_changed: Callable[[PropertyGroup, Context, MouthCueListItem], None]
 
     def add_cues(self, cues: list[MouthCue]) -> None:
-        for cue in cues:
-            item: MouthCueListItem = self.items.add()
-            item.set_from_cue(cue)
+        table = CueTable.from_cues(FrameConfig(1), cues)
+        self.add_cue_columns(table.keys, table.starts, table.ends)
+
+    def add_cue_columns(self, keys: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        """Appends the cues given as the arrays of the key indexes, starts and ends.
+        The items are added first and then all the fields are written at once by the `foreach_set`.
+        The `foreach_set` can only write the whole collection, so a few cues appended to a longer list (streamed capture) are written one by one instead.
+        Either way an append costs proportionally to the number of the appended cues"""
+        count = len(keys)
+        if not count:
+            return
+        existing = len(self.items)
+        if existing > count and self.uses_key_index:  # Only the new items, writing them is cheaper than rewriting the whole collection
+            for _ in range(count):
+                self.items.add()
+            for item, k, s, e in zip(self.items[existing:], keys.tolist(), starts.tolist(), ends.tolist()):
+                item.key_index, item.start, item.end = k, s, e
+            self.touch()
+            return
+        if existing:  # The whole collection is written, so read the existing items first (converts the keys of a list of the older version too)
+            old_keys, old_starts, old_ends = self.cue_columns()
+            keys, starts, ends = np.concatenate((old_keys, keys)), np.concatenate((old_starts, starts)), np.concatenate((old_ends, ends))
+        for _ in range(count):
+            self.items.add()
+        self.items.foreach_set("key_index", np.asarray(keys, dtype=np.int32))
+        self.items.foreach_set("start", np.asarray(starts, dtype=np.float32))
+        self.items.foreach_set("end", np.asarray(ends, dtype=np.float32))
+        self.uses_key_index = True
+        self.touch()
+
+    def clear(self) -> None:
+        self.items.clear()
+        self.touch()
+
+    def touch(self) -> None:
+        """Marks the cues as changed, so the caches derived from the list are rebuilt"""
+        self.revision += 1
+
+    def cue_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Key indexes, starts and ends of all the cues. Read by the `foreach_get`, without accessing the items one by one"""
+        count = len(self.items)
+        starts = np.empty(count, dtype=np.float32)
+        ends = np.empty(count, dtype=np.float32)
+        self.items.foreach_get("start", starts)
+        self.items.foreach_get("end", ends)
+        if self.uses_key_index or not count:
+            keys = np.empty(count, dtype=np.int32)
+            self.items.foreach_get("key_index", keys)
+        else:  # Cue list of the older versions, the keys are stored as strings
+            keys = np.fromiter((MouthShapeInfos.key2index(item.key) for item in self.items), dtype=np.int32, count=count)
+        return keys.astype(np.int8), starts.astype(np.float64), ends.astype(np.float64)
+
+    def cue_table(self, frame_cfg: FrameConfig) -> CueTable:
+        return CueTable(frame_cfg, *self.cue_columns())
 
     @property
     def index_within_bounds(self) -> int:
@@ -133,11 +226,16 @@ class MouthCueList(PropertyGroup):
         return self.items[-1]
 
     def find_index_by_time(self, time: float) -> int:
-        return bisect.bisect_right(self.items, time, key=attrgetter('start'))
+        """Index of the cue at the time (the last cue starting before or at the time). Or -1 when the time is before the first cue"""
+        starts, _ = CueTimeIndex.of(self)
+        return int(np.searchsorted(starts, time, side="right")) - 1
 
     def find_cue_by_time(self, time: float) -> Optional[MouthCueListItem]:
         idx = self.find_index_by_time(time)
-        if idx < 0 or idx >= len(self.items):
+        if idx < 0:
+            return None
+        _, ends = CueTimeIndex.of(self)
+        if time >= ends[idx]:  # After the end of the last cue
             return None
         return self.items[idx]
 
@@ -155,6 +253,16 @@ class MouthCueList(PropertyGroup):
 
     index: IntProperty(name="Selected cue index", update=on_index_changed)  # type: ignore
     # index: IntProperty(name="Selected cue index")  # type: ignore
+    uses_key_index: BoolProperty(  # type: ignore
+        name="Uses key index",
+        description="All the items store the key as the key_index. The lists created by the older versions store the key as a string",
+        options={'HIDDEN'},
+    )
+    revision: IntProperty(  # type: ignore
+        name="Revision",
+        description="Incremented on every change of the cues",
+        options={'HIDDEN'},
+    )
 
 
 class JobProperties(PropertyGroup):
@@ -177,12 +285,20 @@ class JobProperties(PropertyGroup):
         else:
             self.error = f"{type(job.last_exception).__name__}\n{' '.join(job.last_exception.args)}"
 
+    def update_from_pool(self, pool: RhubarbCommandPool) -> None:
+        """Aggregate state of multiple jobs (batch capture)"""
+        self.progress = pool.progress
+        self.status = pool.status
+        failed = pool.failed_count
+        self.error = f"{failed} captures failed" if failed else ""
+
 
 class CaptureProperties(PropertyGroup):
     """Capture setup and list of captured cues"""
 
     def on_sound_update(self, ctx: Context) -> None:
         # ctx.area.tag_redraw()
+        CaptureIndex.invalidate()
         rootProps = CaptureListProperties.from_context(ctx)
         rootProps.name = self.short_desc(rootProps.index)
 
@@ -195,6 +311,7 @@ class CaptureProperties(PropertyGroup):
         return strips[0]
 
     def on_start_frame_update(self, ctx: Context) -> None:
+        CaptureIndex.invalidate()
         prefs = RhubarbAddonPreferences.from_context(ctx)
         if not prefs.sync_with_sequencer:
             return False
@@ -207,6 +324,7 @@ class CaptureProperties(PropertyGroup):
         strip.frame_start = self.start_frame
 
     def on_channel_update(self, ctx: Context) -> None:
+        CaptureIndex.invalidate()
         prefs = RhubarbAddonPreferences.from_context(ctx)
         if not prefs.sync_with_sequencer:
             return False
@@ -256,6 +374,16 @@ class CaptureProperties(PropertyGroup):
     )
     job: PointerProperty(type=JobProperties, name="Job")  # type: ignore
     cue_list: PointerProperty(type=MouthCueList, name="Cues")  # type: ignore
+    baked_plan: StringProperty(  # type: ignore
+        name="Baked plan",
+        description="Strip placement plan (json) of the last bake. Records which baked strips belong to which cue",
+        options={'HIDDEN'},
+    )
+    interrupted_bake: StringProperty(  # type: ignore
+        name="Interrupted bake",
+        description="Objects (json) already baked by the bake which got cancelled or failed. To be able to resume it",
+        options={'HIDDEN'},
+    )
     # mapping: PointerProperty(type=MappingList, name="Mapping")  # type: ignore
 
     @staticmethod
@@ -299,6 +427,11 @@ class CaptureProperties(PropertyGroup):
             return sfx
         return sfx[1:]  # Drop the trailing dot
 
+    def frame2cue_time(self, ctx: Context, frame: float) -> float:
+        """Time of the cues at the scene frame. The cue time 0 is at the `start_frame` (where the sound strip starts)"""
+        render = ctx.scene.render
+        return frame2time(frame - self.start_frame, render.fps, render.fps_base)
+
     @property
     def sound_file_basename(self) -> str:
         """Name of the current Sound file without extension"""
@@ -362,6 +495,7 @@ class ResultLogListProperties(PropertyGroup):
     max_entries = 40
 
     items: CollectionProperty(type=ResultLogItemProperties, name="Log entries")  # type: ignore
+    progress: IntProperty(name="Bake progress", default=-1, min=-1, max=100, subtype='PERCENTAGE')  # type: ignore
 
     @cached_property
     def should_deduplicate(self) -> list[bool]:
@@ -433,12 +567,80 @@ class ResultLogListProperties(PropertyGroup):
         self.items.clear()
 
 
+class CaptureIndex:
+    """Lookup of the captures of a `CaptureListProperties` by the Sound, by the normalized sound file path and by the channel/start-frame.
+    Lazily built on the first lookup. The PropertyGroups can't keep any python state, so the indexes are kept here by the capture-list pointer.
+    Invalidated when a capture sound or placement changes (and on undo), the number of captures is checked on each access too.
+    Only the capture indexes are stored, so the found capture should still be verified"""
+
+    # CaptureListProperties pointer -> index
+    indexes: ClassVar[dict[int, "CaptureIndex"]] = {}
+
+    def __init__(self, clist: "CaptureListProperties") -> None:
+        self.count = len(clist.items)
+        self.by_pointer: dict[int, int] = {}
+        self.by_sound: dict[int, list[int]] = {}  # Sound session_uid -> the captures using it
+        self.by_path: dict[str, list[int]] = {}
+        self.by_placement: dict[tuple[int, int], int] = {}  # (channel, start frame) -> capture
+        for i, c in enumerate(clist.items):
+            self.by_pointer[c.as_pointer()] = i
+            self.by_placement.setdefault((c.channel_number, c.start_frame), i)
+            if not c.sound:
+                continue
+            self.by_sound.setdefault(c.sound.session_uid, []).append(i)
+            self.by_path.setdefault(ui_utils.SoundStripIndex.normalized_path(c.sound.filepath), []).append(i)
+
+    @staticmethod
+    def of(clist: "CaptureListProperties", rebuild: bool = False) -> "CaptureIndex":
+        key = clist.as_pointer()
+        ret = CaptureIndex.indexes.get(key)
+        if rebuild or ret is None or ret.count != len(clist.items):
+            ret = CaptureIndex.indexes[key] = CaptureIndex(clist)
+        return ret
+
+    @staticmethod
+    def invalidate() -> None:
+        CaptureIndex.indexes.clear()
+
+    def find_by_strip(self, strip: Strip) -> int:
+        """Index of the capture using the strip's Sound. Or the capture with a Sound of the same file.
+        Of the several matching captures the one placed on the strip's channel and frame is preferred. -1 when not found"""
+        at_strip = self.by_placement.get((strip.channel, int(strip.frame_start)))
+        same_sound = self.by_sound.get(strip.sound.session_uid)
+        if same_sound:  # Matched exactly by id
+            return at_strip if at_strip in same_sound else same_sound[0]
+        same_file = self.by_path.get(ui_utils.SoundStripIndex.normalized_path(strip.sound.filepath))
+        if not same_file:
+            return -1
+        if at_strip in same_file:
+            return at_strip
+        return same_file[-1]
+
+
+class CaptureNames(Sequence[str]):
+    """The capture dropdown names, the `short_desc` of a capture is built only when accessed"""
+
+    def __init__(self, clist: "CaptureListProperties") -> None:
+        self.items = clist.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, i: int) -> str:  # type: ignore[override]
+        if i < 0:
+            i += len(self.items)
+        if not 0 <= i < len(self.items):
+            raise IndexError(i)
+        return self.items[i].short_desc(i)
+
+
 class CaptureListProperties(PropertyGroup):
     """List of captures (setup and cues). Hooked to Blender scene"""
 
     last_resut_log: PointerProperty(type=ResultLogListProperties, name="Last result", description="Log messages of the last bake")  # type: ignore
     items: CollectionProperty(type=CaptureProperties, name="Captures")  # type: ignore
     index: IntProperty(name="Selected capture index", default=-1)  # type: ignore
+    batch_job: PointerProperty(type=JobProperties, name="Batch job", description="Aggregate state of the batch capture of multiple captures")  # type: ignore
 
     def search_names(self, ctx: Context, edit_text) -> Generator[str, Any, None]:
         for i, p in enumerate(self.items):
@@ -447,7 +649,7 @@ class CaptureListProperties(PropertyGroup):
         # return [(m, str(i)) for i, m in enumerate(materials)]
 
     def dropdown_helper(self, ctx: Context) -> DropdownHelper:
-        return DropdownHelper(self, list(self.search_names(ctx, "")), DropdownHelper.NameNotFoundHandling.SELECT_ANY)
+        return DropdownHelper(self, CaptureNames(self), DropdownHelper.NameNotFoundHandling.SELECT_ANY)
 
     def capture_changed(self, ctx: Context) -> None:
         self.dropdown_helper(ctx).name2index()
@@ -469,16 +671,49 @@ class CaptureListProperties(PropertyGroup):
         '''Finds a capture that corresponds to the specified sound strip.'''
         if not strip or not hasattr(strip, "sound") or strip.sound is None:
             return None
-
-        ret = None
-        for _capture in self.items:
-            capture: CaptureProperties = _capture
-            if not capture.sound:
+        for rebuild in (False, True):
+            i = CaptureIndex.of(self, rebuild).find_by_strip(strip)
+            if i < 0:
                 continue
+            capture: CaptureProperties = self.items[i]
             if capture.sound == strip.sound:
-                return capture  # Matched exactly by id
-            if bpy.path.abspath(capture.sound.filepath) == bpy.path.abspath(strip.sound.filepath):
-                ret = capture  # Save as the second best candidate
+                return capture
+            normalized_path = ui_utils.SoundStripIndex.normalized_path
+            if capture.sound and normalized_path(capture.sound.filepath) == normalized_path(strip.sound.filepath):
+                return capture
+        return None
+
+    def sync_from_strips(self, ctx: Context) -> int:
+        """Updates the start frame and the channel of the captures from their sound strips. Returns number of updated captures.
+        Only the captures of the sound strips found in the sequencer are visited"""
+        prefs = RhubarbAddonPreferences.from_context(ctx)
+        if not prefs.sync_with_sequencer or not ctx.scene.sequence_editor:
+            return 0
+        ui_utils.SoundStripIndex.ensure(ctx)
+        for rebuild in (False, True):
+            to_sync = self.strips_to_sync(CaptureIndex.of(self, rebuild))
+            if to_sync is not None:
+                break
+        return sum(self.items[i].sync_from_strip(strip) for i, strip in (to_sync or {}).items())
+
+    def strips_to_sync(self, index: CaptureIndex) -> Optional[dict[int, Strip]]:
+        """Capture index -> the sound strip to sync the capture from. None when the capture `index` is stale (a capture Sound changed since it was built)"""
+        strip_index = ui_utils.SoundStripIndex
+        ret: dict[int, Strip] = {}
+        for uid, strips in strip_index.by_sound.items():  # The captures matching the strip Sound exactly first
+            for i in index.by_sound.get(uid, []):
+                sound = self.items[i].sound
+                if not sound or sound.session_uid != uid:
+                    return None
+                ret[i] = strips[0]
+        for path, path_strips in strip_index.by_path.items():  # Then the captures with no strip of their own Sound but of the same file
+            for i in index.by_path.get(path, []):
+                if i in ret:
+                    continue
+                sound = self.items[i].sound
+                if not sound or strip_index.normalized_path(sound.filepath) != path:
+                    return None
+                ret[i] = path_strips[0][0]
         return ret
 
     def sync_selection_from_active_strip(self, ctx: Context) -> None:
@@ -507,8 +742,9 @@ class CaptureListProperties(PropertyGroup):
             return
 
         # Find index of the capture in the collection
-        for i, item in enumerate(self.items):
-            if item == capture:
+        for rebuild in (False, True):
+            i = CaptureIndex.of(self, rebuild).by_pointer.get(capture.as_pointer(), -1)
+            if i >= 0 and self.items[i] == capture:
                 self.index = i
                 return
 
@@ -1,13 +1,157 @@
-from typing import Any
+from typing import Any, ClassVar, NamedTuple, Optional
 
-from bpy.types import Context, UI_UL_list, UILayout, UIList
+import numpy as np
+from bpy.props import BoolProperty, FloatProperty
+from bpy.types import Context, UILayout, UIList
 
 from .. import IconsManager
-from .capture_properties import MouthCueList, MouthCueListItem
+from ..rhubarb.cue_filter import CueFilterIndex, CueFilterQuery
+from ..rhubarb.cue_table import CueTable
+from ..rhubarb.mouth_cues import FrameConfig, MouthShapeInfos, frame2time
+from .capture_properties import CaptureListProperties, MouthCueList, MouthCueListItem
 from .misc_operators import PlayRange
 from .preferences import CueListPreferences, RhubarbAddonPreferences
 
 
+class CueRow(NamedTuple):
+    """Preformatted texts (and flags) of a single row of the cue list"""
+
+    key: str
+    key_displ: str
+    start_frame: str
+    start_time: str
+    duration_frames: str
+    duration_time: str
+    end_frame: str
+    end_time: str
+    play_start: int  # Start frame (rounded down) and number of frames of the PlayRange operator
+    play_frames: int
+    inactive: bool  # Silence cue
+    alert: bool  # Too long/short cue
+
+
+class CueRows:
+    """Rows of the cue list. The frame columns are computed at once for all the cues, the texts of a row are formatted
+    when the row is drawn for the first time"""
+
+    def __init__(self, table: CueTable, highlight_long: float, highlight_short: float) -> None:
+        self.table = table
+        cfg = table.frame_cfg
+        self.offset_seconds = frame2time(cfg.offset, cfg.fps, cfg.fps_base)
+        self.start_frame_float = table.start_frame_float
+        self.end_frame_float = table.end_frame_float
+        self.start_frame = table.start_frame
+        self.end_frame = table.end_frame
+        self.start_frame_left = table.start_frame_left
+        self.duration_frames = np.ceil(self.end_frame_float - self.start_frame_float).astype(np.int64)
+        durations = table.durations
+        self.inactive = table.keys == MouthShapeInfos.key2index(MouthShapeInfos.X.value.key)
+        alert = np.zeros(len(table), dtype=bool)
+        if highlight_long > 0:
+            alert |= durations > highlight_long
+        if highlight_short >= 0:
+            alert |= durations <= highlight_short
+        self.alert = alert & ~self.inactive  # Too long/short cue is suspicious, unless it is silence
+        self.rows: list[Optional[CueRow]] = [None] * len(table)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> CueRow:
+        row = self.rows[index]
+        if row is None:
+            row = self.format_row(index)
+            self.rows[index] = row
+        return row
+
+    def format_row(self, i: int) -> CueRow:
+        t = self.table
+        info = MouthShapeInfos.all()[t.keys[i]]
+        start, end = float(t.starts[i]), float(t.ends[i])
+        sff, eff = float(self.start_frame_float[i]), float(self.end_frame_float[i])
+        if t.frame_cfg.subframes:
+            start_frame, end_frame, duration_frames = f"{sff:0.2f}", f"{eff:0.2f}", f"{eff - sff:0.2f}"
+        else:
+            start_frame, end_frame, duration_frames = f"{self.start_frame[i]}", f"{self.end_frame[i]}", f"{self.duration_frames[i]}"
+        return CueRow(
+            key=info.key,
+            key_displ=info.key_displ,
+            start_frame=start_frame,
+            start_time=f"{start + self.offset_seconds:0.2f}s",
+            duration_frames=duration_frames,
+            duration_time=f"{end - start:0.2f}s",
+            end_frame=end_frame,
+            end_time=f"{end + self.offset_seconds:0.2f}s",
+            play_start=int(self.start_frame_left[i]),
+            play_frames=int(self.duration_frames[i]),
+            inactive=bool(self.inactive[i]),
+            alert=bool(self.alert[i]),
+        )
+
+
+class CueRowCache:
+    """The `CueRows` of the cue lists. Rebuilt only when the cues (the list revision), the frame rate, the capture start frame
+    or the highlight settings change. So redrawing (scrolling) the list doesn't create any objects per cue"""
+
+    # Cue list pointer -> (cache key, rows)
+    caches: ClassVar[dict[int, tuple[tuple, CueRows]]] = {}
+
+    @staticmethod
+    def rows(ctx: Context, cue_list: MouthCueList, clp: CueListPreferences) -> CueRows:
+        render = ctx.scene.render
+        cprops = CaptureListProperties.capture_from_context(ctx)
+        start_frame = cprops.start_frame if cprops else 1
+        key = (
+            cue_list.revision,
+            len(cue_list.items),
+            render.fps,
+            render.fps_base,
+            start_frame,
+            ctx.scene.show_subframe,
+            clp.highlight_long_cues,
+            clp.highlight_short_cues,
+        )
+        ptr = cue_list.as_pointer()
+        cached = CueRowCache.caches.get(ptr)
+        if cached and cached[0] == key:
+            return cached[1]
+        frame_cfg = FrameConfig(render.fps, render.fps_base, start_frame, ctx.scene.show_subframe)
+        rows = CueRows(cue_list.cue_table(frame_cfg), clp.highlight_long_cues, clp.highlight_short_cues)
+        CueRowCache.caches[ptr] = (key, rows)
+        return rows
+
+    @staticmethod
+    def invalidate() -> None:
+        CueRowCache.caches.clear()
+
+
+class CueFilterCache:
+    """The `CueFilterIndex` of the cue lists and the filter flags of the last query. So the list is only filtered again
+    when the query or the cues change, not on every redraw"""
+
+    # Cue list pointer -> ((revision, cue count), index, last query, last flags)
+    caches: ClassVar[dict[int, tuple[tuple[int, int], CueFilterIndex, Optional[CueFilterQuery], list[int]]]] = {}
+
+    @staticmethod
+    def flags(cue_list: MouthCueList, query: CueFilterQuery, flag: int) -> list[int]:
+        ptr = cue_list.as_pointer()
+        key = (cue_list.revision, len(cue_list.items))
+        cached = CueFilterCache.caches.get(ptr)
+        if cached and cached[0] == key:
+            _, index, last_query, last_flags = cached
+            if last_query == query:
+                return last_flags
+        else:
+            index = CueFilterIndex(cue_list.cue_table(FrameConfig(1)))
+        flags = index.flags(query, flag)
+        CueFilterCache.caches[ptr] = (key, index, query, flags)
+        return flags
+
+    @staticmethod
+    def invalidate() -> None:
+        CueFilterCache.caches.clear()
+
+
 class MouthCueUIList(UIList):
     bl_idname = "RLPS_UL_cues"
 
@@ -15,10 +159,49 @@ class MouthCueUIList(UIList):
         prefs = RhubarbAddonPreferences.from_context(ctx)
         return prefs.cue_list_prefs
 
-    def filter_items(self, context: Context, data: MouthCueList, propname: str) -> tuple[Any, list]:
+    filter_suspicious: BoolProperty(  # type: ignore
+        name="Suspicious",
+        description="Show only the too long/short cues, the ones highlighted in red",
+    )
+    use_filter_time: BoolProperty(  # type: ignore
+        name="Time range",
+        description="Show only the cues within the time range (as displayed, including the capture start frame)",
+    )
+    filter_time_from: FloatProperty(name="From", description="Start of the time range (seconds)", min=0, precision=2)  # type: ignore
+    filter_time_to: FloatProperty(name="To", description="End of the time range (seconds)", min=0, default=10, precision=2)  # type: ignore
+
+    def filter_query(self, ctx: Context) -> CueFilterQuery:
+        keys: Optional[frozenset[str]] = None
         f = self.filter_name.upper()
-        filtered = UI_UL_list.filter_items_by_name(f, self.bitflag_filter_item, data.items, "key", reverse=False)
-        return filtered, []
+        if any(c.isalpha() for c in f):  # The name filter is a set of keys, like 'GH' or 'G,H'
+            keys = frozenset(info.key for info in MouthShapeInfos.all() if info.key in f)
+        time_from = time_to = None
+        if self.use_filter_time:
+            # The times are displayed shifted by the capture start frame
+            render = ctx.scene.render
+            cprops = CaptureListProperties.capture_from_context(ctx)
+            offset = frame2time(cprops.start_frame if cprops else 1, render.fps, render.fps_base)
+            time_from, time_to = self.filter_time_from - offset, self.filter_time_to - offset
+        clp = self.cuelist_prefs(ctx)
+        return CueFilterQuery(keys, time_from, time_to, self.filter_suspicious, clp.highlight_long_cues, clp.highlight_short_cues)
+
+    def filter_items(self, context: Context, data: MouthCueList, propname: str) -> tuple[Any, list]:
+        query = self.filter_query(context)
+        if query.is_empty:
+            return [], []
+        return CueFilterCache.flags(data, query, self.bitflag_filter_item), []
+
+    def draw_filter(self, context: Context, layout: UILayout) -> None:
+        row = layout.row(align=True)
+        row.prop(self, "filter_name", text="", icon="VIEWZOOM")
+        row.prop(self, "use_filter_invert", text="", icon="ARROW_LEFTRIGHT")
+        row = layout.row(align=True)
+        row.prop(self, "filter_suspicious", toggle=True, icon="ERROR")
+        row.prop(self, "use_filter_time", toggle=True, icon="TIME")
+        sub = row.row(align=True)
+        sub.active = self.use_filter_time
+        sub.prop(self, "filter_time_from")
+        sub.prop(self, "filter_time_to")
 
     def draw_item(
         self,
@@ -32,10 +215,11 @@ class MouthCueUIList(UIList):
         index: int,
         flt_flag: int,
     ) -> None:
-        self.draw_compact(layout, item, context, index)
+        self.draw_compact(layout, data, item, context, index)
 
-    def draw_compact(self, layout: UILayout, item: MouthCueListItem, context: Context, index: int) -> None:
+    def draw_compact(self, layout: UILayout, cue_list: MouthCueList, item: MouthCueListItem, context: Context, index: int) -> None:
         clp = self.cuelist_prefs(context)
+        cr = CueRowCache.rows(context, cue_list, clp)[index]
         # row = layout.row()
         # prefs = RhubarbAddonPreferences.from_context(context)
         if clp.show_col_icon:
@@ -46,13 +230,13 @@ class MouthCueUIList(UIList):
         row = split.row()  # Icon(0.1) and shape key (0.1)
 
         if clp.show_col_icon:
-            row.label(icon_value=IconsManager.cue_icon(item.cue.key))
+            row.label(icon_value=IconsManager.cue_icon(cr.key))
 
         op_text = ""
         if clp.as_circle:
-            op_text = item.cue.info.key_displ
+            op_text = cr.key_displ
         else:
-            op_text = item.key
+            op_text = cr.key
         if clp.allow_edit:
             row.prop(item, "key", text="", icon_only=False, emboss=False)
         else:
@@ -66,33 +250,29 @@ class MouthCueUIList(UIList):
             subs = row
 
         row = subs.row()  # Times (0.85)
-        if item.cue.key == "X":
+        if cr.inactive:
             row.active = False
-        else:
-            long = clp.highlight_long_cues
-            short = clp.highlight_short_cues
-            if (long > 0 and item.cue.duration > long) or (short >= 0 and item.cue.duration <= short):
-                row.alert = True  # Too long/short cue is suspicious, unless it is silence
+        elif cr.alert:
+            row.alert = True  # Too long/short cue is suspicious, unless it is silence
 
-        cf = item.cue_frames(context)
         if clp.show_col_start_frame:
-            row.label(text=f"{cf.start_frame_str}")
+            row.label(text=cr.start_frame)
         if clp.show_col_start_time:
-            row.label(text=f"{cf.start_time_str}s")
+            row.label(text=cr.start_time)
 
         if clp.show_col_len_frame:
-            row.label(text=f"{cf.duration_frames_str}")
+            row.label(text=cr.duration_frames)
         if clp.show_col_len_time:
-            row.label(text=f"{cf.duration_str}s")
+            row.label(text=cr.duration_time)
 
         if clp.show_col_end_frame:
-            row.label(text=f"{cf.end_frame_str}")
+            row.label(text=cr.end_frame)
         if clp.show_col_end_time:
-            row.label(text=f"{cf.end_time_str}s")
+            row.label(text=cr.end_time)
 
         if clp.show_col_play:
             row = subs.row()  # Operator (0.15)
             op = row.operator(PlayRange.bl_idname, text="", icon="PLAY")
 
-            op.start_frame = cf.start_frame_left
-            op.play_frames = cf.duration_frames
+            op.start_frame = cr.play_start
+            op.play_frames = cr.play_frames
@@ -1,26 +1,62 @@
 import logging
+import time
 import traceback
+from dataclasses import dataclass
+from typing import Optional
 
 import bpy
-from bpy.types import Context, Depsgraph, Object, Scene
+from bpy.app.handlers import persistent
+from bpy.types import Action, Context, Depsgraph, Object, Scene
 
-from . import capture_properties, mapping_properties
+from . import baking_utils, capture_properties, mapping_properties, mapping_utils, ui_utils
 from .dropdown_helper import DropdownHelper
 from .mapping_properties import NlaTrackRef
+from .preferences import RhubarbAddonPreferences
 
 log = logging.getLogger(__name__)
 
 
+@dataclass
+class HandlerStats:
+    """Counters of the depsgraph handler cost"""
+
+    updates: int = 0  # Depsgraph updates received
+    coalesced: int = 0  # Updates of an already dirty Object/Scene
+    objects_processed: int = 0
+    scenes_processed: int = 0
+    ticks: int = 0  # Timer callbacks
+    deferred: int = 0  # Ticks which ran out of the time budget
+    handler_seconds: float = 0  # Time spent in the depsgraph handler itself
+    process_seconds: float = 0  # Time spent processing the dirty Objects/Scene
+
+    def __str__(self) -> str:
+        return (
+            f"{self.updates} updates ({self.coalesced} coalesced), {self.objects_processed} objects and {self.scenes_processed} scenes processed "
+            f"in {self.ticks} ticks ({self.deferred} deferred). Handler {self.handler_seconds * 1000:.1f}ms, processing {self.process_seconds * 1000:.1f}ms"
+        )
+
+
 class DepsgraphHandler:
     """
     Manages Blender's depsgraph_update_post application handler to trigger
     callbacks when specific objects (with mapping) or the scene updates.
+    The handler only collects the updated objects into a dirty set. Those are processed later (once per event-loop tick) by a timer,
+    so the many updates fired during playback or sculpting are coalesced.
+    The frame_change_post handler selects the cue under the playhead while in playback.
     """
 
     # Static counter to track pending updates
     pending_count = 0
     MAX_PENDING_UPDATES = 2
 
+    # Objects updated since the last processing: Object session_uid -> the original Object
+    dirty_objects: dict[int, Object] = {}
+    scene_dirty = False
+    # Max time spent by a single tick. The rest of the dirty objects are processed in the following ticks
+    TIME_BUDGET = 0.004
+    DEFERRED_INTERVAL = 0.01
+    stats = HandlerStats()
+
     @staticmethod
     def handle_track_change(obj: Object, track_field_index: int) -> bool:
         mp = mapping_properties.MappingProperties.from_object(obj)
@@ -57,14 +93,6 @@ class DepsgraphHandler:
         if not changed and log.isEnabledFor(logging.TRACE):  # type: ignore
             log.trace(f"No changes detected for object: {obj.name}")
 
-    @staticmethod
-    def sync_capture(ctx: Context, cp: capture_properties.CaptureProperties) -> int:
-        if not cp:
-            return 0
-        if cp.on_strip_update(ctx):
-            return 1
-        return 0
-
     @staticmethod
     def scene_updated(ctx: Context, scene: Scene) -> None:
         if log.isEnabledFor(logging.TRACE):  # type: ignore
@@ -72,41 +100,167 @@ class DepsgraphHandler:
         cprops = capture_properties.CaptureListProperties.from_context(ctx)
         # TODO Active strip selection change doesn't generate any events so the sync happens too late and is confusing
         # cprops.sync_selection_from_active_strip(ctx)
-        updated_count = 0
-        for cp in cprops.items:
-            updated_count += DepsgraphHandler.sync_capture(ctx, cp)
+        if not cprops:
+            return
+        updated_count = cprops.sync_from_strips(ctx)
         if updated_count > 0 and log.isEnabledFor(logging.DEBUG):
             log.debug(f"Synced {updated_count} Captures")
 
     @staticmethod
     def on_depsgraph_update_post(scene: Scene, depsgraph: Depsgraph) -> None:
+        start = time.perf_counter()
+        stats = DepsgraphHandler.stats
         try:
-            ctx: Context = bpy.context
-            if not ctx:
-                return
-
+            # Something has changed, the bake dialog has to validate the objects again
+            baking_utils.ValidationCache.invalidate()
             for update in depsgraph.updates:
+                stats.updates += 1
                 if isinstance(update.id, Object):
-                    # Get the actual data object so any changes would persist. https://b3d.interplanety.org/en/objects-referring-in-a-depsgraph_update-handler-feature/
-                    obj = bpy.data.objects[update.id.name]
-                    mp = mapping_properties.MappingProperties.from_object(obj)
-                    if not mp:  # Object but with no mapping
-                        continue
-                    DepsgraphHandler.object_with_mapping_updated(ctx, obj, mp)
+                    # Keep the actual data object so any changes would persist. https://b3d.interplanety.org/en/objects-referring-in-a-depsgraph_update-handler-feature/
+                    obj = update.id.original
+                    if obj.session_uid in DepsgraphHandler.dirty_objects:
+                        stats.coalesced += 1
+                    DepsgraphHandler.dirty_objects[obj.session_uid] = obj
                     continue
                 if isinstance(update.id, Scene):
-                    DepsgraphHandler.scene_updated(ctx, update.id)
+                    ui_utils.SoundStripIndex.invalidate()  # The sequencer strips could have changed
+                    if DepsgraphHandler.scene_dirty:
+                        stats.coalesced += 1
+                    DepsgraphHandler.scene_dirty = True
+                    continue
+                if isinstance(update.id, Action):
+                    # The F-Curves (or slots) could have changed, the Action has to be checked again whether it fits the objects
+                    mapping_utils.ActionCompatibilityIndex.invalidate_action(update.id.original)
+            DepsgraphHandler.schedule_processing()
         except Exception as e:
             msg = f"Unexpected error occured in depsgraph update post handler: {e}"
             log.error(msg)
             log.debug(traceback.format_exc())
+        finally:
+            stats.handler_seconds += time.perf_counter() - start
+
+    @staticmethod
+    def schedule_processing() -> None:
+        if not DepsgraphHandler.dirty_objects and not DepsgraphHandler.scene_dirty:
+            return
+        if bpy.app.background:  # No event loop would run the timer
+            DepsgraphHandler.process_pending()
+            return
+        if not bpy.app.timers.is_registered(DepsgraphHandler.process_pending):
+            bpy.app.timers.register(DepsgraphHandler.process_pending, first_interval=0)
+
+    @staticmethod
+    def process_pending() -> Optional[float]:
+        """Processes the dirty Scene and Objects. Returns the interval of the next call when the time budget was exceeded (timer callback)"""
+        start = time.perf_counter()
+        stats = DepsgraphHandler.stats
+        try:
+            ctx: Context = bpy.context
+            if not ctx or not ctx.scene:
+                return None
+            if DepsgraphHandler.scene_dirty:
+                DepsgraphHandler.scene_dirty = False
+                DepsgraphHandler.scene_updated(ctx, ctx.scene)
+                stats.scenes_processed += 1
+            dirty = DepsgraphHandler.dirty_objects
+            while dirty:
+                obj = dirty.pop(next(iter(dirty)))
+                try:
+                    mp = mapping_properties.MappingProperties.from_object(obj)
+                except ReferenceError:
+                    mp = None  # Object removed in the meantime
+                if mp:  # Object but with no mapping otherwise
+                    DepsgraphHandler.object_with_mapping_updated(ctx, obj, mp)
+                    stats.objects_processed += 1
+                # Checked after the object, so at least one is processed per tick even when the Scene took the whole budget
+                if dirty and time.perf_counter() - start >= DepsgraphHandler.TIME_BUDGET:
+                    stats.deferred += 1
+                    return DepsgraphHandler.DEFERRED_INTERVAL
+        except Exception as e:
+            msg = f"Unexpected error occured while processing the depsgraph updates: {e}"
+            log.error(msg)
+            log.debug(traceback.format_exc())
+        finally:
+            stats.ticks += 1
+            stats.process_seconds += time.perf_counter() - start
+            if log.isEnabledFor(logging.TRACE):  # type: ignore
+                log.trace(str(stats))  # type: ignore
+        return None
+
+    @staticmethod
+    def on_frame_change_post(scene: Scene, *args) -> None:
+        """Keeps the cue under the playhead selected while in playback. The cue is bisected in the cached cue times (no RNA items access)"""
+        try:
+            ctx: Context = bpy.context
+            if not getattr(ctx.screen, 'is_animation_playing', False):
+                return
+            prefs = RhubarbAddonPreferences.from_context(ctx)
+            if not prefs or not prefs.cue_list_prefs.follow_playhead:
+                return
+            cprops = capture_properties.CaptureListProperties.capture_from_context(ctx)
+            if not cprops:
+                return
+            cue_list = cprops.cue_list
+            idx = cue_list.find_index_by_time(cprops.frame2cue_time(ctx, scene.frame_current_final))
+            if idx < 0 or idx == cue_list.index:
+                return
+            # Set directly, bypassing the update callback. It would move the playhead to the cue start (when the sync_on_select is on)
+            cue_list["index"] = idx
+            ui_utils.redraw_3dviews(ctx)
+        except Exception as e:
+            msg = f"Unexpected error occured in frame change post handler: {e}"
+            log.error(msg)
+            log.debug(traceback.format_exc())
+
+    @staticmethod
+    def on_undo_redo(scene: Scene, *args) -> None:
+        # Undo restores the Actions without any depsgraph update of them.
+        # The dirty Objects (and the indexed strips) could have been freed by the undo
+        DepsgraphHandler.clear_caches()
+
+    @staticmethod
+    @persistent
+    def on_load_post(*args) -> None:
+        """A new blend file, all the cached data refer to the freed one"""
+        DepsgraphHandler.clear_caches()
+
+    @staticmethod
+    def clear_caches() -> None:
+        from .cue_uilist import CueFilterCache, CueRowCache  # The ui list imports the IconsManager, not loaded yet when this module is
+
+        mapping_utils.ActionCompatibilityIndex.clear()
+        DepsgraphHandler.dirty_objects.clear()
+        ui_utils.SoundStripIndex.invalidate()
+        capture_properties.CaptureIndex.invalidate()
+        capture_properties.CueTimeIndex.invalidate()
+        CueRowCache.invalidate()
+        CueFilterCache.invalidate()
+        baking_utils.ValidationCache.invalidate()
 
     @staticmethod
     def register() -> None:
         if DepsgraphHandler.on_depsgraph_update_post not in bpy.app.handlers.depsgraph_update_post:
             bpy.app.handlers.depsgraph_update_post.append(DepsgraphHandler.on_depsgraph_update_post)
+        for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+            if DepsgraphHandler.on_undo_redo not in handlers:
+                handlers.append(DepsgraphHandler.on_undo_redo)
+        if DepsgraphHandler.on_frame_change_post not in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.append(DepsgraphHandler.on_frame_change_post)
+        if DepsgraphHandler.on_load_post not in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.append(DepsgraphHandler.on_load_post)
 
     @staticmethod
     def unregister() -> None:
+        if bpy.app.timers.is_registered(DepsgraphHandler.process_pending):
+            bpy.app.timers.unregister(DepsgraphHandler.process_pending)
+        DepsgraphHandler.dirty_objects.clear()
+        DepsgraphHandler.scene_dirty = False
         if DepsgraphHandler.on_depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
             bpy.app.handlers.depsgraph_update_post.remove(DepsgraphHandler.on_depsgraph_update_post)
+        for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+            if DepsgraphHandler.on_undo_redo in handlers:
+                handlers.remove(DepsgraphHandler.on_undo_redo)
+        if DepsgraphHandler.on_frame_change_post in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.remove(DepsgraphHandler.on_frame_change_post)
+        if DepsgraphHandler.on_load_post in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.remove(DepsgraphHandler.on_load_post)
@@ -0,0 +1,191 @@
+import logging
+import math
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import bpy
+import numpy as np
+
+from ..rhubarb.placement_plan import PlacementPlan
+from . import action_support
+from .baking_utils import StripSource
+
+log = logging.getLogger(__name__)
+
+Channel = tuple[str, int]  # F-Curve data path and array index
+
+
+@dataclass
+class PlacedStrip:
+    """Final timing of a single strip, as it would end up on the NLA track after all the trims and clamps of the `BakeToNLA`"""
+
+    slot: int  # Track slot
+    src: StripSource
+    start: float
+    end: float
+    scale: float
+    blend_in: float = 0
+    blend_out: float = 0
+    auto_blend: bool = False
+
+    def __post_init__(self) -> None:
+        # Blender stores the strip frames as 32-bit floats. Round the same way, otherwise the Action time could wrap around at a different frame
+        self.start, self.end, self.scale = (float(np.float32(v)) for v in (self.start, self.end, self.scale))
+
+    @property
+    def length(self) -> float:
+        return self.end - self.start
+
+    def influence(self, frames: np.ndarray) -> np.ndarray:
+        """Strip influence at the given frames (which should be within the strip). Ramps up during the blend-in and down during the blend-out"""
+        ret = np.ones_like(frames)
+        if self.blend_in > 0:
+            ret = np.minimum(ret, (frames - self.start) / self.blend_in)
+        if self.blend_out > 0:
+            ret = np.minimum(ret, (self.end - frames) / self.blend_out)
+        return np.clip(ret, 0, 1)
+
+    def action_times(self, frames: np.ndarray) -> np.ndarray:
+        """Maps the scene frames to the Action frames. The Action repeats when the strip is longer than the (scaled) Action"""
+        a_start, a_end = self.src.custom_frame_range or self.src.action.frame_range
+        t = (frames - self.start) / self.scale
+        if a_end - a_start > 0:
+            t = np.fmod(t, a_end - a_start)
+        return a_start + t
+
+
+def place_strips(plan: PlacementPlan, sources: list[StripSource], action_scale: Callable[[float, float], float], blend_by_ratio: bool) -> list[PlacedStrip]:
+    """Replays the plan the same way the NLA bake does, but without creating any strips"""
+    ret: list[PlacedStrip] = []
+    last_on_slot: dict[int, PlacedStrip] = {}
+    for ps in plan.strips:
+        src = sources[ps.key_index]
+        if not src.action:
+            continue
+        s = PlacedStrip(ps.track_slot, src, ps.start, ps.end, action_scale(src.length_frames, ps.duration), auto_blend=ps.auto_blend)
+        prev = last_on_slot.get(ps.track_slot)
+        if prev and prev.start <= s.start < prev.end:
+            prev.end = s.start  # Trim the previous strip end to make room
+            # The blends were set before the trim. Blender clamps them to fit the shorter strip
+            prev.blend_out = min(prev.blend_out, prev.length)
+            prev.blend_in = min(prev.blend_in, prev.length - prev.blend_out)
+        if ps.auto_blend:
+            s.end = float(np.float32(s.end - 0.001))  # Same as the NLA bake, to avoid the strips touching
+        elif blend_by_ratio:
+            s.blend_in = min(ps.blend_in, s.length)
+            s.blend_out = min(ps.blend_out, s.length - s.blend_in)
+        last_on_slot[ps.track_slot] = s
+        ret.append(s)
+    set_auto_blends(ret)
+    return ret
+
+
+def set_auto_blends(strips: list[PlacedStrip]) -> None:
+    """Blender's auto-blend: the blends of a strip are the overlaps with the strips on the other track"""
+    for i, s in enumerate(strips):
+        if not s.auto_blend:
+            continue
+        for other in strips[max(0, i - 3) : i + 4]:  # The tracks alternate, only the neighbours can overlap
+            if other.slot == s.slot:
+                continue
+            if other.start <= s.start < other.end:
+                s.blend_in = max(s.blend_in, min(other.end, s.end) - s.start)
+            if other.start < s.end <= other.end:
+                s.blend_out = max(s.blend_out, s.end - max(other.start, s.start))
+
+
+def channel_default(id_data: bpy.types.ID, channel: Channel) -> float:
+    """Default (RNA) value of the animated property. The NLA blends the lowest strip with it"""
+    data_path, index = channel
+    owner_path, _, prop_name = data_path.rpartition(".")
+    try:
+        owner = id_data.path_resolve(owner_path) if owner_path else id_data
+        prop = owner.bl_rna.properties[prop_name]
+    except (ValueError, KeyError):
+        return 0.0
+    if getattr(prop, "array_length", 0) > 0:
+        return float(prop.default_array[index])
+    return float(getattr(prop, "default", 0.0))
+
+
+class KeyframeBaker:
+    """Evaluates the strips the same way the NLA would (bottom track first, each strip replacing the result below it by its influence)
+    and writes the result as keyframes of a single Action. The extrapolation of the strips is not evaluated (the default of the bake is "Nothing")
+    and the Combine blend type is approximated by adding the strip deltas from the default values"""
+
+    def __init__(self, id_data: bpy.types.ID, strips: list[PlacedStrip], slot_order: tuple[int, ...] = (0, 1), blend_type: str = "REPLACE") -> None:
+        self.id_data = id_data  # The Object or the shape-keys (Key) the action is baked for
+        self.strips = strips
+        self.slot_order = slot_order  # Track slots from the bottom to the top track
+        self.blend_type = blend_type
+
+    def frames(self, frame_step: float = 1) -> np.ndarray:
+        if not self.strips:
+            return np.empty(0)
+        start = math.floor(min(s.start for s in self.strips))
+        end = math.ceil(max(s.end for s in self.strips))
+        return np.arange(start, end + frame_step / 2, frame_step, dtype=np.float64)
+
+    @staticmethod
+    def fcurves_of(src: StripSource) -> dict[Channel, bpy.types.FCurve]:
+        fcurves = action_support.get_action_fcurves(src.action, src.slot.identifier if src.slot else 0)
+        return {(fc.data_path, fc.array_index): fc for fc in fcurves}
+
+    def evaluate(self, frames: np.ndarray) -> dict[Channel, np.ndarray]:
+        """Values of all the channels animated by any of the strips, at the given frames"""
+        fcurves_by_src: dict[int, dict[Channel, bpy.types.FCurve]] = {}
+        for s in self.strips:
+            key = id(s.src)
+            if key not in fcurves_by_src:
+                fcurves_by_src[key] = KeyframeBaker.fcurves_of(s.src)
+        channels: dict[Channel, np.ndarray] = {}
+        defaults: dict[Channel, float] = {}
+        for fcs in fcurves_by_src.values():
+            for ch in fcs:
+                if ch not in channels:
+                    defaults[ch] = channel_default(self.id_data, ch)
+                    channels[ch] = np.full(len(frames), defaults[ch])
+        for slot in self.slot_order:
+            for s in self.strips:
+                if s.slot != slot:
+                    continue
+                lo, hi = np.searchsorted(frames, [s.start, s.end])  # Strip end is exclusive
+                if lo >= hi:
+                    continue
+                f = frames[lo:hi]
+                inf = s.influence(f)
+                times = s.action_times(f).tolist()
+                for ch, fc in fcurves_by_src[id(s.src)].items():
+                    v = np.fromiter((fc.evaluate(t) for t in times), dtype=np.float64, count=len(times))
+                    acc = channels[ch][lo:hi]
+                    if self.blend_type == "REPLACE":
+                        channels[ch][lo:hi] = acc * (1 - inf) + v * inf
+                    else:
+                        channels[ch][lo:hi] = acc + (v - defaults[ch]) * inf
+        return channels
+
+    @staticmethod
+    def write_fcurve(fcurves: bpy.types.bpy_prop_collection, channel: Channel, frames: np.ndarray, values: np.ndarray) -> bpy.types.FCurve:
+        """Creates the F-Curve with all the keyframes at once"""
+        fc = fcurves.new(channel[0], index=channel[1])
+        kps = fc.keyframe_points
+        kps.add(len(frames))
+        co = np.empty(len(frames) * 2, dtype=np.float32)
+        co[0::2], co[1::2] = frames, values
+        kps.foreach_set("co", co)
+        linear = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items["LINEAR"].value
+        kps.foreach_set("interpolation", np.full(len(frames), linear, dtype=np.int32))
+        fc.update()
+        return fc
+
+    def bake(self, action_name: str, frame_step: float = 1, slot_type: str = "OBJECT") -> Optional[bpy.types.Action]:
+        frames = self.frames(frame_step)
+        if not len(frames):
+            return None
+        channels = self.evaluate(frames)
+        action = bpy.data.actions.new(action_name)
+        fcurves = action_support.ensure_action_fcurves(action, action_name, slot_type)
+        for ch, values in channels.items():
+            KeyframeBaker.write_fcurve(fcurves, ch, frames, values)
+        log.debug(f"Baked {len(channels)} channels x {len(frames)} frames to {action.name}")
+        return action
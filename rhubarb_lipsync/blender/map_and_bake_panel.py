@@ -222,7 +222,18 @@ class MappingAndBakingPanel(bpy.types.Panel):
             row = layout.row()
             row.scale_y = 2
             row.operator(baking_operators.BakeToNLA.bl_idname, icon="NLA")
+            row.operator(baking_operators.BakeToKeyframes.bl_idname, icon="KEYINGSET")
+            cprops = CaptureListProperties.capture_from_context(context)
+            if cprops.baked_plan:
+                op = layout.row().operator(baking_operators.BakeToNLA.bl_idname, text="Rebake changed cues", icon="FILE_REFRESH")
+                op.only_changed = True
+            if cprops.interrupted_bake:
+                op = layout.row().operator(baking_operators.BakeToNLA.bl_idname, text="Resume interrupted bake", icon="PLAY")
+                op.resume = True
+                op.background = True
             rll: ResultLogListProperties = CaptureListProperties.from_context(context).last_resut_log
+            if rll.progress >= 0:
+                layout.prop(rll, "progress", text="Baking, ESC to cancel", slider=True)
             if rll.has_any_errors_or_warnings:
                 box = layout.box()
                 row = box.row()
@@ -9,7 +9,6 @@ from bpy.types import Context, Object
 from .. import IconsManager
 from ..rhubarb.mouth_shape_info import MouthShapeInfo, MouthShapeInfos
 from . import mapping_utils, ui_utils
-from .action_support import is_action_shape_key_action
 from .mapping_properties import MappingItem, MappingProperties, NlaTrackRef
 from .preferences import MappingPreferences, RhubarbAddonPreferences
 
@@ -22,24 +21,26 @@ def filtered_actions_enum(prop_group: 'ListFilteredActions', ctx: Context) -> li
             return []
         o: bpy.types.Object = ctx.object
         mprops = MappingProperties.from_object(o)
+        signature = mapping_utils.object_data_signature(o)  # Once for all the listed Actions
 
-        def action2ico(a: bpy.types.Action):
+        def action2ico(a: bpy.types.Action, slot_key: str):
             if a.asset_data:
                 return "ASSET_MANAGER"
-            if is_action_shape_key_action(a):
+            if mapping_utils.ActionCompatibilityIndex.is_shape_key_action(a):
                 return "SHAPEKEY_DATA"
-            if not mapping_utils.does_action_fit_object(o, a):
+            # Already resolved (and cached) by the `filtered_action_slots`
+            if not mapping_utils.ActionCompatibilityIndex.does_slot_fit(o, a, slot_key, signature):
                 return "ERROR"
             return "OBJECT_DATAMODE"
 
         def fields(i, a: bpy.types.Action, slot_key: str) -> tuple[str, str, str, str, int]:
             display = f"{a.name} |{slot_key}"
             # (Unique internal ID string, UI display name, Tooltip description, Icon identifier string, Optional integer value)
-            return (f"{a.name}/{slot_key}", display, a.name_full, action2ico(a), i)
+            return (f"{a.name}/{slot_key}", display, a.name_full, action2ico(a, slot_key), i)
             # return (a.name, a.name, a.name_full)
 
         # return [fields(i, a) for i, a in enumerate(mapping_utils.filtered_actions(o, mprops))]
-        return [fields(i, action, slot) for i, (action, slot) in enumerate(mapping_utils.filtered_action_slots(o, mprops))]
+        return [fields(i, action, slot) for i, (action, slot) in enumerate(mapping_utils.filtered_action_slots(o, mprops, signature))]
 
     except Exception as e:
         log.exception(f"Failed to list actions. {e}")
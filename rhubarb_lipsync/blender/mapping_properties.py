@@ -20,6 +20,15 @@ if TYPE_CHECKING:
         from bpy.types import ActionSlot
     except ImportError:  # Blender <v4.4
         ActionSlot = Any  # type: ignore
+
+
+def on_mapping_changed(prop_group: PropertyGroup, ctx: Context) -> None:
+    """Update callback of the mapping properties, bumps the revision of the Object's mapping"""
+    mprops = MappingProperties.from_object(prop_group.id_data)
+    if mprops:
+        mprops.touch()
+
+
 class NlaTrackRef(PropertyGroup):
     """Reference to an nla track. By name and index since NLA track is a non-ID object"""
 
@@ -33,6 +42,7 @@ class NlaTrackRef(PropertyGroup):
     def name_updated(self, ctx: Context) -> None:
         self.dropdown_helper.name2index()
         _, _ = self.dropdown_helper.detect_item_changes()  # Just to capture the item's length
+        on_mapping_changed(self, ctx)
 
     def items(self) -> Generator[NlaTrack, Any, None]:
         yield from mapping_utils.list_nla_tracks_of_object(self.object)
@@ -95,12 +105,14 @@ class MappingItem(PropertyGroup):
     action: PointerProperty(  # type: ignore
         type=bpy.types.Action,
         name="Action",
+        update=on_mapping_changed,
         options={'LIBRARY_EDITABLE'},
         override={'LIBRARY_OVERRIDABLE'},
     )
     slot_key: StringProperty(  # type: ignore
         name="Slot",
         description="Action Slot to use",
+        update=on_mapping_changed,
         options={'LIBRARY_EDITABLE'},
         override={'LIBRARY_OVERRIDABLE'},
     )
@@ -108,6 +120,7 @@ class MappingItem(PropertyGroup):
     frame_start: FloatProperty(  # type: ignore
         name="Frame Start",
         description="Start frame of the Action used to create the Action Clip",
+        update=on_mapping_changed,
         step=100,
         default=1,
         soft_min=1,
@@ -119,6 +132,7 @@ class MappingItem(PropertyGroup):
     frame_count: FloatProperty(  # type: ignore
         name="Frames count",
         description="Number of frames of the Action used to create the Action Clip",
+        update=on_mapping_changed,
         step=100,
         default=1,
         min=0,
@@ -131,6 +145,7 @@ class MappingItem(PropertyGroup):
     custom_frame_ranage: BoolProperty(  # type: ignore
         name="Custom Frame Range",
         description="Whether use a custom (sub)range of frames of the Action or whole frame range when creating the Action Clip",
+        update=on_mapping_changed,
         default=False,
         options={'LIBRARY_EDITABLE'},
         override={'LIBRARY_OVERRIDABLE'},
@@ -259,6 +274,7 @@ class MappingProperties(PropertyGroup):
     only_shapekeys: BoolProperty(  # type: ignore
         name="Only shape-key Actions",
         description="Switch between normal Actions and shape-key Actions. Use normal Actions for Armature and shape-key Actions for Mesh.",
+        update=on_mapping_changed,
         default=False,
         options={'LIBRARY_EDITABLE'},
         override={'LIBRARY_OVERRIDABLE'},
@@ -282,6 +298,17 @@ class MappingProperties(PropertyGroup):
         override={'LIBRARY_OVERRIDABLE'},
     )
 
+    revision: IntProperty(  # type: ignore
+        name="Revision",
+        description="Incremented on every change of the mapping",
+        options={'HIDDEN', 'LIBRARY_EDITABLE'},
+        override={'LIBRARY_OVERRIDABLE'},
+    )
+
+    def touch(self) -> None:
+        """Marks the mapping as changed, so the cached validation of the Object is not used"""
+        self.revision += 1
+
     def build_items(self, obj: bpy.types.Object) -> None:
         # log.trace("Already built")  # type: ignore
         if len(self.items) > 0:
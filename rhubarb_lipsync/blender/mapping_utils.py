@@ -1,5 +1,5 @@
 import logging
-from typing import Iterator
+from typing import ClassVar, Iterator, Optional
 
 import bpy
 from bpy.types import Object
@@ -28,69 +28,173 @@ def does_object_support_shapekey_actions(o: bpy.types.Object) -> bool:
     return bool(o.data and o.data.shape_keys)
 
 
-def does_action_slot_fit_object(o: bpy.types.Object, action: bpy.types.Action, slot_key: str = "") -> bool:
-
+def does_action_slot_fit_object(o: bpy.types.Object, action: bpy.types.Action, slot_key: str = "", signature: Optional[int] = None) -> bool:
+    paths = DataPathMemo.of(o, signature)
     for fcurve in action_support.get_action_fcurves(action, slot_key):
-        try:
-            if action_support.is_fcurve_for_shapekey(fcurve):
-                if not does_object_support_shapekey_actions(o):
-                    return False  # Shape-key action can't fit an object with no shape-key blocks (no-mesh) in the first place
-                # fcurve Action paths are based on the shape_keys data block
-                o.data.shape_keys.path_resolve(fcurve.data_path)
-            else:  # Normal action, fcurves are based on the Object
-                o.path_resolve(fcurve.data_path)
-            # Sucessfully accessed the property using the F-Curve's data path.
-            # TODO Check the index too
-            # if not hasattr(prop, fcurve.array_index):
-            #    return False
-        except ValueError:
-            # The data path does not exist on the object
+        if action_support.is_fcurve_for_shapekey(fcurve):
+            if not does_object_support_shapekey_actions(o):
+                return False  # Shape-key action can't fit an object with no shape-key blocks (no-mesh) in the first place
+            # fcurve Action paths are based on the shape_keys data block
+            if not paths.resolves(fcurve.data_path, True):
+                return False
+        elif not paths.resolves(fcurve.data_path, False):  # Normal action, fcurves are based on the Object
             return False
+        # TODO Check the index too
+        # if not hasattr(prop, fcurve.array_index):
+        #    return False
 
     return True
 
 
+def object_data_signature(o: bpy.types.Object) -> int:
+    """Hash of everything the F-Curve data paths are resolved against: the Object type, the bones (with their constraints and custom properties),
+    the shape-key names, the modifier and constraint names and the custom properties of the Object and of its data.
+    Objects with the same signature fit the same Actions. Not covered are the paths into other named collections (vertex groups, attributes,
+    material slots...), the cached results for those are dropped on undo or with the Action update only"""
+    if not o:
+        return 0
+    bones = tuple((b.name, tuple(b.keys()), tuple(c.name for c in b.constraints)) for b in o.pose.bones) if o.pose else ()
+    shape_keys = o.data.shape_keys if does_object_support_shapekey_actions(o) else None
+    key_blocks = tuple(kb.name for kb in shape_keys.key_blocks) if shape_keys else ()
+    modifiers = tuple(m.name for m in o.modifiers)
+    constraints = tuple(c.name for c in o.constraints)
+    data_props = tuple(o.data.keys()) if o.data else ()
+    return hash((o.type, bones, key_blocks, modifiers, constraints, tuple(o.keys()), data_props))
+
+
+class DataPathMemo:
+    """Remembers which F-Curve data paths resolve on an Object (and on its shape-keys block). Pose libraries animate the same bones over and over,
+    so most of the `path_resolve` calls are repeats. The memo is built lazily and dropped once the `object_data_signature` changes
+    (bones, shape-key blocks, modifiers, constraints or custom properties renamed, added or removed)"""
+
+    # Object session_uid -> memo
+    memos: ClassVar[dict[int, "DataPathMemo"]] = {}
+
+    def __init__(self, o: bpy.types.Object, signature: int) -> None:
+        self.o = o
+        self.signature = signature
+        self.paths: dict[tuple[str, bool], bool] = {}  # (data path, on shape-keys) -> resolvable
+
+    @staticmethod
+    def of(o: bpy.types.Object, signature: Optional[int] = None) -> "DataPathMemo":
+        if signature is None:
+            signature = object_data_signature(o)
+        memo = DataPathMemo.memos.get(o.session_uid)
+        if memo is None or memo.signature != signature:
+            memo = DataPathMemo.memos[o.session_uid] = DataPathMemo(o, signature)
+        memo.o = o  # The python wrapper could have been recreated (undo)
+        return memo
+
+    def resolves(self, data_path: str, on_shape_keys: bool) -> bool:
+        key = (data_path, on_shape_keys)
+        ret = self.paths.get(key)
+        if ret is None:
+            owner = self.o.data.shape_keys if on_shape_keys else self.o
+            try:
+                owner.path_resolve(data_path)
+                ret = True  # Sucessfully accessed the property using the F-Curve's data path.
+            except ValueError:
+                ret = False  # The data path does not exist on the object
+            self.paths[key] = ret
+        return ret
+
+    @staticmethod
+    def clear() -> None:
+        DataPathMemo.memos.clear()
+
+
+class ActionCompatibilityIndex:
+    """Remembers which Action slots fit which Objects, and which Actions are shape-key Actions. So the F-Curves are walked once per Action instead of
+    on every redraw of the Action dropdown. The Objects are keyed by the `object_data_signature`, so the entries of an Object with changed bones or shape-keys
+    are not used anymore. The entries of an Action are dropped by the `DepsgraphHandler` when the Action is updated (or on undo)."""
+
+    # Action session_uid -> (object signature, slot key) -> fits
+    fits: ClassVar[dict[int, dict[tuple[int, str], bool]]] = {}
+    # Action session_uid -> is shape-key Action
+    shape_key_actions: ClassVar[dict[int, bool]] = {}
+
+    @staticmethod
+    def does_slot_fit(o: bpy.types.Object, action: bpy.types.Action, slot_key: str = "", signature: Optional[int] = None) -> bool:
+        """Cached `does_action_slot_fit_object`. The `signature` of the object can be provided when checking many Actions"""
+        if signature is None:
+            signature = object_data_signature(o)
+        action_fits = ActionCompatibilityIndex.fits.setdefault(action.session_uid, {})
+        ret = action_fits.get((signature, slot_key))
+        if ret is None:
+            ret = action_fits[(signature, slot_key)] = does_action_slot_fit_object(o, action, slot_key, signature)
+        return ret
+
+    @staticmethod
+    def does_fit(o: bpy.types.Object, action: bpy.types.Action, signature: Optional[int] = None) -> bool:
+        """Cached `does_action_fit_object`"""
+        if action_support.is_action_blank(action):  # Blank actions are considered invalid (#8)
+            return False
+        if signature is None:
+            signature = object_data_signature(o)
+        return any(ActionCompatibilityIndex.does_slot_fit(o, action, k, signature) for k in action_support.get_action_slot_keys(action))
+
+    @staticmethod
+    def is_shape_key_action(action: bpy.types.Action) -> bool:
+        uid = action.session_uid
+        ret = ActionCompatibilityIndex.shape_key_actions.get(uid)
+        if ret is None:
+            ret = ActionCompatibilityIndex.shape_key_actions[uid] = action_support.is_action_shape_key_action(action)
+        return ret
+
+    @staticmethod
+    def invalidate_action(action: bpy.types.Action) -> None:
+        uid = action.session_uid
+        ActionCompatibilityIndex.fits.pop(uid, None)
+        ActionCompatibilityIndex.shape_key_actions.pop(uid, None)
+
+    @staticmethod
+    def clear() -> None:
+        DataPathMemo.clear()
+        ActionCompatibilityIndex.fits.clear()
+        ActionCompatibilityIndex.shape_key_actions.clear()
+
+
 def does_action_fit_object(o: bpy.types.Object, action: bpy.types.Action) -> bool:
     """Check if all action's F-Curves paths are valid for the provided object."""
-
-    if action_support.is_action_blank(action):  # Blank actions are considered invalid (#8)
-        return False
-    slot_keys = action_support.get_action_slot_keys(action)
-    for slot_key in slot_keys:
-        if does_action_slot_fit_object(o, action, slot_key):
-            return True  # There is at least one slot (ChannelBag)  with it's fcurves fitting the provided object
-    return False
+    return ActionCompatibilityIndex.does_fit(o, action)
 
 
 def filtered_actions(o: bpy.types.Object, mp: "mapping_properties.MappingProperties") -> Iterator[bpy.types.Action]:
     """Yields all Actions of the current Blender project while applying various filters when enabled in the provided mapping properties"""
     if not mp:
         return
+    signature = object_data_signature(o)
     for action in bpy.data.actions:
-        if not does_action_fit_object(o, action):  # An invalid action
+        if not ActionCompatibilityIndex.does_fit(o, action, signature):  # An invalid action
             if not mp.only_valid_actions:
                 yield action  # Show-invalid-actions take precedence
             continue
         # The Only-shape-key is a switch
-        if mp.only_shapekeys != action_support.is_action_shape_key_action(action):
+        if mp.only_shapekeys != ActionCompatibilityIndex.is_shape_key_action(action):
             continue
+        # Read the asset flag directly, marking an asset doesn't trigger any depsgraph update
         if mp.only_asset_actions and not action.asset_data:
             continue
         yield action
 
 
-def filtered_action_slots(o: bpy.types.Object, mp: "mapping_properties.MappingProperties") -> Iterator[tuple[bpy.types.Action, str]]:
+def filtered_action_slots(
+    o: bpy.types.Object, mp: "mapping_properties.MappingProperties", signature: Optional[int] = None
+) -> Iterator[tuple[bpy.types.Action, str]]:
+    """Yields the (Action, slot key) pairs passing the filters. The `signature` of the object can be provided when it is needed by the caller too"""
     if not mp:
         return
+    if signature is None:
+        signature = object_data_signature(o)
     for action in bpy.data.actions:
         slot_keys = action_support.get_action_slot_keys(action)
         for slot_key in slot_keys:
-            if not does_action_slot_fit_object(o, action, slot_key):  # An invalid action
+            if not ActionCompatibilityIndex.does_slot_fit(o, action, slot_key, signature):  # An invalid action
                 if not mp.only_valid_actions:
                     yield action, slot_key  # Show-invalid-actions take precedence
                 continue
             # The Only-shape-key is a switch
-            if mp.only_shapekeys != action_support.is_action_shape_key_action(action):
+            if mp.only_shapekeys != ActionCompatibilityIndex.is_shape_key_action(action):
                 continue
             if mp.only_asset_actions and not action.asset_data:
                 continue
@@ -1,4 +1,5 @@
 import pathlib
+import tempfile
 import traceback
 from functools import cached_property
 from typing import Iterator, Optional, cast
@@ -6,6 +7,7 @@ from typing import Iterator, Optional, cast
 from bpy.props import BoolProperty, EnumProperty, FloatProperty, IntProperty, PointerProperty, StringProperty
 from bpy.types import AddonPreferences, Context, Object, PropertyGroup, UILayout
 
+from ..rhubarb.cue_cache import CueCache
 from ..rhubarb.rhubarb_command import RhubarbCommandWrapper
 from . import ui_utils
 from .strip_placement_preferences import StripPlacementPreferences
@@ -58,6 +60,11 @@ class CueListPreferences(PropertyGroup):
         name="Preview on playback",
         description="Animate the icon in the panel while in playback.",
     )
+    follow_playhead: BoolProperty(  # type: ignore
+        default=True,
+        name="Select cue on playback",
+        description="Keep the cue under the playhead selected while in playback",
+    )
 
     allow_edit: BoolProperty(  # type: ignore
         name="Allow editing",
@@ -165,6 +172,71 @@ class RhubarbAddonPreferences(AddonPreferences):
         default=True,
     )
 
+    capture_concurrency: IntProperty(  # type: ignore
+        name="Parallel captures",
+        description="Maximum number of rhubarb processes running at the same time when capturing multiple sounds. Set to 0 to use the number of CPU cores.",
+        default=0,
+        min=0,
+        soft_max=32,
+    )
+
+    split_long_sounds: BoolProperty(  # type: ignore
+        name="Split long sounds",
+        description="Split long sound files at silences and capture the parts in parallel. Much faster on multi-core CPUs. The dialog file is ignored for split sounds.",
+        default=False,
+    )
+
+    split_min_duration: FloatProperty(  # type: ignore
+        name="Min duration (sec)",
+        description="Only sounds longer than this are split",
+        default=60,
+        min=10,
+    )
+
+    stream_cues: BoolProperty(  # type: ignore
+        name="Stream cues",
+        description="Capture long sounds in sequential windows and add the cues to the list as soon as each window is done. Allows previewing the beginning of a long sound before the capture finishes.",
+        default=False,
+    )
+
+    stream_window_duration: FloatProperty(  # type: ignore
+        name="Window (sec)",
+        description="Approximate length of the streaming window. Sounds shorter than two windows are not streamed",
+        default=30,
+        min=5,
+    )
+
+    use_cache: BoolProperty(  # type: ignore
+        name="Cache capture results",
+        description="Store the captured cues on disk. Capturing an unchanged sound file with the same settings again loads the cues from the cache instantly instead of running the rhubarb executable.",
+        default=False,
+    )
+
+    cache_max_size: IntProperty(  # type: ignore
+        name="Cache size (MB)",
+        description="Maximum size of the cache folder. The least recently used results are removed when the limit is exceeded.",
+        default=50,
+        min=1,
+    )
+
+    cache_folder: StringProperty(  # type: ignore
+        name="Cache folder",
+        description="Where the cached capture results are stored. Leave blank to use the system temporary folder",
+        subtype='DIR_PATH',
+        default="",
+    )
+
+    @property
+    def cache_path(self) -> pathlib.Path:
+        if self.cache_folder:
+            return pathlib.Path(self.cache_folder)
+        return pathlib.Path(tempfile.gettempdir()) / "rhubarb_lipsync_cache"
+
+    def new_cue_cache(self) -> Optional[CueCache]:
+        if not self.use_cache:
+            return None
+        return CueCache(self.cache_path, self.cache_max_size * 1024 * 1024)
+
     default_converted_output_folder: StringProperty(  # type: ignore
         name="Converted files output",
         description="Where to put the new wav/ogg files resulted from the conversion from an unsupported formats. Leave blank to use the source file's folder",
@@ -269,7 +341,9 @@ class RhubarbAddonPreferences(AddonPreferences):
     strip_placement: PointerProperty(type=StripPlacementPreferences, name="Strip timing preferences")  # type: ignore
 
     def new_command_handler(self) -> RhubarbCommandWrapper:
-        return RhubarbCommandWrapper(self.executable_path, self.recognizer, self.use_extended_shapes)
+        cmd = RhubarbCommandWrapper(self.executable_path, self.recognizer, self.use_extended_shapes)
+        cmd.cache = self.new_cue_cache()
+        return cmd
 
     def draw(self, context: Context) -> None:
         layout: UILayout = self.layout
@@ -305,6 +379,25 @@ class RhubarbAddonPreferences(AddonPreferences):
         layout.prop(self, "recognizer")
 
         layout.prop(self, "use_extended_shapes")
+        layout.prop(self, "capture_concurrency")
+        row = layout.row(align=True)
+        row.prop(self, "split_long_sounds")
+        r = row.row(align=True)
+        r.enabled = self.split_long_sounds
+        r.prop(self, "split_min_duration")
+        row = layout.row(align=True)
+        row.prop(self, "stream_cues")
+        r = row.row(align=True)
+        r.enabled = self.stream_cues
+        r.prop(self, "stream_window_duration")
+        row = layout.row(align=True)
+        row.prop(self, "use_cache")
+        r = row.row(align=True)
+        r.enabled = self.use_cache
+        r.prop(self, "cache_max_size")
+        r.operator(rhubarb_operators.ClearCueCache.bl_idname, text="", icon="TRASH")
+        if self.use_cache:
+            layout.prop(self, "cache_folder")
         # layout.prop(self.cue_list_prefs, "highlight_long_cues")
         # layout.prop(self.cue_list_prefs, "highlight_short_cues")
 
@@ -1,13 +1,16 @@
 import logging
 import os
 import pathlib
-from typing import Any
+from typing import Any, Optional
 
 import bpy
+from bpy.props import EnumProperty
 from bpy.types import Context, Sound
 
-from ..rhubarb.rhubarb_command import RhubarbCommandAsyncJob
-from . import ui_utils
+from ..rhubarb.cue_cache import CueCache
+from ..rhubarb.rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandPool
+from ..rhubarb.segmented_capture import RhubarbSegmentedJob
+from . import sound_operators, ui_utils
 from .capture_properties import CaptureListProperties, CaptureProperties, JobProperties, MouthCueList
 from .preferences import RhubarbAddonPreferences
 
@@ -23,6 +26,32 @@ def rhubarcli_validation(context: Context) -> str:
     return ""
 
 
+def capture_validation(props: CaptureProperties) -> str:
+    """Checks whether the sound of the capture can be processed by the rhubarb executable"""
+    sound: Sound = props.sound
+    if not sound:
+        return "Capture has no sound selected"
+    if sound.packed_file:
+        return "Please unpack the sound first."
+    if not sound.filepath or not pathlib.Path(sound.filepath).exists():
+        return "Sound file doesn't exist. Try absolute the path instead"
+    if not props.is_sound_format_supported():
+        return "Unsupported file format"
+    return ""
+
+
+def find_dialog_file(props: CaptureProperties, snd_path: str) -> Optional[str]:
+    """The dialog file of the capture. Fall backs to a txt file with the same name as the sound file if exists."""
+    if props.dialog_file:
+        return ui_utils.to_abs_path(props.dialog_file)  # Could be relative to the blend file (//)
+    # Dialog file not specified, try txt file based on the sound file
+    dialog_file_path = os.path.splitext(snd_path)[0] + '.txt'
+    if os.path.exists(dialog_file_path):
+        log.info(f"Found dialog file {dialog_file_path}")
+        return dialog_file_path
+    return None
+
+
 class ProcessSoundFile(bpy.types.Operator):
     """Process the selected sound file using the rhubarb executable"""
 
@@ -35,7 +64,6 @@ class ProcessSoundFile(bpy.types.Operator):
     @classmethod
     def disabled_reason(cls, context: Context) -> str:
         props = CaptureListProperties.capture_from_context(context)
-        sound: Sound = props.sound
         # Use properties (binded to object) to check if already running.
         # This allows concurent running of the op provided each instance is linked to a different object
         jprops: JobProperties = props.job
@@ -45,12 +73,9 @@ class ProcessSoundFile(bpy.types.Operator):
         error_common = CaptureProperties.sound_selection_validation(context)
         if error_common:
             return error_common
-
-        if not sound.filepath or not pathlib.Path(sound.filepath).exists():
-            return "Sound file doesn't exist. Try absolute the path instead"
-
-        if not props.is_sound_format_supported():
-            return "Unsupported file format"
+        error_capture = capture_validation(props)
+        if error_capture:
+            return error_capture
         return rhubarcli_validation(context)
 
     @classmethod
@@ -73,7 +98,7 @@ class ProcessSoundFile(bpy.types.Operator):
         props = CaptureListProperties.capture_from_context(context)
         jprops: JobProperties = props.job
         lst: MouthCueList = props.cue_list
-        lst.items.clear()
+        lst.clear()
 
         sound: Sound = props.sound
         jprops.cancel_request = False  # Clear any (stalled)  cancel request states
@@ -82,15 +107,19 @@ class ProcessSoundFile(bpy.types.Operator):
 
         self.job = RhubarbCommandAsyncJob(cmd)
         snd_path = ui_utils.to_abs_path(sound.filepath)
-        dialog_file_path = props.dialog_file
-        if not dialog_file_path:  # Dialog file not specified, try txt file based on the sound file
-            dialog_file_path = os.path.splitext(snd_path)[0] + '.txt'
-            if os.path.exists(dialog_file_path):
-                log.info(f"Found dialog file {dialog_file_path}")
-            else:
-                dialog_file_path = None
-
-        cmd.lipsync_start(snd_path, dialog_file_path)
+        dialog_file_path = find_dialog_file(props, snd_path)
+
+        # Long sound can be split into multiple parallel processes
+        split = (prefs.split_long_sounds or prefs.stream_cues) and self.start_segmented(context, snd_path, dialog_file_path)
+        if not split:
+            cmd.lipsync_start(snd_path, dialog_file_path)
+        if cmd.from_cache:  # No need to run the process, fill the list straight away
+            cues = self.job.get_lipsync_output_cues()
+            lst.add_cues(cues)
+            jprops.update_from_async_job(self.job)
+            ProcessSoundFile.last_op = None
+            self.report({'INFO'}, f"Loaded {len(cues)} cues from the cache")
+            return {'FINISHED'}
         self.report({'INFO'}, "Started")
 
         wm = context.window_manager
@@ -103,6 +132,27 @@ class ProcessSoundFile(bpy.types.Operator):
         log.debug("Operator execute")
         return {'RUNNING_MODAL'}
 
+    def start_segmented(self, context: Context, snd_path: str, dialog_file_path: Optional[str]) -> bool:
+        """Starts the capture split at silences when the sound is long enough. Returns False if not split"""
+        prefs = RhubarbAddonPreferences.from_context(context)
+        try:
+            samples, rate = sound_operators.load_sound_samples(snd_path)
+        except Exception as e:
+            log.warning(f"Can't split the sound, failed to decode {snd_path}: {e}")
+            return False
+        duration = len(samples) / rate
+        window_len = 0.0
+        if prefs.stream_cues and duration >= 2 * prefs.stream_window_duration:
+            window_len = prefs.stream_window_duration  # Sequential windows, cues delivered as the windows finish
+        elif not prefs.split_long_sounds or duration < prefs.split_min_duration:
+            return False
+        if dialog_file_path:
+            log.warning(f"The dialog file {dialog_file_path} is ignored when the sound is split")
+        job = RhubarbSegmentedJob(prefs.new_command_handler, samples, rate, prefs.capture_concurrency, window_len=window_len)
+        job.lipsync_start()
+        self.job = job  # type: ignore
+        return True
+
     def running_props(self, context: Context) -> CaptureProperties:
         """Properties bound to capture when the operator has been started.
         Since the operator is modal (background) the selected capture can be changed while operator is still running
@@ -148,10 +198,11 @@ class ProcessSoundFile(bpy.types.Operator):
 
         try:
             progress = self.job.lipsync_check_progress_async()
-            if self.job.cmd.has_finished:
+            if self.job.has_finished:
                 self.report({'INFO'}, f"Capture @{self.capture_index} Done")
                 self.finished(context)
                 return {'FINISHED'}
+            self.deliver_cues(context)
 
         except Exception as e:
             self.report({'ERROR'}, str(e))
@@ -198,20 +249,210 @@ class ProcessSoundFile(bpy.types.Operator):
         if self.job:
             self.job.last_progress = 100
             self.update_progress(context)
-            self.job.join_threads()
-            self.job.cmd.close_process()
-            props = self.running_props(context)
-            if props:
-                lst: MouthCueList = props.cue_list
-                cues = self.job.get_lipsync_output_cues()
-                lst.add_cues(cues)
-                log.info(f"Added {len(cues)} cues to the list")
-                # Ensure  the mapping list is initialized. As it would be likely needed anyway
-                # mp: MappingProperties = props.mapping
-                # mp.build_items()
+            self.job.close()
+            self.deliver_cues(context)
+            # Ensure  the mapping list is initialized. As it would be likely needed anyway
+            # mp: MappingProperties = props.mapping
+            # mp.build_items()
 
             del self.job
 
+    def deliver_cues(self, context: Context) -> None:
+        """Appends the cues captured since the last call to the cue list. Cues of a split sound are delivered while the capture is still running"""
+        props = self.running_props(context)
+        if not props:
+            return
+        cues = self.job.take_new_cues()
+        if not cues:
+            return
+        lst: MouthCueList = props.cue_list
+        lst.add_cues(cues)
+        log.info(f"Added {len(cues)} cues to the list")
+
+
+class ProcessSoundFilesBatch(bpy.types.Operator):
+    """Process sound files of multiple captures using the rhubarb executable. Runs several rhubarb processes in parallel"""
+
+    bl_idname = "rhubarb.process_sound_files_batch"
+    bl_label = "Capture all"
+
+    captures_filter: EnumProperty(  # type: ignore
+        name="Captures",
+        items=[
+            ("EMPTY", "Without cues", "Only process captures which have no cues captured yet"),
+            ("ALL", "All", "Process all captures. Any existing cues are replaced"),
+        ],
+        default="EMPTY",
+    )
+
+    last_op = None  # To support unit tests. No good way to find running ops in Blender API
+
+    @staticmethod
+    def batch_capture_indices(context: Context, captures_filter: str) -> list[int]:
+        """Indices of the captures with valid sound setup and matching the filter"""
+        rootProps = CaptureListProperties.from_context(context)
+        if not rootProps:
+            return []
+        ret: list[int] = []
+        for i, props in enumerate(rootProps.items):
+            if props.job.running or capture_validation(props):
+                continue
+            if captures_filter == "EMPTY" and len(props.cue_list.items) > 0:
+                continue
+            ret.append(i)
+        return ret
+
+    @classmethod
+    def disabled_reason(cls, context: Context) -> str:
+        rootProps = CaptureListProperties.from_context(context)
+        if not rootProps or not rootProps.items:
+            return "No captures"
+        if rootProps.batch_job.running:
+            return "Already running"
+        if not ProcessSoundFilesBatch.batch_capture_indices(context, "ALL"):
+            return "No capture has a valid sound setup"
+        return rhubarcli_validation(context)
+
+    @classmethod
+    def poll(cls, context: Context) -> bool:
+        return ui_utils.validation_poll(cls, context)
+
+    def invoke(self, context: Context, event: bpy.types.Event) -> set[Any]:
+        rootProps = CaptureListProperties.from_context(context)
+        if self.captures_filter == "ALL" and any(len(props.cue_list.items) > 0 for props in rootProps.items):
+            # Some existing cues would be replaced, confirm first
+            wm = context.window_manager
+            return wm.invoke_confirm(self, event)
+        return self.execute(context)
+
+    def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
+        prefs = RhubarbAddonPreferences.from_context(context)
+        rootProps = CaptureListProperties.from_context(context)
+        indices = ProcessSoundFilesBatch.batch_capture_indices(context, self.captures_filter)
+        if not indices:
+            self.report({'WARNING'}, "No captures to process")
+            return {'CANCELLED'}
+        ProcessSoundFilesBatch.last_op = self  # type: ignore
+
+        self.pool: RhubarbCommandPool[int] = RhubarbCommandPool(prefs.capture_concurrency)
+        for i in indices:
+            props: CaptureProperties = rootProps.items[i]
+            props.cue_list.clear()
+            props.job.cancel_request = False
+            snd_path = ui_utils.to_abs_path(props.sound.filepath)
+            job = RhubarbCommandAsyncJob(prefs.new_command_handler())
+            self.pool.submit(i, job, snd_path, find_dialog_file(props, snd_path))
+
+        bjprops: JobProperties = rootProps.batch_job
+        bjprops.cancel_request = False
+        self.cancel_on_next = False
+        self.pool.start_pending()
+        self.report({'INFO'}, f"Started {len(indices)} captures, up to {self.pool.max_running} in parallel")
+
+        wm = context.window_manager
+        wm.modal_handler_add(self)
+        self.timer = wm.event_timer_add(0.2, window=context.window)
+        self.update_progress(context)
+        return {'RUNNING_MODAL'}
+
+    def capture_props(self, context: Context, index: int) -> Optional[CaptureProperties]:
+        """Capture by the index saved when the operator has been started. Could be gone since then"""
+        rootProps = CaptureListProperties.from_context(context)
+        if index < 0 or index >= len(rootProps.items):
+            return None
+        return rootProps.items[index]
+
+    def modal(self, context: Context, event: bpy.types.Event) -> set[str]:
+        bjprops: JobProperties = CaptureListProperties.from_context(context).batch_job
+        if event and event.type in {'ESC'} or bjprops.cancel_request:
+            bjprops.cancel_request = False
+            self.cancel_on_next = True
+            log.info("Received cancel request. Will cancel on next update")
+            self.report({'INFO'}, "Cancel")
+            bjprops.status = "Cancelling"
+            context.workspace.status_text_set_internal(None)
+            # Defere the actuall canceling to give Blender UI chance to update (show the Cancel report)
+            return {'PASS_THROUGH'}
+
+        if self.cancel_on_next:
+            log.info("Cancelling the batch capture")
+            unfinished = list(self.pool.running) + [key for key, _, _ in self.pool.pending]
+            self.pool.cancel()
+            for key in unfinished:
+                props = self.capture_props(context, key)
+                if props:
+                    props.job.update_from_async_job(self.pool.jobs[key])
+            self.finished(context)
+            return {'CANCELLED'}
+
+        if event and event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        for key in self.pool.check_progress():
+            self.capture_finished(context, key)
+        self.update_progress(context)
+
+        if self.pool.has_finished:
+            failed = self.pool.failed_count
+            if failed:
+                self.report({'WARNING'}, f"Batch capture done. {failed} of {len(self.pool.jobs)} captures failed")
+            else:
+                self.report({'INFO'}, f"Batch capture done. {len(self.pool.jobs)} captures processed")
+            self.finished(context)
+            return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+    def capture_finished(self, context: Context, index: int) -> None:
+        job = self.pool.jobs[index]
+        props = self.capture_props(context, index)
+        if not props:
+            log.error(f"Failed get the capture at index: '{index}'. Capture deleted?")
+            return
+        jprops: JobProperties = props.job
+        jprops.update_from_async_job(job)
+        if job.failed:
+            log.error(f"Capture @{index} failed: {jprops.error}")
+            return
+        cues = job.get_lipsync_output_cues()
+        lst: MouthCueList = props.cue_list
+        lst.add_cues(cues)
+        log.info(f"Capture @{index}: added {len(cues)} cues to the list")
+
+    def update_progress(self, context: Context) -> None:
+        for key, job in self.pool.running.items():
+            props = self.capture_props(context, key)
+            if props:
+                props.job.update_from_async_job(job)
+        bjprops: JobProperties = CaptureListProperties.from_context(context).batch_job
+        bjprops.update_from_pool(self.pool)
+        ui_utils.redraw_3dviews(context)
+
+    def finished(self, context: Context) -> None:
+        log.info("Batch operator finished")
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        del self.timer
+        ProcessSoundFilesBatch.last_op = None
+        bjprops: JobProperties = CaptureListProperties.from_context(context).batch_job
+        bjprops.update_from_pool(self.pool)
+        bjprops.progress = 100
+        ui_utils.redraw_3dviews(context)
+        del self.pool
+
+
+class ClearCueCache(bpy.types.Operator):
+    """Remove all the cached capture results"""
+
+    bl_idname = "rhubarb.clear_cue_cache"
+    bl_label = "Clear cache"
+
+    def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
+        prefs = RhubarbAddonPreferences.from_context(context)
+        cache = CueCache(prefs.cache_path, 0)
+        removed = cache.clear()
+        self.report({'INFO'}, f"Removed {removed} cached results")
+        return {'FINISHED'}
+
 
 class GetRhubarbExecutableVersion(bpy.types.Operator):
     """Run the rhubarb executable and collect the version info."""
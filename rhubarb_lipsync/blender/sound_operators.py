@@ -4,6 +4,7 @@ import traceback
 from typing import cast
 
 import bpy
+import numpy as np
 from bpy.props import BoolProperty, EnumProperty, IntProperty, StringProperty
 from bpy.types import Context, Sound
 
@@ -18,6 +19,7 @@ except ImportError as e:
     print("=" * 80)
     from . import aud_mock as aud
 
+from ..rhubarb.segmented_capture import read_wav
 from . import ui_utils
 from .capture_properties import CaptureListProperties, CaptureProperties
 from .preferences import RhubarbAddonPreferences
@@ -30,18 +32,27 @@ except ImportError:  # Fall back to old API
 
 log = logging.getLogger(__name__)
 
-# Limit the strip-search on the poll methods. When limit is reach the op would be enabled but fail on execution instead
-poll_search_limit = 50
 
+def load_sound_samples(sound_path: str) -> tuple[np.ndarray, int]:
+    """Decodes the sound file. Returns the samples mixed down to mono and the sample rate"""
+    if AUD_BROKEN:
+        if pathlib.Path(sound_path).suffix.lower() != ".wav":
+            raise RuntimeError(AUD_BROKEN)
+        return read_wav(sound_path)
+    asound = aud.Sound(sound_path)
+    rate = int(asound.specs[0])
+    data = asound.data()  # Shape: samples x channels
+    return data.mean(axis=1), rate
 
-def find_sound_strips_by_sound(context: Context, limit=0) -> list[Strip]:
+
+def find_sound_strips_by_sound(context: Context) -> list[Strip]:
     '''Finds sound strips which are using the selected sound.'''
     props = CaptureListProperties.capture_from_context(context)
     sound: Sound = props.sound
     if not sound:
         return []
 
-    return ui_utils.find_sound_strips_by_sound(context, sound, limit)
+    return ui_utils.find_sound_strips_by_sound(context, sound)
 
 
 def find_sounds_by_path(sound_path: str) -> list[Sound]:
@@ -72,11 +83,11 @@ class CreateSoundStripWithSound(bpy.types.Operator):
     )
 
     @classmethod
-    def disabled_reason(cls, context: Context, limit=poll_search_limit) -> str:
+    def disabled_reason(cls, context: Context) -> str:
         error_common = CaptureProperties.sound_selection_validation(context, False)
         if error_common:
             return error_common
-        strip = find_sound_strips_by_sound(context, limit)
+        strip = find_sound_strips_by_sound(context)
         if strip:
             return f"Already placed on a strip on the channel {strip[0].channel} at frame {strip[0].frame_start}."
         return ""
@@ -95,8 +106,7 @@ class CreateSoundStripWithSound(bpy.types.Operator):
         return wm.invoke_props_dialog(self, width=500)
 
     def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
-        # Run validation again, without the limit this time
-        error = CreateSoundStripWithSound.disabled_reason(context, 0)
+        error = CreateSoundStripWithSound.disabled_reason(context)
         if error:
             self.report({"ERROR"}, error)
             return {'CANCELLED'}
@@ -116,6 +126,7 @@ class CreateSoundStripWithSound(bpy.types.Operator):
         # https://stackoverflow.com/questions/53215355/whit-python-in-blender-insert-an-effect-strip-as-wipe-in-the-video-sequence-edi
         strips_coll = ui_utils.get_strips_from_sequence_editor(context)
         strips_coll.new_sound(sound.name_full, sound.filepath, self.channel, self.start_frame)
+        ui_utils.SoundStripIndex.invalidate()
 
         # The above op always create a new sound, even when there is the same one already imported. But only in Blender <=v5.0, probably a bug
         # Find the newly created strip and change its sound back to the selected one
@@ -131,6 +142,7 @@ class CreateSoundStripWithSound(bpy.types.Operator):
 
         # Set to the current sound instead. This would leave the newly created copy with 0 users.
         strip.sound = sound
+        ui_utils.SoundStripIndex.invalidate()
         strip.show_waveform = self.show_waveform
         if self.enlarge_endframe:
             if context.scene.frame_end < strip.frame_final_end:
@@ -158,11 +170,11 @@ class RemoveSoundStripWithSound(bpy.types.Operator):
     bl_options = {'UNDO', 'REGISTER'}
 
     @classmethod
-    def disabled_reason(cls, context: Context, limit=poll_search_limit) -> str:
+    def disabled_reason(cls, context: Context) -> str:
         error_common = CaptureProperties.sound_selection_validation(context, False)
         if error_common:
             return error_common
-        strip = find_sound_strips_by_sound(context, limit)
+        strip = find_sound_strips_by_sound(context)
         if not strip:
             return "No strip using the current sound found."
         return ""
@@ -172,7 +184,7 @@ class RemoveSoundStripWithSound(bpy.types.Operator):
         return ui_utils.validation_poll(cls, context)
 
     def execute(self, context: Context) -> ui_utils.OperatorReturnSet:
-        error = self.disabled_reason(context, 0)  # Run validation again, without the limit this time
+        error = self.disabled_reason(context)
         if error:
             self.report({"ERROR"}, error)
             return {'CANCELLED'}
@@ -186,6 +198,7 @@ class RemoveSoundStripWithSound(bpy.types.Operator):
             return {'CANCELLED'}
         strips_coll = ui_utils.get_strips_from_sequence_editor(context)
         strips_coll.remove(strips[0])
+        ui_utils.SoundStripIndex.invalidate()
         return {'FINISHED'}
 
 
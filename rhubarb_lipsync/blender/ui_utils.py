@@ -1,7 +1,8 @@
 import logging
+import os
 import pathlib
 import traceback
-from typing import Any, Callable, Iterator, Literal, Type
+from typing import Any, Callable, ClassVar, Iterator, Literal, Type
 
 import bpy
 import bpy.utils.previews
@@ -198,26 +199,70 @@ def get_strips_from_sequence_editor(context: Context) -> bpy_prop_collection:
     return seq_editor.strips  # type: ignore
 
 
-def find_sound_strips_by_sound(context: Context, sound: Sound, limit=0) -> list[Strip]:
-    '''Finds sound strips which are using the specified sound.'''
-    ret: list[Strip] = []
+class SoundStripIndex:
+    """Sound strips of the sequencer indexed by the Sound and by the normalized absolute path of the sound file.
+    Rebuilt lazily on the first lookup after the sequencer has changed. The `DepsgraphHandler` invalidates it on every Scene update,
+    and the number of strips is checked too in case the index is used before the depsgraph update arrives."""
+
+    scene_ptr: ClassVar[int] = 0
+    strip_count: ClassVar[int] = -1  # -1 when invalidated
+    # Sound session_uid -> strips
+    by_sound: ClassVar[dict[int, list[Strip]]] = {}
+    # Normalized path -> (strip, Sound session_uid)
+    by_path: ClassVar[dict[str, list[tuple[Strip, int]]]] = {}
+    # Memo of the normalized paths, valid for the `blend_filepath` only (relative paths are based on the blend file location)
+    normalized_paths: ClassVar[dict[str, str]] = {}
+    blend_filepath: ClassVar[str] = ""
+
+    @staticmethod
+    def normalized_path(filepath: str) -> str:
+        if SoundStripIndex.blend_filepath != bpy.data.filepath:
+            SoundStripIndex.normalized_paths.clear()
+            SoundStripIndex.blend_filepath = bpy.data.filepath
+        ret = SoundStripIndex.normalized_paths.get(filepath)
+        if ret is None:
+            ret = SoundStripIndex.normalized_paths[filepath] = os.path.normcase(os.path.normpath(bpy.path.abspath(filepath)))
+        return ret
+
+    @staticmethod
+    def invalidate() -> None:
+        SoundStripIndex.strip_count = -1
+
+    @staticmethod
+    def ensure(context: Context) -> None:
+        if not context.scene.sequence_editor:
+            SoundStripIndex.invalidate()
+            SoundStripIndex.by_sound, SoundStripIndex.by_path = {}, {}
+            return
+        strips = get_strips_from_sequence_editor(context)
+        scene_ptr = context.scene.as_pointer()
+        if SoundStripIndex.scene_ptr == scene_ptr and SoundStripIndex.strip_count == len(strips):
+            return  # Up to date
+        by_sound: dict[int, list[Strip]] = {}
+        by_path: dict[str, list[tuple[Strip, int]]] = {}
+        for sq in strips:
+            snd = getattr(sq, "sound", None)
+            if snd is None:
+                continue  # Not a sound strip or an empty strip
+            by_sound.setdefault(snd.session_uid, []).append(sq)
+            by_path.setdefault(SoundStripIndex.normalized_path(snd.filepath), []).append((sq, snd.session_uid))
+        SoundStripIndex.by_sound, SoundStripIndex.by_path = by_sound, by_path
+        SoundStripIndex.scene_ptr, SoundStripIndex.strip_count = scene_ptr, len(strips)
+
+    @staticmethod
+    def find(context: Context, sound: Sound) -> list[Strip]:
+        """Strips using the sound first, followed by the strips using a different Sound of the same file"""
+        if not sound:
+            return []
+        SoundStripIndex.ensure(context)
+        ret = list(SoundStripIndex.by_sound.get(sound.session_uid, []))
+        same_file = SoundStripIndex.by_path.get(SoundStripIndex.normalized_path(sound.filepath), [])
+        ret += [sq for sq, uid in same_file if uid != sound.session_uid]
+        return ret
+
+
+def find_sound_strips_by_sound(context: Context, sound: Sound) -> list[Strip]:
+    """Finds sound strips which are using the specified sound."""
     if not sound or not context.scene.sequence_editor:
         return []
-
-    seq_editor = context.scene.sequence_editor
-
-    for i, sq in enumerate(get_strips_from_sequence_editor(context)):
-        if limit > 0 and i > limit:
-            break  # Limit reached, break the search (for performance reasons)
-        if not hasattr(sq, "sound"):
-            continue  # Not a sound strip
-        ssq: Strip = sq
-        foundSnd = ssq.sound
-        if foundSnd is None:
-            continue  # An empty strip
-        if sound == foundSnd:
-            ret.insert(0, ssq)  # At the top, priority
-            continue
-        if bpy.path.abspath(sound.filepath) == bpy.path.abspath(foundSnd.filepath):
-            ret.append(ssq)  # Match by name, append to end
-    return ret
+    return SoundStripIndex.find(context, sound)
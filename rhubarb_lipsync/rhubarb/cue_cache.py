@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import pathlib
+import struct
+from typing import Iterable, Optional
+
+from .mouth_cues import MouthCue
+from .mouth_shape_info import MouthShapeInfos
+
+log = logging.getLogger(__name__)
+
+
+class CueCache:
+    """Persistent (on-disk) cache of the captured cues. The cache is content-addressed, the key is a hash of the sound file content
+    and all the inputs affecting the rhubarb output. So re-capturing an unchanged sound file doesn't need to run the recognition again.
+    Each entry is stored in a separate file. The least recently used entries are removed when the cache size exceeds the limit."""
+
+    file_suffix = ".cues"
+    header = b"RLPSCUE1"
+    record = struct.Struct("<Bdd")  # Key index, start, end
+
+    # Digests of the already hashed files, keyed by the file path, size and modification time
+    file_digests: dict[tuple[str, int, int], str] = {}
+
+    def __init__(self, folder: pathlib.Path, max_size_bytes: int) -> None:
+        self.folder = folder
+        self.max_size_bytes = max_size_bytes
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        """Sha256 of the file content. Memoized as long as the file size and modification time don't change"""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = CueCache.file_digests.get(memo_key)
+        if digest:
+            return digest
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        CueCache.file_digests[memo_key] = digest
+        return digest
+
+    @staticmethod
+    def build_key(input_file: str, dialog_file: Optional[str], options: Iterable[str]) -> str:
+        """Cache key for the given sound file, dialog file and the command line options"""
+        h = hashlib.sha256()
+        h.update(CueCache.file_digest(input_file).encode())
+        h.update(b"\0")
+        if dialog_file:
+            h.update(CueCache.file_digest(dialog_file).encode())
+        h.update(b"\0")
+        for o in options:
+            h.update(str(o).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    @staticmethod
+    def serialize(cues: list[MouthCue]) -> bytes:
+        rec = CueCache.record
+        body = b"".join(rec.pack(c.key_index, c.start, c.end) for c in cues)
+        return CueCache.header + struct.pack("<I", len(cues)) + body
+
+    @staticmethod
+    def deserialize(data: bytes) -> list[MouthCue]:
+        hl = len(CueCache.header)
+        if data[:hl] != CueCache.header:
+            raise ValueError("Not a cue cache file")
+        (count,) = struct.unpack_from("<I", data, hl)
+        rec = CueCache.record
+        body = memoryview(data)[hl + 4 :]
+        if len(body) != count * rec.size:
+            raise ValueError(f"Corrupted cue cache file. Expected {count} cues")
+        return [MouthCue(MouthShapeInfos.index2Info(k).key, s, e) for k, s, e in rec.iter_unpack(body)]
+
+    def entry_path(self, key: str) -> pathlib.Path:
+        return self.folder / f"{key}{CueCache.file_suffix}"
+
+    def get(self, key: str) -> Optional[list[MouthCue]]:
+        """Cached cues for the key or None when not cached"""
+        p = self.entry_path(key)
+        try:
+            cues = CueCache.deserialize(p.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Failed to read the cache entry {p}: {e}")
+            return None
+        try:
+            os.utime(p)  # Mark as recently used
+        except OSError:
+            pass
+        log.debug(f"Cache hit {p.name} ({len(cues)} cues)")
+        return cues
+
+    def put(self, key: str, cues: list[MouthCue]) -> None:
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            p = self.entry_path(key)
+            tmp = p.with_suffix(".tmp")
+            tmp.write_bytes(CueCache.serialize(cues))
+            os.replace(tmp, p)  # Atomic, so a concurrent reader never sees a partial file
+            log.debug(f"Cached {len(cues)} cues to {p.name}")
+        except OSError as e:
+            log.warning(f"Failed to store cues in the cache folder {self.folder}: {e}")
+            return
+        self.evict()
+
+    def entries(self) -> list[os.DirEntry]:
+        if not self.folder.is_dir():
+            return []
+        return [e for e in os.scandir(self.folder) if e.is_file() and e.name.endswith(CueCache.file_suffix)]
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(e.stat().st_size for e in self.entries())
+
+    def evict(self) -> int:
+        """Removes the least recently used entries while the cache is over the size limit. Returns number of entries removed"""
+        entries = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in self.entries()]
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning(f"Failed to remove the cache entry {path}: {e}")
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            log.debug(f"Evicted {removed} cache entries")
+        return removed
+
+    def clear(self) -> int:
+        """Removes all the entries. Returns number of entries removed"""
+        entries = self.entries()
+        for e in entries:
+            os.remove(e.path)
+        return len(entries)
@@ -0,0 +1,108 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .cue_table import CueTable
+from .mouth_shape_info import MouthShapeInfos
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CueFilterQuery:
+    """Which cues to show. All the set criteria have to match. Hashable, so the query result can be cached"""
+
+    keys: Optional[frozenset[str]] = None  # Only cues with one of these keys
+    time_from: Optional[float] = None  # Only cues overlapping the time range (seconds)
+    time_to: Optional[float] = None
+    only_suspicious: bool = False  # Only the too long/short cues, same as the highlighted in the cue list. Silence is never suspicious
+    highlight_long: float = -1  # Longer cues are suspicious, unless negative
+    highlight_short: float = -1  # Shorter (or equally long) cues are suspicious, unless negative
+
+    @property
+    def is_empty(self) -> bool:
+        return self.keys is None and self.time_from is None and self.time_to is None and not self.only_suspicious
+
+
+class CueFilterIndex:
+    """Index of the cue list for the fast filtering. The cues are indexed by the key and by the duration, the time range is looked-up
+    by bisecting the starts/ends. So a query takes time proportional to the number of matching cues instead of the list length.
+    The cues are expected to be chronological and not overlapping (as captured)"""
+
+    def __init__(self, table: CueTable) -> None:
+        self.count = len(table)
+        self.keys = table.keys
+        self.starts = table.starts
+        self.ends = table.ends
+        self.durations = table.durations
+        # Index of the cues of each key
+        self.by_key = [np.flatnonzero(table.keys == i) for i in range(len(MouthShapeInfos.all()))]
+        # Cue indexes ordered by the duration, the durations of any range can be found by bisecting the `sorted_durations`
+        self.duration_order = np.argsort(self.durations, kind="stable")
+        self.sorted_durations = self.durations[self.duration_order]
+        self.silence_index = MouthShapeInfos.key2index(MouthShapeInfos.X.value.key)
+
+    def key_indexes(self, keys: frozenset[str]) -> np.ndarray:
+        return np.array(sorted(MouthShapeInfos.key2index(k) for k in keys), dtype=np.int8)
+
+    def with_keys(self, keys: frozenset[str]) -> np.ndarray:
+        """Indexes of the cues with any of the keys"""
+        parts = [self.by_key[i] for i in self.key_indexes(keys)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def time_range(self, time_from: Optional[float], time_to: Optional[float]) -> tuple[int, int]:
+        """The (start, end) slice of the cues overlapping the time range"""
+        lo = 0 if time_from is None else int(np.searchsorted(self.ends, time_from, side="right"))
+        hi = self.count if time_to is None else int(np.searchsorted(self.starts, time_to, side="left"))
+        return lo, max(lo, hi)
+
+    def suspicious(self, highlight_long: float, highlight_short: float) -> np.ndarray:
+        """Indexes of the too long/short cues, silence excluded"""
+        parts = []
+        if highlight_short >= 0:
+            parts.append(self.duration_order[: np.searchsorted(self.sorted_durations, highlight_short, side="right")])
+        if highlight_long > 0:
+            parts.append(self.duration_order[np.searchsorted(self.sorted_durations, highlight_long, side="right") :])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        ret = np.unique(np.concatenate(parts))  # Sorted. Can overlap when the thresholds are inverted
+        return ret[self.keys[ret] != self.silence_index]
+
+    def query(self, q: CueFilterQuery) -> np.ndarray:
+        """Sorted indexes of the cues matching the query"""
+        lo, hi = self.time_range(q.time_from, q.time_to)
+        if q.keys is None and not q.only_suspicious:
+            return np.arange(lo, hi)
+        if q.keys is None:
+            ret = self.suspicious(q.highlight_long, q.highlight_short)
+        elif not q.only_suspicious:
+            ret = self.with_keys(q.keys)
+        else:  # Start with the cues of the keys when they are less and check the duration only on those (or the other way around)
+            key_indexes = self.key_indexes(q.keys)
+            key_count = sum(len(self.by_key[i]) for i in key_indexes)
+            suspicious = self.suspicious(q.highlight_long, q.highlight_short)
+            if key_count <= len(suspicious):
+                ret = self.with_keys(q.keys)
+                ret = ret[self.suspicious_mask(ret, q.highlight_long, q.highlight_short)]
+            else:
+                ret = suspicious[np.isin(self.keys[suspicious], key_indexes)]
+        return ret[np.searchsorted(ret, lo) : np.searchsorted(ret, hi)]  # Sorted, the time range is a slice
+
+    def suspicious_mask(self, indexes: np.ndarray, highlight_long: float, highlight_short: float) -> np.ndarray:
+        d = self.durations[indexes]
+        ret = np.zeros(len(indexes), dtype=bool)
+        if highlight_long > 0:
+            ret |= d > highlight_long
+        if highlight_short >= 0:
+            ret |= d <= highlight_short
+        return ret & (self.keys[indexes] != self.silence_index)
+
+    def flags(self, q: CueFilterQuery, flag: int) -> list[int]:
+        """The UIList filter flags of all the cues. The `flag` is set on the matching cues"""
+        ret = np.zeros(self.count, dtype=np.int64)
+        ret[self.query(q)] = flag
+        return ret.tolist()
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import pathlib
+import struct
+from typing import Iterator, Optional, Sequence, TextIO
+
+import numpy as np
+
+from .cue_table import CueTable
+from .mouth_cues import FrameConfig, MouthCue
+from .mouth_shape_info import MouthShapeInfos
+from .rhubarb_command import RhubarbParser
+
+log = logging.getLogger(__name__)
+
+
+def iter_json_cues(f: TextIO, chunk_size: int = 64 * 1024) -> Iterator[MouthCue]:
+    """Parses the `mouthCues` of the rhubarb-cli json while reading the file in chunks. So the whole document is never in memory.
+    Everything but the `mouthCues` array (the metadata) is skipped"""
+    buf = ""
+    # Skip up to the start of the mouthCues array
+    while True:
+        key = buf.find('"mouthCues"')
+        array_start = buf.find("[", key) if key >= 0 else -1
+        if array_start >= 0:
+            pos = array_start + 1
+            break
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return  # No cues in the file
+        buf = buf[-len('"mouthCues"') :] + chunk if key < 0 else buf + chunk
+
+    # The cue objects are flat (no nested objects and no brackets in the values). So all the complete cues of the buffer are those up to
+    # the last closing brace. Those are parsed at once, as a json array
+    while True:
+        array_end = buf.find("]", pos)
+        last = array_end if array_end >= 0 else buf.rfind("}", pos) + 1
+        complete = buf[pos:last].strip(" \t\r\n,")
+        if complete:
+            for cue_json in json.loads(f"[{complete}]"):
+                yield MouthCue.of_json(cue_json)
+        if array_end >= 0:
+            return
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ValueError("Unexpected end of the json file. The mouthCues array is not closed")
+        # Drop the already parsed part of the buffer
+        buf = buf[max(pos, last) :] + chunk
+        pos = 0
+
+
+def write_json_cues(f: TextIO, cues: Sequence[MouthCue], sound_file="export.ogg", version: Optional[str] = None) -> int:
+    """Writes the cues cue by cue in the rhubarb-cli json format. The output is identical to the `RhubarbParser.unparse_mouth_cues`
+    but the document is never built in memory. Returns number of characters written"""
+    meta = RhubarbParser.lipsync_json_metadata(sound_file, cues[-1].end if cues else 0, version)
+    head = json.dumps(meta, indent=2)
+    if not cues:
+        return f.write(head)
+    written = f.write(head[:-2])  # Without the closing bracket
+    written += f.write(',\n  "mouthCues": [')
+    sep = "\n"
+    for c in cues:
+        # Same as the json.dumps(c.to_json(), indent=2) indented by 4 spaces. The keys are plain letters, no escaping needed
+        written += f.write(f'{sep}    {{\n      "start": "{c.start:.2f}",\n      "end": "{c.end:.2f}",\n      "value": "{c.key}"\n    }}')
+        sep = ",\n"
+    written += f.write("\n  ]\n}")
+    return written
+
+
+class CueBinary:
+    """Compact binary cue list container: a small header followed by a fixed-width record array (key index, float32 start and end).
+    About 9 bytes per cue and it can be read memory-mapped, without any parsing.
+    The float32 times are rounded to 0.1ms when read, exact enough for sounds up to tens of minutes long"""
+
+    file_suffix = ".rlpscues"
+    magic = b"RLPSCUB1"
+    header = struct.Struct("<8sI")  # Magic, number of cues
+    record = np.dtype([("key", "u1"), ("start", "<f4"), ("end", "<f4")])  # Packed, no alignment
+    time_decimals = 4
+
+    @staticmethod
+    def write(path: pathlib.Path, keys: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        records = np.empty(len(keys), dtype=CueBinary.record)
+        records["key"], records["start"], records["end"] = keys, starts, ends
+        with open(path, "wb") as f:
+            f.write(CueBinary.header.pack(CueBinary.magic, len(records)))
+            records.tofile(f)
+
+    @staticmethod
+    def write_table(path: pathlib.Path, table: CueTable) -> None:
+        CueBinary.write(path, table.keys, table.starts, table.ends)
+
+    @staticmethod
+    def write_cues(path: pathlib.Path, cues: Sequence[MouthCue]) -> None:
+        CueBinary.write_table(path, CueTable.from_cues(FrameConfig(1), cues))
+
+    @staticmethod
+    def read_columns(path: pathlib.Path) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Memory-maps the file and returns the key indexes, the starts and the ends"""
+        with open(path, "rb") as f:
+            head = f.read(CueBinary.header.size)
+        if len(head) < CueBinary.header.size:
+            raise ValueError(f"Not a binary cue file: {path}")
+        magic, count = CueBinary.header.unpack(head)
+        if magic != CueBinary.magic:
+            raise ValueError(f"Not a binary cue file: {path}")
+        expected_size = CueBinary.header.size + count * CueBinary.record.itemsize
+        if os.path.getsize(path) != expected_size:
+            raise ValueError(f"Corrupted binary cue file {path}. Expected {count} cues")
+        if not count:
+            return np.empty(0, dtype=np.int8), np.empty(0), np.empty(0)
+        records = np.memmap(path, dtype=CueBinary.record, mode="r", offset=CueBinary.header.size, shape=(count,))
+        try:
+            if records["key"].max() >= len(MouthShapeInfos.all()):  # Checked before the cast, bytes >= 128 would wrap to negative int8
+                raise ValueError(f"Corrupted binary cue file {path}. Invalid mouth shape key")
+            keys = records["key"].astype(np.int8)
+            d = CueBinary.time_decimals
+            starts = np.round(records["start"].astype(np.float64), d)
+            ends = np.round(records["end"].astype(np.float64), d)
+        finally:
+            del records  # Copied already, release the mapping
+        return keys, starts, ends
+
+    @staticmethod
+    def read_table(path: pathlib.Path, frame_cfg: FrameConfig) -> CueTable:
+        return CueTable(frame_cfg, *CueBinary.read_columns(path))
+
+    @staticmethod
+    def read_cues(path: pathlib.Path) -> list[MouthCue]:
+        return CueBinary.read_table(path, FrameConfig(1)).to_cues()
+
+    @staticmethod
+    def is_binary_path(path: str) -> bool:
+        return str(path).lower().endswith(CueBinary.file_suffix)
@@ -1,8 +1,12 @@
 from dataclasses import dataclass, field
-from typing import Callable, Iterable, Optional
+from typing import Callable, ClassVar, Iterable, Optional
 
+from .cue_table import CueTable
 from .mouth_cues import FrameConfig, MouthCueFrames, frame2time, log, time2frame_float
 
+# Optimization step signature: (processor, table, max_cue_duration) => (new table, number of cues changed)
+OptimizationStep = Callable[["CueProcessor", CueTable, float], tuple[CueTable, int]]
+
 
 @dataclass
 class CueProcessor:
@@ -12,6 +16,7 @@ class CueProcessor:
     cue_frames: list[MouthCueFrames] = field(repr=False)
     trim_tolerance: float = 0.05
     use_extended_shapes: bool = True
+    optimization_steps: ClassVar[list[tuple[str, OptimizationStep]]] = []  # Registered by the `optimization_step` decorator
 
     # @docstring_from(frame2time)  # type: ignore[misc]
     def frame2time(self, frame: float) -> float:
@@ -74,70 +79,75 @@ class CueProcessor:
                 continue
             yield i, cf
 
-    def trim_long_cues(self, max_dur: float, append_x: bool = True) -> int:
-        modified = 0
-        for i, cf in self.find_cues_by_duration(-1, max_dur, self.trim_tolerance):
-            modified += 1
-            new_end = cf.cue.start + max_dur
-            if append_x:
-                cf_silence = self.create_silence_cue(new_end, cf.cue.end)
-                # Insert the new X after the current trimmed X, encountering previous insertions as they shift the indices
-                self.cue_frames.insert(i + modified, cf_silence)
-            cf.cue.end = new_end  # Trim duration
+    @property
+    def table(self) -> CueTable:
+        """Columnar copy of the cues for the vectorized processing"""
+        return CueTable.from_cue_frames(self.frame_cfg, self.cue_frames)
 
+    @table.setter
+    def table(self, table: CueTable) -> None:
+        self.cue_frames = table.to_cue_frames()
+
+    def trim_long_cues(self, max_dur: float, append_x: bool = True) -> int:
+        table, modified = self.table.trim_long_cues(max_dur, self.trim_tolerance, append_x, self.use_extended_shapes)
         if modified > 0:
+            self.table = table
             log.info(f"Trimmed {modified} Cues as they were too long.")
         return modified
 
     def merge_double_x(self) -> int:
-        modified = 0
-        orig_list = list(self.cue_frames)
-        for i, cf in enumerate(orig_list):
-            if i <= 0:
-                continue
-            if not self.is_cue_silence(cf):
-                continue
-            prev_cue = orig_list[i - 1]
-            if not self.is_cue_silence(prev_cue):
-                continue
-            prev_cue.cue.end = cf.cue.end  # Prolong prev X end up to this X end
-            removed = self.cue_frames.pop(i - modified)  # Remove the current X
-            assert removed == cf
-            modified += 1
-            prev_cue = cf
-
+        table, modified = self.table.merge_double_x(self.use_extended_shapes)
         if modified > 0:
+            self.table = table
             log.info(f"Removed {modified} X-Cues as they duplicate.")
         return modified
 
     def ensure_frame_intersection(self) -> int:
         """Finds extremely short cues where there is no intersection with a frame and move either start or end to the closest frame time"""
-        modified = 0
-        for cf in self.cue_frames:
-            if cf.intersects_frame:
-                continue
-            # Cue is in the middle of two frames, find which end is closer to a frame
-            d_start = cf.start_frame_float - cf.start_frame_left
-            d_end = cf.end_frame_right - cf.end_frame_float
-            assert d_start > 0 and d_end > 0
-            if d_start < d_end:  # Start is closer, expand the cue start to the left
-                cf.cue.start = self.frame2time(cf.start_frame_left)
-            else:  # End is closer, expand the cue end to the right
-                cf.cue.end = self.frame2time(cf.end_frame_right)
-            modified += 1
+        table, modified = self.table.ensure_frame_intersection()
         if modified > 0:
+            self.table = table
             log.info(f"Prolonged {modified} Cues as they were too short and would not have been visible.")
         return modified
 
-    def optimize_cues(self, max_cue_duration=0.2) -> str:
-        steps: list[tuple[Callable[[], int], str]] = [
-            (lambda: self.trim_long_cues(max_cue_duration), "ends trimmed"),
-            (self.ensure_frame_intersection, "duration enlarged"),
-            (self.merge_double_x, "double X removed"),
-        ]
+    @staticmethod
+    def optimization_step(label: str) -> Callable[[OptimizationStep], OptimizationStep]:
+        """Decorator registering a function as a step of the `optimize_cues`. The steps run in the registration order.
+        Each step gets the table produced by the previous one and returns the new table and the number of cues it changed"""
+
+        def register(step: OptimizationStep) -> OptimizationStep:
+            CueProcessor.optimization_steps.append((label, step))
+            return step
+
+        return register
+
+    def optimize_table(self, table: CueTable, max_cue_duration=0.2, steps: Optional[list[tuple[str, OptimizationStep]]] = None) -> tuple[CueTable, str]:
+        """Runs the optimization steps (all the registered by default) on the table. Returns the final table and the report"""
         report = ""
-        for s in steps:
-            count = s[0]()
+        for label, step in CueProcessor.optimization_steps if steps is None else steps:
+            table, count = step(self, table, max_cue_duration)
             if count > 0:
-                report += f" {s[1]}: {count}"
+                report += f" {label}: {count}"
+        return table, report
+
+    def optimize_cues(self, max_cue_duration=0.2, steps: Optional[list[tuple[str, OptimizationStep]]] = None) -> str:
+        # All the steps run on a single table, the cue list is rebuilt only once at the end
+        table, report = self.optimize_table(self.table, max_cue_duration, steps)
+        if report:
+            self.table = table
         return report
+
+
+@CueProcessor.optimization_step("ends trimmed")
+def trim_long_cues_step(cp: CueProcessor, table: CueTable, max_cue_duration: float) -> tuple[CueTable, int]:
+    return table.trim_long_cues(max_cue_duration, cp.trim_tolerance, True, cp.use_extended_shapes)
+
+
+@CueProcessor.optimization_step("duration enlarged")
+def ensure_frame_intersection_step(cp: CueProcessor, table: CueTable, max_cue_duration: float) -> tuple[CueTable, int]:
+    return table.ensure_frame_intersection()
+
+
+@CueProcessor.optimization_step("double X removed")
+def merge_double_x_step(cp: CueProcessor, table: CueTable, max_cue_duration: float) -> tuple[CueTable, int]:
+    return table.merge_double_x(cp.use_extended_shapes)
@@ -0,0 +1,184 @@
+from typing import Iterable
+
+import numpy as np
+
+from .mouth_cues import FrameConfig, MouthCue, MouthCueFrames
+from .mouth_shape_info import MouthShapeInfos
+
+
+class CueTable:
+    """Columnar (array per field) representation of a cue list. The frame conversions and the optimization passes are computed
+    as whole-array operations instead of per-cue object access. Mirrors the `MouthCueFrames` frame properties.
+    The passes don't modify the table, they return a new one."""
+
+    def __init__(self, frame_cfg: FrameConfig, keys: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        assert len(keys) == len(starts) == len(ends)
+        self.frame_cfg = frame_cfg
+        self.keys = np.asarray(keys, dtype=np.int8)  # Mouth shape key index. See the `MouthShapeInfos.key2index`
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+
+    @staticmethod
+    def from_cues(frame_cfg: FrameConfig, cues: Iterable[MouthCue]) -> "CueTable":
+        cues = list(cues)
+        n = len(cues)
+        # Plain dict lookup, much faster than the `key_index` (cached) property on a fresh cue
+        index_by_key = {info.key: i for i, info in enumerate(MouthShapeInfos.all())}
+        x_index = MouthShapeInfos.key2index(MouthShapeInfos.X.value.key)  # Unknown keys are treated as X
+        keys = np.fromiter((index_by_key.get(c.key, x_index) for c in cues), dtype=np.int8, count=n)
+        starts = np.fromiter((c.start for c in cues), dtype=np.float64, count=n)
+        ends = np.fromiter((c.end for c in cues), dtype=np.float64, count=n)
+        return CueTable(frame_cfg, keys, starts, ends)
+
+    @staticmethod
+    def from_cue_frames(frame_cfg: FrameConfig, cue_frames: Iterable[MouthCueFrames]) -> "CueTable":
+        return CueTable.from_cues(frame_cfg, (cf.cue for cf in cue_frames))
+
+    def to_cues(self) -> list[MouthCue]:
+        infos = MouthShapeInfos.all()
+        return [MouthCue(infos[k].key, s, e) for k, s, e in zip(self.keys.tolist(), self.starts.tolist(), self.ends.tolist())]
+
+    def to_cue_frames(self) -> list[MouthCueFrames]:
+        return [MouthCueFrames(c, self.frame_cfg) for c in self.to_cues()]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def with_columns(self, keys: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> "CueTable":
+        return CueTable(self.frame_cfg, keys, starts, ends)
+
+    # Frame conversions. Same semantic as the `time2frame_*` functions and the `MouthCueFrames` properties
+
+    def time2frame_float(self, times: np.ndarray) -> np.ndarray:
+        c = self.frame_cfg
+        assert c.fps > 0 and c.fps_base > 0, f"Can't convert to frame when fps is {c.fps}/{c.fps_base}"
+        return np.round(times * c.fps / c.fps_base, 7) + c.offset
+
+    def frame2time(self, frames: np.ndarray) -> np.ndarray:
+        c = self.frame_cfg
+        return (frames - c.offset) * c.fps_base / c.fps
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    @property
+    def start_frame_float(self) -> np.ndarray:
+        return self.time2frame_float(self.starts)
+
+    @property
+    def end_frame_float(self) -> np.ndarray:
+        return self.time2frame_float(self.ends)
+
+    @property
+    def start_frame(self) -> np.ndarray:
+        """Closest whole frame of the cue start. Ties rounded to even same as the python `round`"""
+        return np.rint(self.start_frame_float).astype(np.int64)
+
+    @property
+    def end_frame(self) -> np.ndarray:
+        return np.rint(self.end_frame_float).astype(np.int64)
+
+    @property
+    def start_frame_left(self) -> np.ndarray:
+        return np.floor(self.start_frame_float).astype(np.int64)
+
+    @property
+    def start_frame_right(self) -> np.ndarray:
+        return np.ceil(self.start_frame_float).astype(np.int64)
+
+    @property
+    def end_frame_left(self) -> np.ndarray:
+        return np.floor(self.end_frame_float).astype(np.int64)
+
+    @property
+    def end_frame_right(self) -> np.ndarray:
+        return np.ceil(self.end_frame_float).astype(np.int64)
+
+    @property
+    def start_subframe(self) -> tuple[np.ndarray, np.ndarray]:
+        """Whole frames and the decimal parts of the exact start frames"""
+        f, i = np.modf(self.start_frame_float)
+        return i.astype(np.int64), f
+
+    @property
+    def intersects_frame(self) -> np.ndarray:
+        return self.end_frame_left - self.start_frame_right >= 0
+
+    def get_middle_start(self, blend_inout_ratio: float = 0.5) -> np.ndarray:
+        r = max(0, min(blend_inout_ratio, 1))
+        return self.starts * (1 - r) + self.ends * r
+
+    def get_middle_start_frame(self, blend_inout_ratio: float = 0.5) -> np.ndarray:
+        return self.time2frame_float(self.get_middle_start(blend_inout_ratio))
+
+    def get_middle_end_frame_float(self, blend_inout_ratio: float = 0.5) -> np.ndarray:
+        middle_start = self.get_middle_start_frame(blend_inout_ratio)
+        ret = np.ceil(middle_start - self.frame_cfg.offset) + self.frame_cfg.offset
+        return np.where(ret >= self.end_frame_float, middle_start, ret)
+
+    # Optimization passes
+
+    @staticmethod
+    def silence_key_index(use_extended_shapes: bool) -> int:
+        if use_extended_shapes:
+            return MouthShapeInfos.key2index(MouthShapeInfos.X.value.key)
+        return MouthShapeInfos.key2index(MouthShapeInfos.A.value.key)
+
+    def silence_mask(self, use_extended_shapes: bool) -> np.ndarray:
+        return self.keys == CueTable.silence_key_index(use_extended_shapes)
+
+    def trim_long_cues(self, max_dur: float, tolerance: float, append_x=True, use_extended_shapes=True) -> tuple["CueTable", int]:
+        """Trims the non-silence cues longer than `max_dur` (+tolerance). The created gap is filled with a silence cue when `append_x`.
+        Returns the new table and the number of cues trimmed"""
+        trim = ~self.silence_mask(use_extended_shapes)
+        if max_dur > 0:
+            trim &= self.durations > max_dur + tolerance
+        count = int(np.count_nonzero(trim))
+        if not count:
+            return self, 0
+        new_ends = np.where(trim, self.starts + max_dur, self.ends)
+        if not append_x:
+            return self.with_columns(self.keys, self.starts, new_ends), count
+        # Each trimmed cue is followed by a new silence cue. Find where the original cues land in the extended arrays
+        rep = 1 + trim.astype(np.int64)
+        pos = np.cumsum(rep) - rep
+        total = len(self) + count
+        keys = np.empty(total, dtype=np.int8)
+        starts = np.empty(total, dtype=np.float64)
+        ends = np.empty(total, dtype=np.float64)
+        keys[pos], starts[pos], ends[pos] = self.keys, self.starts, new_ends
+        silence_pos = pos[trim] + 1
+        keys[silence_pos] = CueTable.silence_key_index(use_extended_shapes)
+        starts[silence_pos] = new_ends[trim]
+        ends[silence_pos] = self.ends[trim]
+        return self.with_columns(keys, starts, ends), count
+
+    def merge_double_x(self, use_extended_shapes=True) -> tuple["CueTable", int]:
+        """Joins runs of consecutive silence cues into a single cue spanning the whole run.
+        Returns the new table and the number of cues removed"""
+        sil = self.silence_mask(use_extended_shapes)
+        drop = np.zeros(len(self), dtype=bool)
+        drop[1:] = sil[1:] & sil[:-1]
+        count = int(np.count_nonzero(drop))
+        if not count:
+            return self, 0
+        kept = np.flatnonzero(~drop)
+        # A kept cue is followed by the dropped cues of its run (if any). It ends where the last cue before the next kept one ends
+        run_last = np.append(kept[1:], len(self)) - 1
+        return self.with_columns(self.keys[kept], self.starts[kept], self.ends[run_last]), count
+
+    def ensure_frame_intersection(self) -> tuple["CueTable", int]:
+        """Prolongs the very short cues placed in between two frames. Either the start or the end is moved to the closer frame.
+        Returns the new table and the number of cues modified"""
+        short = ~self.intersects_frame
+        count = int(np.count_nonzero(short))
+        if not count:
+            return self, 0
+        sff, eff = self.start_frame_float, self.end_frame_float
+        left, right = np.floor(sff), np.ceil(eff)
+        to_left = short & (sff - left < right - eff)  # Start is closer, expand the cue start to the left
+        to_right = short & ~to_left  # End is closer, expand the cue end to the right
+        starts = np.where(to_left, self.frame2time(left), self.starts)
+        ends = np.where(to_right, self.frame2time(right), self.ends)
+        return self.with_columns(self.keys, starts, ends), count
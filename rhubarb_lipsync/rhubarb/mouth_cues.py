@@ -272,7 +272,7 @@ class MouthCueFrames:
 
     @property
     def end_time_str(self) -> str:
-        return f"{self.end_frame+self.offset_seconds:0.2f}"
+        return f"{self.cue.end+self.offset_seconds:0.2f}"
 
     @property
     def end_frame_str(self) -> str:
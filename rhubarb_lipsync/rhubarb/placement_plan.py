@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import pathlib
+import struct
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from typing import Any, ClassVar, Optional
+
+from .cue_processor import CueProcessor
+from .mouth_shape_info import MouthShapeInfos
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PlannedStrip:
+    """Where and how to place a single NLA strip. Independent of the Object (and the Action) the strip is baked on"""
+
+    cue_index: int
+    track_slot: int  # 0 for the track1, 1 for the track2. The cues alternate between the two tracks
+    key: str
+    start: float  # Frames
+    end: float
+    blend_in: float
+    blend_out: float
+    auto_blend: bool
+
+    @cached_property
+    def key_index(self) -> int:
+        return MouthShapeInfos.key2index(self.key)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @cached_property
+    def name(self) -> str:
+        return f"{MouthShapeInfos[self.key].value.key_displ}.{str(self.cue_index).zfill(3)}"
+
+    @property
+    def placement(self) -> tuple:
+        """All the fields but the cue index (and so the name). Strips with the same placement are baked the same way"""
+        return (self.track_slot, self.key, self.start, self.end, self.blend_in, self.blend_out, self.auto_blend)
+
+
+@dataclass
+class PlacementPlan:
+    """The strip timing of a bake. Depends only on the (optimized) cue list and the strip placement settings, so it is computed once
+    and then replayed on each of the baked Objects, only the mapped Action and the strip scale differ."""
+
+    blend_inout_ratio: float
+    inout_blend_type: str
+    strips: list[PlannedStrip] = field(default_factory=list, repr=False)
+
+    # Recently built plans, keyed by the `cache_key`
+    cache: ClassVar[dict[str, "PlacementPlan"]] = {}
+    cache_max_entries: ClassVar[int] = 8
+
+    @staticmethod
+    def build(cp: CueProcessor, blend_inout_ratio: float, inout_blend_type: str) -> "PlacementPlan":
+        ret = PlacementPlan(blend_inout_ratio, inout_blend_type)
+        bir = blend_inout_ratio
+        no_blending = inout_blend_type == "NO_BLENDING"
+        for i, cf in enumerate(cp.cue_frames):
+            prev_cf = cp[i - 1]
+            if no_blending or cp.is_cue_silence(prev_cf):
+                # When the previous cue is silence, this cue should blend-in without overlap
+                start = cf.start_frame_float
+            else:
+                # The clip starts (blending in) after the end of the middle section of the previous clip.
+                start = prev_cf.get_middle_end_frame_float(bir)
+            blend_in = cf.get_middle_start_frame(bir) - start
+
+            next_cf = cp[i + 1]
+            if no_blending or cp.is_cue_silence(next_cf):
+                # When the following cue is silence, this cue should blend out without overlap
+                end = cf.end_frame_float
+                blend_out = cf.end_frame_float - cf.get_middle_end_frame_float(bir)
+            else:
+                end = next_cf.get_middle_start_frame(bir)
+                blend_out = end - cf.get_middle_end_frame_float(bir)
+
+            trace = f"{cf.start_frame_str} {cf.cue.info.key_displ}"
+            assert end - start > 0, f"desired_strip_duration={end - start} [{trace}]"
+            assert blend_in >= 0, f"blend_in={blend_in} [{trace}]"
+            assert blend_out >= 0, f"blend_out={blend_out} [{trace}]"
+
+            # Autoblend when forced by option, otherwise only autobled the silence cues (X or A)
+            auto_blend = cp.is_cue_silence(cf)
+            if inout_blend_type == "ALWAYS_AUTOBLEND":
+                auto_blend = True
+            if no_blending:
+                auto_blend = False
+            # The bake alternates the tracks, starting with the track1
+            ret.strips.append(PlannedStrip(i, i % 2, cf.cue.key, start, end, blend_in, blend_out, auto_blend))
+        return ret
+
+    @staticmethod
+    def cache_key(cp: CueProcessor, blend_inout_ratio: float, inout_blend_type: str) -> str:
+        h = hashlib.sha256()
+        cfg = cp.frame_cfg
+        h.update(f"{cfg.fps}/{cfg.fps_base}/{cfg.offset}/{cp.use_extended_shapes}/{blend_inout_ratio}/{inout_blend_type}".encode())
+        rec = struct.Struct("<Bdd")
+        for cf in cp.cue_frames:
+            h.update(rec.pack(cf.cue.key_index, cf.cue.start, cf.cue.end))
+        return h.hexdigest()
+
+    @staticmethod
+    def cached(cp: CueProcessor, blend_inout_ratio: float, inout_blend_type: str) -> "PlacementPlan":
+        """Same as the `build` but returns the already built plan when the same cues are baked again (e.g. on another character)"""
+        key = PlacementPlan.cache_key(cp, blend_inout_ratio, inout_blend_type)
+        plan = PlacementPlan.cache.pop(key, None)
+        if plan is None:
+            plan = PlacementPlan.build(cp, blend_inout_ratio, inout_blend_type)
+        else:
+            log.debug(f"Reusing placement plan of {len(plan.strips)} strips")
+        PlacementPlan.cache[key] = plan  # Re-insert as the most recently used
+        while len(PlacementPlan.cache) > PlacementPlan.cache_max_entries:
+            PlacementPlan.cache.pop(next(iter(PlacementPlan.cache)))
+        return plan
+
+    def __len__(self) -> int:
+        return len(self.strips)
+
+    def dirty_range(self, old: "PlacementPlan", neighbours: int = 2) -> Optional[tuple[int, int, int]]:
+        """Range of strips which differ from the `old` (already baked) plan, as (start, old_end, new_end) strip indexes.
+        The strips before the `start` and after the ends are the same in both plans (after the end the cue indexes can be shifted).
+        The range is extended by the `neighbours` on each side, a strip placement can trim the previous strip on the same track.
+        Returns None when there is no difference"""
+        n_old, n_new = len(old), len(self)
+        if (old.blend_inout_ratio, old.inout_blend_type) != (self.blend_inout_ratio, self.inout_blend_type):
+            return 0, n_old, n_new
+        shorter = min(n_old, n_new)
+        prefix = 0
+        while prefix < shorter and old.strips[prefix] == self.strips[prefix]:
+            prefix += 1
+        if prefix == n_old == n_new:
+            return None
+        suffix = 0
+        while suffix < shorter - prefix and old.strips[n_old - 1 - suffix].placement == self.strips[n_new - 1 - suffix].placement:
+            suffix += 1
+        start = max(0, prefix - neighbours)
+        suffix = max(0, suffix - neighbours)
+        return start, n_old - suffix, n_new - suffix
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "blendInOutRatio": self.blend_inout_ratio,
+            "inOutBlendType": self.inout_blend_type,
+            "strips": [asdict(s) for s in self.strips],
+        }
+
+    @staticmethod
+    def from_json(j: dict[str, Any]) -> "PlacementPlan":
+        strips = [PlannedStrip(**s) for s in j.get("strips", [])]
+        return PlacementPlan(j["blendInOutRatio"], j["inOutBlendType"], strips)
+
+    def save(self, path: pathlib.Path) -> None:
+        path.write_text(json.dumps(self.to_json()), encoding="utf-8")
+
+    @staticmethod
+    def load(path: pathlib.Path) -> Optional["PlacementPlan"]:
+        if not path.exists():
+            return None
+        return PlacementPlan.from_json(json.loads(path.read_text(encoding="utf-8")))
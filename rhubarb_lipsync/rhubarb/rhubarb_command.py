@@ -1,3 +1,4 @@
+import codecs
 import functools
 import json
 import logging
@@ -5,14 +6,16 @@ import os
 import pathlib
 import platform
 import re
+import selectors
 import traceback
-from collections import defaultdict
+from collections import defaultdict, deque
 from queue import Empty, SimpleQueue
 from subprocess import PIPE, Popen, TimeoutExpired
-from threading import Event, Thread
+from threading import Event, Lock, Thread
 from time import sleep
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Generic, Hashable, List, Optional, TypeVar
 
+from .cue_cache import CueCache
 from .mouth_cues import MouthCue
 
 log = logging.getLogger(__name__)
@@ -137,16 +140,31 @@ class RhubarbCommandWrapper:
     """Wraps low level operations related to the lipsync executable."""
 
     thread_wait_timeout = 5
+    stdout_chunk_size = 64 * 1024
+
+    # Version of the executable keyed by its path and modification time. To avoid running the `--version` for each capture
+    version_cache: dict[tuple[str, int], str] = {}
 
     def __init__(self, executable_path: pathlib.Path, recognizer="pocketSphinx", extended=True, extra_args=[]) -> None:
         self.executable_path = executable_path
         self.recognizer = recognizer
         self.use_extended = extended
         self.process: Optional[Popen] = None
-        self.stdout = ""
+        self.stdout_chunks: list[str] = []  # Collected as chunks, joined only when the whole output is needed
         self.stderr = ""
         self.last_exit_code: Optional[int] = None
         self.extra_args = extra_args
+        self.cache: Optional[CueCache] = None  # When set, the results are looked up in/stored to the cache
+        self.cache_key: Optional[str] = None
+        self.cached_cues: Optional[list[MouthCue]] = None
+
+    @property
+    def stdout(self) -> str:
+        return "".join(self.stdout_chunks)
+
+    @stdout.setter
+    def stdout(self, value: str) -> None:
+        self.stdout_chunks = [value] if value else []
 
     @staticmethod
     def executable_default_filename() -> str:
@@ -210,6 +228,19 @@ class RhubarbCommandWrapper:
         self.collect_output_sync(ignore_timeout_error=False)
         return RhubarbParser.parse_version_info(self.stdout)
 
+    def get_version_cached(self) -> str:
+        """Same as `get_version` but the process is only executed when the executable has changed since the last call"""
+        key = (str(self.executable_path), os.stat(self.executable_path).st_mtime_ns)
+        ver = RhubarbCommandWrapper.version_cache.get(key)
+        if ver is None:
+            ver = self.get_version()
+            RhubarbCommandWrapper.version_cache[key] = ver
+        return ver
+
+    def build_cache_key(self, input_file: str, dialog_file: Optional[str] = None) -> str:
+        options = [self.recognizer, str(self.use_extended), *self.extra_args, self.get_version_cached()]
+        return CueCache.build_key(input_file, dialog_file, options)
+
     def log_status_line(self, log_json: dict) -> None:
         # {'log': {'level': 'Info', 'message': 'Msg'}}]
         if not log_json or "log" not in log_json:
@@ -220,8 +251,24 @@ class RhubarbCommandWrapper:
         log.log(RhubarbParser.LOG_LEVELS_MAP[level], f"Rhubarb: {msg}")
 
     def lipsync_start(self, input_file: str, dialog_file: Optional[str] = None) -> None:
-        """Start the main lipsync command. Process runs in background"""
+        """Start the main lipsync command. Process runs in background.
+        When the result is already cached no process is started and the command is finished immediately."""
         self.close_process()
+        self.cache_key = None
+        self.cached_cues = None
+        if self.cache:
+            try:
+                self.cache_key = self.build_cache_key(input_file, dialog_file)
+            except OSError as e:  # Missing (dialog) file for example. Run without the cache, the rhubarb reports the error
+                log.warning(f"Can't use the capture cache for {input_file}: {e}")
+            cues = self.cache.get(self.cache_key) if self.cache_key else None
+            if cues is not None:
+                log.info(f"Using cached result for {input_file}")
+                self.stdout = ""
+                self.stderr = ""
+                self.cached_cues = cues
+                self.last_exit_code = 0
+                return
         args = self.build_lipsync_args(input_file, dialog_file)
         self.open_process(args)
 
@@ -241,7 +288,10 @@ class RhubarbCommandWrapper:
         self.read_process_stderr_line()
         if not self.stderr:
             return None
-        status_lines = RhubarbParser.parse_status_infos(self.stderr)
+        return self.process_status_lines(RhubarbParser.parse_status_infos(self.stderr))
+
+    def process_status_lines(self, status_lines: list[dict]) -> Optional[int]:
+        """Logs the parsed status lines reported on the stderr. Returns the last progress (if any)"""
         if not status_lines:
             return None
         for s in status_lines:
@@ -273,6 +323,11 @@ class RhubarbCommandWrapper:
     def is_running(self) -> bool:
         return self.was_started and not self.has_finished
 
+    @property
+    def from_cache(self) -> bool:
+        """Whether the result was taken from the cache without running the process"""
+        return self.cached_cues is not None
+
     def get_lipsync_output_json(self) -> list[dict]:
         """Json - parsed output of the lipsync capture process"""
         assert self.has_finished, "Output is not available since the process has not finisehd"
@@ -280,8 +335,14 @@ class RhubarbCommandWrapper:
 
     def get_lipsync_output_cues(self) -> list[MouthCue]:
         """Json - parsed output of the lipsync capture process"""
+        if self.cached_cues is not None:
+            return self.cached_cues
         json = self.get_lipsync_output_json()
-        return RhubarbParser.lipsync_json2MouthCues(json)
+        cues = RhubarbParser.lipsync_json2MouthCues(json)
+        if self.cache and self.cache_key and self.last_exit_code == 0:
+            self.cache.put(self.cache_key, cues)
+            self.cache_key = None  # Stored already
+        return cues
 
     def collect_output_sync(self, ignore_timeout_error=True, timeout=1) -> None:
         """
@@ -289,9 +350,10 @@ class RhubarbCommandWrapper:
         """
         assert self.was_started
         try:
-            (stdout, stderr) = self.process.communicate(timeout=timeout)  # Consume any reminding output
+            stdout, stderr = self.process.communicate(timeout=timeout)  # Consume any reminding output
             self.stderr += stderr
-            self.stdout += stdout
+            if stdout:
+                self.stdout_chunks.append(stdout)
         except TimeoutExpired:
             log.warn("Timed out while waiting for process to finalize outputs")
             if not ignore_timeout_error:
@@ -299,7 +361,9 @@ class RhubarbCommandWrapper:
         self.close_process()
 
     def check_process_has_finished(self) -> bool:
-        exit_code = self.process.poll()
+        return self.set_exit_code(self.process.poll())
+
+    def set_exit_code(self, exit_code: Optional[int]) -> bool:
         if exit_code is None:
             return False
         self.last_exit_code = exit_code
@@ -324,28 +388,205 @@ class RhubarbCommandWrapper:
         """Reads and collects the process stdout. This method blocks."""
         assert self.was_started
         # log.trace("About to read stding")  # type: ignore
-        o = self.process.stdout.readlines()
-        if len(o) > 0:
-            self.stdout += ' '.join(o)
-            log.debug(f"Consumed stdout. Read {len(o)} lines.")  # type: ignore
+        chunk = self.process.stdout.read(RhubarbCommandWrapper.stdout_chunk_size)
+        if chunk:
+            self.stdout_chunks.append(chunk)
+            log.debug(f"Consumed stdout. Read {len(chunk)} characters.")  # type: ignore
         # else:
         #    log.trace("Empty newline in stdout")  # type: ignore
 
 
+class RhubarbIOMultiplexer:
+    """Serves the stdout/stderr pipes of all the running rhubarb processes from a single thread.
+    The thread sleeps in `select` until there is an output available, so there are no idle wake-ups.
+    The parsed progress events of all the processes are pushed to a single queue. The consumer (main thread)
+    routes them to the jobs by calling `dispatch`.
+    Not supported on Windows where `select` doesn't work with pipes. The jobs fall back to the reader threads there."""
+
+    supported = platform.system() != "Windows"
+    read_size = 64 * 1024
+    request_timeout = 5
+
+    def __init__(self) -> None:
+        # (job, process, message, payload). The process identifies the run, to drop stale events of a cancelled run
+        self.events: SimpleQueue[tuple['RhubarbCommandAsyncJob', Popen, str, Any]] = SimpleQueue()
+        self.requests: SimpleQueue[tuple[str, 'RhubarbCommandAsyncJob', Event]] = SimpleQueue()
+        self.lock = Lock()
+        self.thread: Optional[Thread] = None
+        self.wakeup_fds: tuple[int, int] = (-1, -1)
+
+    def ensure_started(self) -> None:
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            for fd in self.wakeup_fds:  # Of the previous (dead) thread
+                if fd >= 0:
+                    os.close(fd)
+            self.wakeup_fds = os.pipe()
+            os.set_blocking(self.wakeup_fds[0], False)
+            self.thread = Thread(target=self._run, name="RhubarbIO", daemon=True)
+            self.thread.start()
+
+    def _request(self, op: str, job: 'RhubarbCommandAsyncJob', wait: bool) -> None:
+        self.ensure_started()
+        done = Event()
+        self.requests.put((op, job, done))
+        os.write(self.wakeup_fds[1], b"\0")  # Wake the selector up
+        if wait and not done.wait(RhubarbIOMultiplexer.request_timeout):
+            log.error(f"The IO thread didn't handle the {op} request in time")
+
+    def register(self, job: 'RhubarbCommandAsyncJob') -> None:
+        """Starts serving the pipes of the job's process"""
+        self._request("ADD", job, False)
+
+    def unregister(self, job: 'RhubarbCommandAsyncJob') -> None:
+        """Stops serving the pipes of the job's process. Blocks until done, so the pipes can be closed safely afterwards"""
+        self._request("REMOVE", job, True)
+
+    def dispatch(self) -> None:
+        """Routes the queued events to the queues of the individual jobs. To be called from the consumer thread"""
+        while True:
+            try:
+                job, process, msg, obj = self.events.get_nowait()
+            except Empty:
+                return
+            if process is job.cmd.process:  # Drop events from a previous (cancelled) run of the job
+                job.queue.put((msg, obj))
+
+    def _run(self) -> None:
+        sel = selectors.DefaultSelector()
+        sel.register(self.wakeup_fds[0], selectors.EVENT_READ, None)
+        served: dict[RhubarbCommandAsyncJob, ServedProcess] = {}
+
+        def remove(job: RhubarbCommandAsyncJob) -> None:
+            sp = served.pop(job, None)
+            if not sp:
+                return
+            for fd in sp.open_fds:
+                try:
+                    sel.unregister(fd)
+                except (KeyError, ValueError):
+                    pass  # Not registered (failed ADD) or an invalid fd already
+
+        def handle_request(op: str, job: RhubarbCommandAsyncJob) -> None:
+            remove(job)
+            if op == "ADD" and job.cmd.process:
+                sp = ServedProcess(job.cmd.process)
+                served[job] = sp
+                for fd in sp.open_fds:
+                    sel.register(fd, selectors.EVENT_READ, job)
+
+        def handle_requests() -> None:
+            while True:
+                try:
+                    op, job, done = self.requests.get_nowait()
+                except Empty:
+                    return
+                try:
+                    handle_request(op, job)
+                except Exception as e:  # Already closed pipe for example
+                    log.error(f"Failed to handle the IO {op} request: {e}")
+                    remove(job)
+                    if op == "ADD":
+                        self.events.put((job, job.cmd.process, "EXCEPTION", e))
+                finally:
+                    done.set()
+
+        def reject_requests(e: Exception) -> None:
+            while True:
+                try:
+                    op, job, done = self.requests.get_nowait()
+                except Empty:
+                    return
+                if op == "ADD":
+                    self.events.put((job, job.cmd.process, "EXCEPTION", e))
+                done.set()
+
+        def handle_output(fd: int, job: RhubarbCommandAsyncJob) -> None:
+            sp = served.get(job)
+            if not sp:
+                return
+            try:
+                if not self._read(fd, job, sp):  # EOF
+                    sel.unregister(fd)
+                    sp.open_fds.remove(fd)
+                    if not sp.open_fds:  # Both pipes closed, the process is exiting
+                        served.pop(job)
+                        self.events.put((job, sp.process, "EXIT", sp.process.wait()))
+            except Exception as e:
+                log.error(f"Unexpected error while reading the rhubarb process output {e}")
+                self.events.put((job, sp.process, "EXCEPTION", e))
+                remove(job)
+
+        try:
+            while True:
+                for key, _ in sel.select():
+                    if key.data is not None:
+                        handle_output(key.fd, key.data)
+                        continue
+                    try:  # Wake-up: handle the register/unregister requests
+                        os.read(key.fd, 1024)
+                    except BlockingIOError:
+                        pass
+                    handle_requests()
+        except Exception as e:  # The selector itself failed, the served jobs would wait for the EXIT forever
+            log.exception(f"The IO thread failed: {e}")
+            for job, sp in served.items():
+                self.events.put((job, sp.process, "EXCEPTION", e))
+            served.clear()
+            reject_requests(e)  # Don't keep the requesters waiting. A new thread is started by the next request
+        finally:
+            sel.close()
+
+    def _read(self, fd: int, job: 'RhubarbCommandAsyncJob', sp: 'ServedProcess') -> bool:
+        """Reads the available output of the pipe. Returns False on EOF"""
+        data = os.read(fd, RhubarbIOMultiplexer.read_size)
+        final = not data
+        text = sp.decoders[fd].decode(data, final)
+        if fd == sp.stdout_fd:
+            if text:
+                job.cmd.stdout_chunks.append(text)
+            return not final
+        lines = (sp.stderr_line + text).split("\n")
+        sp.stderr_line = "" if final else lines.pop()  # Keep the unfinished line for the next read
+        status_lines = [RhubarbParser.parse_status_info_line(l) for l in lines if l.strip()]
+        if status_lines:
+            self.events.put((job, sp.process, "STATUS", status_lines))
+        return not final
+
+
+class ServedProcess:
+    """State of a process served by the RhubarbIOMultiplexer"""
+
+    def __init__(self, process: Popen) -> None:
+        self.process = process
+        self.stdout_fd = process.stdout.fileno()  # type: ignore
+        self.stderr_fd = process.stderr.fileno()  # type: ignore
+        self.open_fds = [self.stdout_fd, self.stderr_fd]
+        self.decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in self.open_fds}
+        self.stderr_line = ""  # Unfinished stderr line
+
+
+io_multiplexer = RhubarbIOMultiplexer()
+
+
 class RhubarbCommandAsyncJob:
     """Additional wrapper over the RhubarbCommandWrapper which handles asynchronious progress-updates."""
 
     thread_wait_timeout = 5
 
-    def __init__(self, cmd: RhubarbCommandWrapper) -> None:
+    def __init__(self, cmd: RhubarbCommandWrapper, use_multiplexer=RhubarbIOMultiplexer.supported) -> None:
         assert cmd
         self.cmd = cmd
+        self.use_multiplexer = use_multiplexer  # Served by the shared IO thread instead of two reader threads
+        self.multiplexed = False
         self.stdout_thread: Optional[Thread] = None
         self.stderr_thread: Optional[Thread] = None
         self.queue: SimpleQueue[tuple[str, Any]] = SimpleQueue()
         self.last_progress = 0
         self.last_exception: Optional[Exception] = None
         self.last_cues: list[MouthCue] = []
+        self.cues_taken = False
         self.stop_event = Event()
 
     @thread_loop
@@ -381,6 +622,9 @@ class RhubarbCommandAsyncJob:
             traceback.print_exc()
 
     def join_threads(self) -> None:
+        if self.multiplexed:
+            io_multiplexer.unregister(self)
+            self.multiplexed = False
         self._join_thread(self.stdout_thread)
         self._join_thread(self.stderr_thread)
         self.queue = SimpleQueue()
@@ -390,9 +634,12 @@ class RhubarbCommandAsyncJob:
     def lipsync_check_progress_async(self) -> Optional[int]:
         if self.cmd.has_finished:  # Finished, do some auto-cleanup a process output
             self.join_threads()
-            self.cmd.collect_output_sync(ignore_timeout_error=True)
+            if self.cmd.was_started:
+                self.cmd.collect_output_sync(ignore_timeout_error=True)
             self.cmd.close_process()
             return 100
+        if self.use_multiplexer:
+            return self._check_progress_multiplexed()
         if not self.stderr_thread:
             log.debug("Creating reader threads")
             self.stop_event.clear()
@@ -402,7 +649,7 @@ class RhubarbCommandAsyncJob:
             self.stderr_thread.start()
 
         try:
-            (msg, obj) = self.queue.get_nowait()
+            msg, obj = self.queue.get_nowait()
             log.trace(f"Received {msg}={obj}")  # type: ignore
             if msg == 'PROGRESS':
                 return int(obj)
@@ -412,22 +659,64 @@ class RhubarbCommandAsyncJob:
         except Empty:
             return None
 
+    def _check_progress_multiplexed(self) -> Optional[int]:
+        if not self.multiplexed:
+            log.debug("Registering to the IO multiplexer")
+            io_multiplexer.register(self)
+            self.multiplexed = True
+        io_multiplexer.dispatch()
+        progress = None
+        while True:  # Process all the events received since the last check
+            try:
+                msg, obj = self.queue.get_nowait()
+            except Empty:
+                return progress
+            log.trace(f"Received {msg}={obj}")  # type: ignore
+            if msg == 'STATUS':
+                p = self.cmd.process_status_lines(obj)
+                if p is not None:
+                    progress = self.last_progress = p
+            elif msg == 'EXIT':
+                self.multiplexed = False  # The IO thread has released the process already
+                self.cmd.set_exit_code(obj)  # Raises on a non-zero exit code
+                return self.lipsync_check_progress_async()  # Has finished, collect the outputs
+            elif msg == 'EXCEPTION':
+                raise obj  # Propagate exception from the IO thread
+            else:
+                assert False, f"Received unknown message {msg}"
+
     def cancel(self) -> None:
         log.info("Cancel request. Stopping the process and the status thread.")
         self.stop_event.set()
         self.join_threads()
         self.cmd.close_process()
 
+    def close(self) -> None:
+        """Releases the reader threads and the process once finished"""
+        self.join_threads()
+        self.cmd.close_process()
+
+    @property
+    def has_finished(self) -> bool:
+        return self.cmd.has_finished
+
     def get_lipsync_output_cues(self) -> list[MouthCue]:
         if self.last_cues:  # Cached
             return self.last_cues
         if not self.cmd.has_finished:  # Still in progress (rhubarb bin can't deliver partial results)
             return []
-        if not self.cmd.stdout:  # No output, probably failed
+        if not self.cmd.stdout and not self.cmd.from_cache:  # No output, probably failed
             return []
         self.last_cues = self.cmd.get_lipsync_output_cues()  # Cache the result
         return self.last_cues
 
+    def take_new_cues(self) -> list[MouthCue]:
+        """Cues not taken yet. The rhubarb binary can't deliver partial results, so all the cues are returned at once when finished"""
+        if self.cues_taken or not self.cmd.has_finished:
+            return []
+        self.cues_taken = True
+        return self.get_lipsync_output_cues()
+
     @property
     def failed(self) -> bool:
         if self.last_exception:
@@ -443,5 +732,104 @@ class RhubarbCommandAsyncJob:
             # Not started yet. Or cancelled
             return "Failed" if self.failed else "Stopped"
         if self.cmd.has_finished:
+            if self.cmd.from_cache:
+                return "Cached"
             return "Done" if self.get_lipsync_output_cues() else "No data"
         return "Running"
+
+
+K = TypeVar('K', bound=Hashable)
+
+
+class RhubarbCommandPool(Generic[K]):
+    """Runs multiple lipsync jobs while limiting the number of the rhubarb processes running at the same time.
+    The rhubarb binary is single-threaded, so running one process per CPU core gives the best throughput.
+    Jobs are queued on submit and started as soon as there is a free slot."""
+
+    def __init__(self, max_running=0) -> None:
+        self.max_running = max_running if max_running > 0 else (os.cpu_count() or 1)
+        self.jobs: dict[K, RhubarbCommandAsyncJob] = {}  # All the submitted jobs, in the submit order
+        self.pending: deque[tuple[K, str, Optional[str]]] = deque()
+        self.running: dict[K, RhubarbCommandAsyncJob] = {}
+        self.finished: dict[K, RhubarbCommandAsyncJob] = {}
+        self._reported: set[K] = set()  # Finished jobs already returned by check_progress
+
+    def submit(self, key: K, job: RhubarbCommandAsyncJob, input_file: str, dialog_file: Optional[str] = None) -> None:
+        """Queue the job. The key identifies the job (capture index for example) in the results"""
+        assert key not in self.jobs, f"Job '{key}' has been already submitted"
+        self.jobs[key] = job
+        self.pending.append((key, input_file, dialog_file))
+
+    def start_pending(self) -> int:
+        """Start queued jobs while there is a free slot. Returns number of jobs started"""
+        started = 0
+        while self.pending and len(self.running) < self.max_running:
+            key, input_file, dialog_file = self.pending.popleft()
+            job = self.jobs[key]
+            try:
+                job.cmd.lipsync_start(input_file, dialog_file)
+                self.running[key] = job
+                started += 1
+            except Exception as e:
+                log.error(f"Failed to start the job '{key}': {e}")
+                job.last_exception = e
+                self.finished[key] = job
+        if started > 0:
+            log.debug(f"Started {started} jobs. Running: {len(self.running)}, pending: {len(self.pending)}")
+        return started
+
+    def _finish(self, key: K) -> None:
+        job = self.running.pop(key)
+        job.join_threads()
+        job.cmd.close_process()
+        if not job.failed:
+            job.last_progress = 100
+        self.finished[key] = job
+
+    def check_progress(self) -> list[K]:
+        """Updates progress of the running jobs and starts the pending ones when a slot gets free.
+        Returns keys of the jobs which have finished (successfully or not) since the last call."""
+        for key, job in list(self.running.items()):
+            try:
+                job.lipsync_check_progress_async()
+                if job.cmd.has_finished:
+                    self._finish(key)
+            except Exception as e:
+                log.error(f"Job '{key}' failed: {e}")
+                job.cancel()
+                if not job.last_exception:
+                    job.last_exception = e
+                self.running.pop(key)
+                self.finished[key] = job
+        self.start_pending()
+        # Collected last, so the jobs which have just failed to start are included (the last one would make the pool finished)
+        done: list[K] = [k for k in self.finished if k not in self._reported]
+        self._reported.update(done)
+        return done
+
+    @property
+    def has_finished(self) -> bool:
+        return not self.pending and not self.running
+
+    @property
+    def progress(self) -> int:
+        """Aggregate progress (0-100) of all the submitted jobs"""
+        if not self.jobs:
+            return 100
+        total = sum(100 if k in self.finished else j.last_progress for k, j in self.jobs.items())
+        return int(total / len(self.jobs))
+
+    @property
+    def failed_count(self) -> int:
+        return sum(1 for j in self.finished.values() if j.failed)
+
+    @property
+    def status(self) -> str:
+        return f"{len(self.finished)}/{len(self.jobs)}"
+
+    def cancel(self) -> None:
+        log.info(f"Cancelling {len(self.running)} running and {len(self.pending)} pending jobs.")
+        self.pending.clear()
+        for job in self.running.values():
+            job.cancel()
+        self.running.clear()
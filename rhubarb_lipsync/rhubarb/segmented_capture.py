@@ -0,0 +1,303 @@
+import logging
+import math
+import pathlib
+import shutil
+import tempfile
+import wave
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+from .cue_processor import CueProcessor
+from .mouth_cues import FrameConfig, MouthCue, MouthCueFrames
+from .rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandPool, RhubarbCommandWrapper
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class SoundSegment:
+    """Part of a long sound file processed by a separate rhubarb process.
+    The `start`-`end` is the interval cut from the sound. It overlaps a bit with the neighbouring segments
+    to give the recognizer some context. Only cues from the `own_start`-`own_end` interval are used."""
+
+    start: float
+    end: float
+    own_start: float
+    own_end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def find_silences(samples: np.ndarray, rate: int, threshold_db=-40.0, min_silence=0.3, window=0.02) -> list[tuple[float, float]]:
+    """Finds intervals (in seconds) where the sound is quiet for at least `min_silence` seconds.
+    The loudness is measured as RMS of short windows relative to the loudest window."""
+    win = max(1, int(rate * window))
+    n = len(samples) // win
+    if n == 0:
+        return []
+    frames = np.asarray(samples[: n * win], dtype=np.float32).reshape(n, win)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    peak = float(rms.max())
+    if peak <= 0:
+        return [(0.0, len(samples) / rate)]  # All silent
+    quiet = rms < peak * 10 ** (threshold_db / 20)
+    # Find runs of the quiet windows
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    min_windows = min_silence / window
+    return [(s * win / rate, e * win / rate) for s, e in zip(starts, ends) if e - s >= min_windows]
+
+
+def plan_segments(duration: float, silences: list[tuple[float, float]], count: int, min_segment_len=20.0, overlap=0.2) -> list[SoundSegment]:
+    """Splits the sound into (up to) `count` segments of similar length. The cuts are placed in the middle of the silences
+    closest to the ideal (equidistant) cut positions. Segments shorter than `min_segment_len` are avoided."""
+    count = max(1, min(count, int(duration // min_segment_len)))
+    cuts: list[float] = []
+    candidates = sorted((s + e) / 2 for s, e in silences)
+    for k in range(1, count):
+        ideal = duration * k / count
+        prev = cuts[-1] if cuts else 0.0
+        usable = [c for c in candidates if c - prev >= min_segment_len and duration - c >= min_segment_len]
+        if not usable:
+            break
+        cuts.append(min(usable, key=lambda c: abs(c - ideal)))
+    bounds = [0.0, *cuts, duration]
+    return [
+        SoundSegment(max(0.0, own_start - overlap), min(duration, own_end + overlap), own_start, own_end) for own_start, own_end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class CueStitcher:
+    """Joins the cues captured from the individual segments into a single list.
+    The cue times are shifted by the segment start and clipped to the segment's own interval.
+    The silence cues duplicated at the seams are merged.
+    Segment results can be added in any order, the stitched cues are delivered in order as soon as all the previous segments are done.
+    The last delivered cue is held back since it might still get merged with the first cue of the next segment."""
+
+    def __init__(self, segments: list[SoundSegment], use_extended_shapes=True, min_duration=0.005) -> None:
+        self.segments = segments
+        self.use_extended_shapes = use_extended_shapes
+        self.min_duration = min_duration
+        self.results: dict[int, list[MouthCue]] = {}
+        self.next_index = 0  # Index of the next segment to be stitched
+        self.tail: list[MouthCue] = []  # Held back last cue
+
+    def add(self, index: int, cues: list[MouthCue]) -> None:
+        self.results[index] = cues
+
+    @property
+    def is_complete(self) -> bool:
+        return self.next_index >= len(self.segments) and not self.tail
+
+    def clip(self, seg: SoundSegment, seg_cues: list[MouthCue]) -> list[MouthCue]:
+        ret: list[MouthCue] = []
+        for c in seg_cues:
+            start = max(c.start + seg.start, seg.own_start)
+            end = min(c.end + seg.start, seg.own_end)
+            if end - start < self.min_duration:
+                continue  # Outside of the own interval or clipped to almost nothing
+            ret.append(MouthCue(c.key, start, end))
+        return ret
+
+    def merge_double_x(self, cues: list[MouthCue]) -> list[MouthCue]:
+        # The frame config is irrelevant for merging, the merge works with times only
+        cfg = FrameConfig(100)
+        cp = CueProcessor(cfg, [MouthCueFrames(c, cfg) for c in cues], use_extended_shapes=self.use_extended_shapes)
+        cp.merge_double_x()
+        return [cf.cue for cf in cp.cue_frames]
+
+    def take_ready(self) -> list[MouthCue]:
+        """Stitched cues which are final. Each cue is returned only once"""
+        cues = self.tail
+        stitched = False
+        while self.next_index in self.results:
+            seg = self.segments[self.next_index]
+            cues += self.clip(seg, self.results.pop(self.next_index))
+            self.next_index += 1
+            stitched = True
+        if not stitched:
+            return []
+        cues = self.merge_double_x(cues)
+        if self.next_index < len(self.segments):
+            self.tail = cues[-1:]  # More segments to come, hold back the last cue
+            return cues[:-1]
+        self.tail = []
+        return cues
+
+
+def stitch_segments(segment_cues: list[tuple[SoundSegment, list[MouthCue]]], use_extended_shapes=True) -> list[MouthCue]:
+    """Stitches the cues of all the segments at once. See the `CueStitcher`"""
+    stitcher = CueStitcher([seg for seg, _ in segment_cues], use_extended_shapes)
+    for i, (_, cues) in enumerate(segment_cues):
+        stitcher.add(i, cues)
+    return stitcher.take_ready()
+
+
+def cue_agreement(a: list[MouthCue], b: list[MouthCue], step=0.01) -> float:
+    """Fraction (0-1) of the time where both the cue lists show the same mouth shape. Sampled every `step` seconds."""
+    end = max(a[-1].end if a else 0, b[-1].end if b else 0)
+    if end <= 0:
+        return 1.0
+    t = np.arange(0, end, step)
+
+    def keys_at(cues: list[MouthCue]) -> np.ndarray:
+        starts = np.array([c.start for c in cues])
+        keys = np.array([c.key for c in cues] + ["X"])  # Past the last cue is a silence
+        idx = np.searchsorted(starts, t, side="right") - 1
+        idx[idx < 0] = len(cues)
+        return keys[idx]
+
+    return float(np.mean(keys_at(a) == keys_at(b)))
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    """Reads a PCM wav file as a mono float array (-1..1). Returns the samples and the sample rate"""
+    with wave.open(path, "rb") as w:
+        rate = w.getframerate()
+        width = w.getsampwidth()
+        channels = w.getnchannels()
+        data = w.readframes(w.getnframes())
+    dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+    if width not in dtypes:
+        raise ValueError(f"Unsupported sample width {width} bytes")
+    samples = np.frombuffer(data, dtype=dtypes[width]).astype(np.float32)
+    if width == 1:
+        samples = (samples - 128) / 128
+    else:
+        samples /= float(2 ** (8 * width - 1))
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int) -> None:
+    """Writes the mono float samples (-1..1) as a 16bit PCM wav file"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+
+
+class RhubarbSegmentedJob:
+    """Captures a long sound by splitting it at silences into segments processed by parallel rhubarb processes.
+    Provides the same progress/result interface as the RhubarbCommandAsyncJob.
+    When the `window_len` is set, the sound is split into sequential windows of about that length instead of one segment per process.
+    The windows are processed in order and the cues of the finished windows are available (`take_new_cues`) while the rest is still running."""
+
+    def __init__(
+        self,
+        new_command: Callable[[], RhubarbCommandWrapper],
+        samples: np.ndarray,
+        rate: int,
+        max_running=0,
+        min_segment_len=20.0,
+        window_len=0.0,
+    ) -> None:
+        self.new_command = new_command
+        self.samples = samples
+        self.rate = rate
+        self.pool: RhubarbCommandPool[int] = RhubarbCommandPool(max_running)
+        self.min_segment_len = min_segment_len
+        self.window_len = window_len
+        self.segments: list[SoundSegment] = []
+        self.stitcher: Optional[CueStitcher] = None
+        self.new_cues: list[MouthCue] = []
+        self.tmp_dir: Optional[pathlib.Path] = None
+        self.last_progress = 0
+        self.last_exception: Optional[Exception] = None
+        self.last_cues: list[MouthCue] = []
+        self.use_extended_shapes = True
+        self.was_started = False
+        self.cancelled = False
+        self.stitched = False
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.rate
+
+    def lipsync_start(self) -> None:
+        """Splits the sound and starts the segment processes"""
+        silences = find_silences(self.samples, self.rate)
+        if self.window_len > 0:
+            count = math.ceil(self.duration / self.window_len)
+            self.segments = plan_segments(self.duration, silences, count, self.window_len / 2)
+        else:
+            self.segments = plan_segments(self.duration, silences, self.pool.max_running, self.min_segment_len)
+        log.info(f"Sound ({self.duration:.1f}s) split into {len(self.segments)} segments, {len(silences)} silences found")
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp(prefix="rhubarb_segments_"))
+        for i, seg in enumerate(self.segments):
+            path = str(self.tmp_dir / f"segment_{i:03}.wav")
+            write_wav(path, self.samples[int(seg.start * self.rate) : int(seg.end * self.rate)], self.rate)
+            cmd = self.new_command()
+            self.use_extended_shapes = cmd.use_extended
+            self.pool.submit(i, RhubarbCommandAsyncJob(cmd), path)
+        self.stitcher = CueStitcher(self.segments, self.use_extended_shapes)
+        self.was_started = True
+        self.pool.start_pending()
+
+    def lipsync_check_progress_async(self) -> Optional[int]:
+        if self.has_finished:
+            return 100
+        assert self.stitcher
+        for key in self.pool.check_progress():
+            job = self.pool.jobs[key]
+            if job.failed:
+                self.last_exception = job.last_exception or RuntimeError(f"Rhubarb binary exited with a non-zero exit code {job.cmd.last_exit_code}")
+                self.cancel()
+                raise self.last_exception
+            self.stitcher.add(key, job.get_lipsync_output_cues())
+        ready = self.stitcher.take_ready()
+        self.new_cues += ready
+        self.last_cues += ready
+        progress = self.pool.progress
+        if self.pool.has_finished and self.stitcher.is_complete:
+            self.stitched = True
+            self.close()
+        if progress == self.last_progress:
+            return None
+        self.last_progress = progress
+        return progress
+
+    @property
+    def has_finished(self) -> bool:
+        return self.stitched
+
+    def cancel(self) -> None:
+        log.info("Cancel request. Stopping the segment processes.")
+        self.cancelled = True
+        self.pool.cancel()
+        self.close()
+
+    def close(self) -> None:
+        """Removes the temporary segment files"""
+        if self.tmp_dir:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
+
+    def get_lipsync_output_cues(self) -> list[MouthCue]:
+        return self.last_cues
+
+    def take_new_cues(self) -> list[MouthCue]:
+        """Cues stitched since the last call"""
+        ret = self.new_cues
+        self.new_cues = []
+        return ret
+
+    @property
+    def failed(self) -> bool:
+        return self.last_exception is not None
+
+    @property
+    def status(self) -> str:
+        if self.failed:
+            return "Failed"
+        if not self.was_started or self.cancelled:
+            return "Stopped"
+        if self.has_finished:
+            return "Done" if self.last_cues else "No data"
+        return "Running"
@@ -0,0 +1,415 @@
+"""Ad-hoc performance benchmarks. Not collected by pytest, run manually and compare the printed numbers.
+
+Benchmarks decoding the sample sounds need the `aud` module, so they have to run inside Blender:
+    blender --background --factory-startup --python tests/benchmarks.py -- split_capture
+The baking benchmarks need the `bpy`, either run them inside Blender the same way or with the `bpy` module installed.
+The others can run with plain python:
+    python tests/benchmarks.py <benchmark name>
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+tests_path = Path(__file__).parent
+project_path = tests_path.parent
+for p in (str(tests_path), str(project_path)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+from bisect import bisect_left  # noqa: E402
+
+from rhubarb_lipsync.rhubarb.cue_io import CueBinary, iter_json_cues, write_json_cues  # noqa: E402
+from rhubarb_lipsync.rhubarb.cue_processor import CueProcessor  # noqa: E402
+from rhubarb_lipsync.rhubarb.cue_table import CueTable  # noqa: E402
+from rhubarb_lipsync.rhubarb.mouth_cues import FrameConfig, MouthCueFrames  # noqa: E402
+from rhubarb_lipsync.rhubarb.rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandWrapper, RhubarbParser  # noqa: E402
+from rhubarb_lipsync.rhubarb.segmented_capture import RhubarbSegmentedJob, cue_agreement  # noqa: E402
+from test_cue_table import random_cues  # noqa: E402
+
+executable_path = project_path / "rhubarb_lipsync" / "bin" / RhubarbCommandWrapper.executable_default_filename()
+sample_sounds = sorted((tests_path / "data").glob("*.ogg"))
+
+benchmarks: dict[str, Callable[[argparse.Namespace], None]] = {}
+
+
+def benchmark(func: Callable[[argparse.Namespace], None]) -> Callable[[argparse.Namespace], None]:
+    benchmarks[func.__name__] = func
+    return func
+
+
+def wait_for(job, poll=0.05) -> float:
+    """Polls the job until finished. Returns the wall-clock time"""
+    start = time.perf_counter()
+    while not job.has_finished:
+        job.lipsync_check_progress_async()
+        time.sleep(poll)
+    return time.perf_counter() - start
+
+
+def decode(path: Path):
+    import aud  # Only available inside Blender
+
+    snd = aud.Sound(str(path))
+    return snd.data().mean(axis=1), int(snd.specs[0])
+
+
+@benchmark
+def split_capture(args: argparse.Namespace) -> None:
+    """Single rhubarb process vs. the sound split at silences into parallel processes"""
+    print(f"{'sound':45} {'len(s)':>7} {'single(s)':>10} {'split(s)':>9} {'segs':>5} {'speedup':>8} {'agreement':>10}")
+    for path in sample_sounds:
+        samples, rate = decode(path)
+        job = RhubarbCommandAsyncJob(RhubarbCommandWrapper(executable_path))
+        start = time.perf_counter()
+        job.cmd.lipsync_start(str(path))
+        wait_for(job)
+        job.close()
+        single_t = time.perf_counter() - start
+        single_cues = job.get_lipsync_output_cues()
+
+        sjob = RhubarbSegmentedJob(lambda: RhubarbCommandWrapper(executable_path), samples, rate, args.jobs, args.min_segment)
+        start = time.perf_counter()
+        sjob.lipsync_start()
+        wait_for(sjob)
+        split_t = time.perf_counter() - start
+        agreement = cue_agreement(single_cues, sjob.get_lipsync_output_cues())
+        print(
+            f"{path.name[:45]:45} {len(samples) / rate:7.1f} {single_t:10.2f} {split_t:9.2f} {len(sjob.segments):5} "
+            f"{single_t / split_t:8.2f} {agreement * 100:9.1f}%"
+        )
+
+
+fake_rhubarb_script = """
+import json, sys, time
+steps, interval = int(sys.argv[-3]), float(sys.argv[-2])
+emitted = []
+for i in range(1, steps + 1):
+    time.sleep(interval)
+    emitted.append(time.time())
+    sys.stderr.write(json.dumps({"type": "progress", "value": i / steps}) + "\\n")
+    sys.stderr.flush()
+print(json.dumps({"mouthCues": []}))
+with open(sys.argv[-1], "w") as f:
+    json.dump(emitted, f)
+"""
+
+
+@benchmark
+def progress_latency(args: argparse.Namespace) -> None:
+    """Progress latency and CPU overhead of the shared IO multiplexer vs. the per-job reader threads. Uses fake rhubarb processes"""
+    steps, interval = 40, 0.05
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "fake_rhubarb.py"
+        script.write_text(fake_rhubarb_script)
+        print(f"{'mode':12} {'jobs':>5} {'latency avg(ms)':>16} {'p95(ms)':>9} {'cpu(s)':>8} {'wall(s)':>8}")
+        for jobs_count in (1, 8, 32):
+            for multiplexed in (False, True):
+                jobs: list[RhubarbCommandAsyncJob] = []
+                for i in range(jobs_count):
+                    cmd = RhubarbCommandWrapper(script, extra_args=[sys.executable])
+                    # The fake ignores the standard args, the last three are the steps, interval and the output file for the timestamps
+                    cmd.build_lipsync_args = lambda input_file, dialog_file=None, cmd=cmd: [str(cmd.executable_path), str(steps), str(interval), input_file]
+                    jobs.append(RhubarbCommandAsyncJob(cmd, use_multiplexer=multiplexed))
+                received: list[dict[int, float]] = [{} for _ in jobs]
+                cpu_start, wall_start = time.process_time(), time.perf_counter()
+                for i, job in enumerate(jobs):
+                    job.cmd.lipsync_start(str(Path(tmp) / f"emitted_{i}.json"))
+                while not all(job.has_finished for job in jobs):
+                    for i, job in enumerate(jobs):
+                        if job.has_finished:
+                            continue
+                        p = job.lipsync_check_progress_async()
+                        if p is not None and p not in received[i]:
+                            received[i][p] = time.time()
+                    time.sleep(args.poll)
+                cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+                latencies = []
+                for i in range(jobs_count):
+                    emitted = json.loads((Path(tmp) / f"emitted_{i}.json").read_text())
+                    for step, emitted_t in enumerate(emitted, 1):
+                        received_t = received[i].get(int(step * 100 / steps))
+                        if received_t is not None:
+                            latencies.append((received_t - emitted_t) * 1000)
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0
+                mode = "multiplexer" if multiplexed else "threads"
+                print(f"{mode:12} {jobs_count:5} {statistics.mean(latencies):16.1f} {p95:9.1f} {cpu:8.2f} {wall:8.2f}")
+
+
+class ListCueProcessor(CueProcessor):
+    """The per-cue (list of MouthCueFrames) optimization passes as they were before the CueTable. The baseline for the cue_table benchmark"""
+
+    def trim_long_cues(self, max_dur: float, append_x: bool = True) -> int:
+        modified = 0
+        for i, cf in self.find_cues_by_duration(-1, max_dur, self.trim_tolerance):
+            modified += 1
+            new_end = cf.cue.start + max_dur
+            if append_x:
+                self.cue_frames.insert(i + modified, self.create_silence_cue(new_end, cf.cue.end))
+            cf.cue.end = new_end
+        return modified
+
+    def merge_double_x(self) -> int:
+        modified = 0
+        orig_list = list(self.cue_frames)
+        for i, cf in enumerate(orig_list):
+            if i <= 0 or not self.is_cue_silence(cf) or not self.is_cue_silence(orig_list[i - 1]):
+                continue
+            orig_list[i - 1].cue.end = cf.cue.end
+            self.cue_frames.pop(i - modified)
+            modified += 1
+        return modified
+
+    def ensure_frame_intersection(self) -> int:
+        modified = 0
+        for cf in self.cue_frames:
+            if cf.intersects_frame:
+                continue
+            if cf.start_frame_float - cf.start_frame_left < cf.end_frame_right - cf.end_frame_float:
+                cf.cue.start = self.frame2time(cf.start_frame_left)
+            else:
+                cf.cue.end = self.frame2time(cf.end_frame_right)
+            modified += 1
+        return modified
+
+    def optimize_cues(self, max_cue_duration=0.2) -> str:
+        self.trim_long_cues(max_cue_duration)
+        self.ensure_frame_intersection()
+        self.merge_double_x()
+        return ""
+
+
+def timeit(func: Callable[[], object], repeat=3) -> float:
+    """Best wall-clock time of the `repeat` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+@benchmark
+def cue_table(args: argparse.Namespace) -> None:
+    """Per-cue MouthCueFrames processing vs. the vectorized CueTable on synthetic cues"""
+    cfg = FrameConfig(60)
+    cues = random_cues(args.cues)
+
+    def cue_frames() -> list[MouthCueFrames]:
+        return [MouthCueFrames(c.__class__(c.key, c.start, c.end), cfg) for c in cues]
+
+    def frames_per_cue() -> None:
+        for cf in cue_frames():
+            cf.start_frame_float, cf.end_frame_float, cf.start_frame, cf.end_frame_right, cf.start_frame_left, cf.get_middle_start_frame(0.5)
+
+    def frames_table() -> None:
+        t = CueTable.from_cues(cfg, cues)
+        t.start_frame_float, t.end_frame_float, t.start_frame, t.end_frame_right, t.start_frame_left, t.get_middle_start_frame(0.5)
+
+    def passes(cls: type, step: str) -> Callable[[], object]:
+        def run() -> object:
+            cp = cls(cfg, cue_frames())
+            if step == "optimize_cues":
+                return cp.optimize_cues(0.2)
+            if step == "trim_long_cues":
+                return cp.trim_long_cues(0.2)
+            return getattr(cp, step)()
+
+        return run
+
+    table = CueTable.from_cues(cfg, cues)
+    table_steps: dict[str, Callable[[], object]] = {
+        "trim_long_cues": lambda: table.trim_long_cues(0.2, 0.05),
+        "ensure_frame_intersection": table.ensure_frame_intersection,
+        "merge_double_x": table.merge_double_x,
+        "optimize_cues": lambda: table.trim_long_cues(0.2, 0.05)[0].ensure_frame_intersection()[0].merge_double_x(),
+    }
+
+    # The cue frames creation is part of both the CueProcessor runs, so measure it separately and subtract
+    base = timeit(cue_frames)
+    print(f"{len(cues)} cues, creating the MouthCueFrames takes {base:.3f}s (subtracted from the CueProcessor times)")
+    print("CueProcessor(table) includes the conversion of the MouthCueFrames list to/from the table")
+    print(f"{'step':26} {'per cue(s)':>11} {'CueProcessor(table)(s)':>23} {'table only(s)':>14} {'speedup':>8}")
+    per_cue_t, table_t = timeit(frames_per_cue) - base, timeit(frames_table)
+    print(f"{'frame conversions':26} {per_cue_t:11.3f} {table_t:23.3f} {'':>14} {per_cue_t / table_t:8.1f}")
+    for step in table_steps:
+        per_cue_t = timeit(passes(ListCueProcessor, step), 1) - base
+        cp_t = timeit(passes(CueProcessor, step), 1) - base
+        table_t = timeit(table_steps[step])
+        print(f"{step:26} {per_cue_t:11.3f} {cp_t:23.3f} {table_t:14.4f} {per_cue_t / max(cp_t, 1e-6):8.1f}")
+
+
+@benchmark
+def cue_scaling(args: argparse.Namespace) -> None:
+    """Scaling of the cue optimization with the cue count. Linear when the time per cue stays flat"""
+    cfg = FrameConfig(60)
+    print(f"{'cues':>9} {'table(s)':>9} {'ns/cue':>7} {'optimize_cues(s)':>17} {'ns/cue':>7} {'per cue baseline(s)':>20} {'ns/cue':>7}")
+    for count in (1_000, 10_000, 100_000, 1_000_000):
+        cues = random_cues(count)
+        cp = CueProcessor(cfg, [])
+        table = CueTable.from_cues(cfg, cues)
+        table_t = timeit(lambda: cp.optimize_table(table, 0.2))
+
+        def new_processor(cls: type) -> CueProcessor:
+            return cls(cfg, [MouthCueFrames(c.__class__(c.key, c.start, c.end), cfg) for c in cues])
+
+        cp_t = timeit(lambda: new_processor(CueProcessor).optimize_cues(0.2), 1)
+        line = f"{count:9} {table_t:9.3f} {table_t / count * 1e9:7.0f} {cp_t:17.3f} {cp_t / count * 1e9:7.0f}"
+        if count <= args.max_baseline:  # Quadratic, takes ages for big counts
+            base_t = timeit(lambda: new_processor(ListCueProcessor).optimize_cues(0.2), 1)
+            line += f" {base_t:20.3f} {base_t / count * 1e9:7.0f}"
+        print(line)
+
+
+@benchmark
+def cue_io(args: argparse.Namespace) -> None:
+    """Whole-document json vs. the streaming json vs. the binary cue file: write/parse time and the file size"""
+    cues = random_cues(args.cues)
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path, bin_path = Path(tmp) / "cues.json", Path(tmp) / f"cues{CueBinary.file_suffix}"
+
+        def json_write() -> None:
+            json_path.write_text(RhubarbParser.unparse_mouth_cues(cues), encoding="utf-8")
+
+        def json_parse() -> list:
+            return RhubarbParser.lipsync_json2MouthCues(RhubarbParser.parse_lipsync_json(json_path.read_text(encoding="utf-8")))
+
+        def stream_write() -> None:
+            with open(json_path, "w", encoding="utf-8") as f:
+                write_json_cues(f, cues)
+
+        def stream_parse() -> list:
+            with open(json_path, encoding="utf-8") as f:
+                return list(iter_json_cues(f))
+
+        print(f"{len(cues)} cues")
+        print(f"{'format':18} {'write(s)':>9} {'parse(s)':>9} {'size(kB)':>9}")
+        json_write()
+        json_t = timeit(json_parse)
+        for name, write, parse, path in (
+            ("json", json_write, json_parse, json_path),
+            ("json streaming", stream_write, stream_parse, json_path),
+            ("binary", lambda: CueBinary.write_cues(bin_path, cues), lambda: CueBinary.read_cues(bin_path), bin_path),
+            ("binary columns", lambda: CueBinary.write_cues(bin_path, cues), lambda: CueBinary.read_columns(bin_path), bin_path),
+        ):
+            write_t = timeit(write)
+            parse_t = timeit(parse)
+            print(f"{name:18} {write_t:9.3f} {parse_t:9.3f} {path.stat().st_size / 1024:9.0f}  parse speedup {json_t / parse_t:.1f}x")
+
+
+def bake_scene(cues_count: int, objects_count: int) -> None:
+    """Empty scene with a capture of synthetic cues and `objects_count` armatures with mapping and two NLA tracks each"""
+    import bpy
+
+    import rhubarb_lipsync.blender.ui_utils as ui_utils
+    import sample_project
+    from rhubarb_lipsync.rhubarb.log_manager import logManager
+
+    project = sample_project.SampleProject()
+    logManager.set_level(logging.ERROR)  # The tests register with trace logging. Also silences the bake warnings
+    project.create_capture()
+    project.prefs.cue_list_prefs.highlight_long_cues = 1  # No trimming, keeps the strip count predictable
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "cues.json"
+        cues_json = [{"start": c.start, "end": c.end, "value": c.key} for c in random_cues(cues_count)]
+        json_path.write_text(json.dumps({"mouthCues": cues_json}))
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.import_json_cue_list(filepath=str(json_path)))
+    for _ in range(objects_count):
+        ui_utils.assert_op_ret(bpy.ops.object.armature_add())
+        project.initialize_mapping(bpy.context.active_object)
+        project.create_mapping([project.action_single, project.action_10])
+        project.add_track1()
+        project.add_track2()
+
+
+class RescanStripIndex:
+    """The strip lookup as it was before the `StripIndex`: reads all the strip starts of the track through the RNA on every call"""
+
+    def __init__(self, track) -> None:
+        self.track = track
+
+    def find_at(self, at_frame: float) -> tuple:
+        strips = self.track.strips
+        if not strips:
+            return -1, None
+        frame_starts = [strip.frame_start for strip in strips]
+        index = bisect_left(frame_starts, at_frame)
+        if index > 0:
+            index -= 1
+        strip = strips[index]
+        if at_frame < strip.frame_start or at_frame >= strip.frame_end:
+            return -1, None
+        return index, strip
+
+    def trim_end_at(self, at_frame: float) -> bool:
+        _, strip = self.find_at(at_frame)
+        if not strip:
+            return False
+        strip.frame_end = at_frame
+        return True
+
+    def add(self, strip) -> None:
+        pass
+
+
+@benchmark
+def bake(args: argparse.Namespace) -> None:
+    """Bake to NLA: the strip lookup rescanning the track vs. the per-track StripIndex, strip attributes written per strip vs. in bulk.
+    Needs the bpy"""
+    import bpy
+
+    import rhubarb_lipsync.blender.ui_utils as ui_utils
+    from rhubarb_lipsync.blender.baking_utils import BakingContext
+
+    bake_scene(args.bake_cues, args.bake_objects)
+
+    def run(mode: str) -> Callable[[], None]:
+        def bake_to_nla() -> None:
+            ui_utils.assert_op_ret(bpy.ops.rhubarb.remove_captured_nla_strips())
+            ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla(strip_write_mode=mode))
+
+        return bake_to_nla
+
+    print(f"{args.bake_cues} cues x {args.bake_objects} objects (2 tracks each)")
+    print(f"{'strip lookup':14} {'strip writing':14} {'bake(s)':>9}")
+    orig_strip_index = BakingContext.strip_index
+    try:
+        BakingContext.strip_index = lambda self, track: RescanStripIndex(track)
+        rescan_t = timeit(run("PER_STRIP"), 1)
+    finally:
+        BakingContext.strip_index = orig_strip_index
+    print(f"{'rescan':14} {'per strip':14} {rescan_t:9.2f}")
+    for mode in ("PER_STRIP", "BULK"):
+        t = timeit(run(mode), 1)
+        print(f"{'StripIndex':14} {mode.lower().replace('_', ' '):14} {t:9.2f} {rescan_t / t:8.1f}x")
+
+
+def main() -> None:
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run ({', '.join(benchmarks)}). All when not specified")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Max parallel processes")
+    parser.add_argument("--cues", type=int, default=100_000, help="Number of synthetic cues for the cue processing")
+    parser.add_argument("--max-baseline", type=int, default=100_000, help="Biggest cue count to run the (quadratic) per cue baseline with")
+    parser.add_argument("--bake-cues", type=int, default=5000, help="Number of synthetic cues to bake")
+    parser.add_argument("--bake-objects", type=int, default=20, help="Number of objects to bake the cues on")
+    parser.add_argument("--poll", type=float, default=0.01, help="Consumer polling interval (seconds) for the progress latency")
+    parser.add_argument("--min-segment", type=float, default=10, help="Min segment length (seconds) for the split capture")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(benchmarks)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+    for name in args.names or benchmarks:
+        print(f"=== {name}: {benchmarks[name].__doc__}")
+        benchmarks[name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 import unittest
+from types import SimpleNamespace
 
 import bpy
 
 import rhubarb_lipsync.blender.ui_utils as ui_utils
 import sample_project
+from rhubarb_lipsync.blender import action_support
+from rhubarb_lipsync.blender.baking_operators import BakeToNLA
 
 
 class BakingTest(unittest.TestCase):
@@ -75,6 +78,159 @@ class BakingTest(unittest.TestCase):
         self.bc = self.project.create_mapping_sheet()
         self.bakeTwoTracks()
 
+    def baked_strips(self) -> list[tuple]:
+        ret = []
+        for _ in self.bc.object_iter():
+            for t in self.bc.unique_tracks:
+                for s in t.strips:
+                    ret.append((s.name, s.frame_start, s.frame_end, s.scale, s.blend_in, s.blend_out, s.use_auto_blend, s.blend_type, s.extrapolation))
+        return ret
+
+    def testBakeBulkSameAsPerStrip(self) -> None:
+        self.bc = self.project.create_mapping_two_objects()
+        for o in self.bc.object_iter():
+            self.project.make_object_active(o)
+            self.project.add_track1()
+            self.project.add_track2()
+        self.project.prefs.strip_placement.strip_blend_type = "COMBINE"
+        self.project.prefs.cue_list_prefs.highlight_long_cues = 0.2
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla(strip_write_mode="PER_STRIP"))
+        per_strip = self.baked_strips()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.remove_captured_nla_strips())
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla(strip_write_mode="BULK"))
+        self.assertGreater(len(per_strip), 1)
+        self.assertEqual(self.baked_strips(), per_strip)
+
+    def testRebakeChangedCues(self) -> None:
+        self.bc = self.project.create_mapping_two_objects()
+        for o in self.bc.object_iter():
+            self.project.make_object_active(o)
+            self.project.add_track1()
+            self.project.add_track2()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla())
+        self.project.last_result.clear()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla(only_changed=True))
+        self.assertEqual(self.project.parse_last_bake_result_details(), (0, 0), "Nothing changed, nothing baked")
+        self.project.cue_items[4].key = "C"
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla(only_changed=True))
+        cues, strips = self.project.parse_last_bake_result_details()
+        self.assertLess(cues, len(self.project.cue_items), "Only the changed range rebaked")
+        rebaked = self.baked_strips()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.remove_captured_nla_strips())
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla())
+        self.assertEqual(rebaked, self.baked_strips())
+
+    def bake_in_background(self, max_ticks=1000, **props) -> None:
+        self.assertEqual(bpy.ops.rhubarb.bake_to_nla(background=True, **props), {'RUNNING_MODAL'})
+        for _ in range(max_ticks):
+            op = BakeToNLA.last_op
+            if not op:
+                return
+            op.modal(bpy.context, None)
+        self.fail("Background bake didn't finish")
+
+    def testBakeInBackground(self) -> None:
+        self.bc = self.project.create_mapping_two_objects()
+        for o in self.bc.object_iter():
+            self.project.make_object_active(o)
+            self.project.add_track1()
+            self.project.add_track2()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla())
+        expected = self.baked_strips()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.remove_captured_nla_strips())
+        self.bake_in_background()
+        self.assertEqual(self.baked_strips(), expected)
+        self.assertEqual(self.project.parse_last_bake_result_details(), (8, 16))
+
+    def testBakeInBackgroundCancelAndResume(self) -> None:
+        self.bc = self.project.create_mapping_two_objects()
+        for o in self.bc.object_iter():
+            self.project.make_object_active(o)
+            self.project.add_track1()
+            self.project.add_track2()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla())
+        expected = self.baked_strips()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.remove_captured_nla_strips())
+        slice_seconds = BakeToNLA.slice_seconds
+        try:
+            BakeToNLA.slice_seconds = 0  # A single cue per tick
+            self.assertEqual(bpy.ops.rhubarb.bake_to_nla(background=True), {'RUNNING_MODAL'})
+            for _ in range(10):  # The first object (8 cues) done, the second one in the middle
+                BakeToNLA.last_op.modal(bpy.context, None)
+            BakeToNLA.last_op.modal(bpy.context, SimpleNamespace(type='ESC'))
+            self.assertIsNone(BakeToNLA.last_op)
+            strip_counts = [sum(len(t.strips) for t in self.bc.unique_tracks) for _ in self.bc.object_iter()]
+            self.assertEqual(strip_counts, [8, 0], "Strips of the not finished object removed")
+            self.bake_in_background(resume=True)
+        finally:
+            BakeToNLA.slice_seconds = slice_seconds
+        self.assertEqual(self.baked_strips(), expected)
+        self.assertFalse(self.project.cprops.interrupted_bake)
+
+    def testBakeInBackgroundCancelRestoresTrimmed(self) -> None:
+        self.bc = self.project.create_mapping_1action_on_armature()
+        self.project.add_track1()
+        track = self.bc.track1
+        existing = track.strips.new("Existing", -50, self.project.action_single)
+        existing.frame_end = 1000  # Overlaps the whole capture, trimmed by the first baked strip
+        slice_seconds = BakeToNLA.slice_seconds
+        try:
+            BakeToNLA.slice_seconds = 0  # A single cue per tick
+            self.assertEqual(bpy.ops.rhubarb.bake_to_nla(background=True), {'RUNNING_MODAL'})
+            for _ in range(3):
+                BakeToNLA.last_op.modal(bpy.context, None)
+            self.assertLess(existing.frame_end, 1000, "Trimmed")
+            BakeToNLA.last_op.modal(bpy.context, SimpleNamespace(type='ESC'))
+        finally:
+            BakeToNLA.slice_seconds = slice_seconds
+        self.assertEqual([s.name for s in track.strips], ["Existing"])
+        self.assertEqual(existing.frame_end, 1000)
+
+    def assertKeyframesSameAsNla(self) -> None:
+        for o in self.bc.object_iter():
+            self.project.make_object_active(o)
+            self.project.add_track1()
+            self.project.add_track2()
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_nla())
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_keyframes())
+        scene = bpy.context.scene
+        for o in self.bc.object_iter():
+            ad = o.animation_data
+            fcurves = list(action_support.get_action_fcurves(ad.action))
+            self.assertTrue(fcurves, "No F-Curves baked")
+            ad.action = None  # Evaluate the NLA strips only
+            for kp in fcurves[0].keyframe_points:
+                scene.frame_set(int(kp.co[0]))
+                for fc in fcurves:
+                    nla_value = o.path_resolve(fc.data_path)[fc.array_index]
+                    self.assertAlmostEqual(fc.evaluate(kp.co[0]), nla_value, places=4, msg=f"{fc.data_path}[{fc.array_index}] at frame {kp.co[0]}")
+
+    def testBakeKeyframesReplacesPreviousBake(self) -> None:
+        self.bc = self.project.create_mapping_1action_on_armature()
+        o = self.project.armature1
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_keyframes())
+        action = o.animation_data.action
+        self.assertEqual(action.name, f"{o.name}.lipsync")
+        actions_count = len(bpy.data.actions)
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_keyframes())
+        self.assertEqual(len(bpy.data.actions), actions_count, "The previous bake replaced")
+        self.assertEqual(o.animation_data.action.name, f"{o.name}.lipsync")
+
+        user_action = bpy.data.actions.new("UserAnimation")
+        o.animation_data.action = user_action
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.bake_to_keyframes())
+        self.assertEqual(o.animation_data.action, user_action, "The user's Action kept")
+        rll = self.project.clist_props.last_resut_log
+        self.assertTrue(any("UserAnimation" in item.msg for item in rll.items), "Error reported")
+
+    def testBakeKeyframesSameAsNla(self) -> None:
+        self.bc = self.project.create_mapping_2actions_on_armature()
+        self.assertKeyframesSameAsNla()
+
+    def testBakeKeyframesSameAsNlaActionSheet(self) -> None:
+        self.bc = self.project.create_mapping_sheet()
+        self.assertKeyframesSameAsNla()
+
 
 if __name__ == "__main__":
     unittest.main()
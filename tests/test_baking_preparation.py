@@ -1,6 +1,8 @@
 import unittest
 from dataclasses import dataclass
 
+import bpy
+
 import rhubarb_lipsync.blender.baking_utils as baking_utils
 import sample_project
 
@@ -34,6 +36,33 @@ class BakingUtilsTest(unittest.TestCase):
         self.assertEqual(baking_utils.find_strip_at(BakingUtilsTest.t1, 40)[0], 2)
         self.assertEqual(baking_utils.find_strip_at(BakingUtilsTest.t1, 200)[0], -1)
 
+    def testStripIndex(self) -> None:
+        t = MockTrack([MockStrip(1, 10), MockStrip(10, 20)])
+        index = baking_utils.StripIndex(t)
+        self.assertEqual(index.find_at(15)[0], 1)
+        self.assertFalse(index.trim_end_at(25))
+        self.assertTrue(index.trim_end_at(15))
+        self.assertEqual(t.strips[1].frame_end, 15)
+        self.assertEqual(index.find_at(17)[0], -1, "Trimmed")
+        s = MockStrip(30, 40)
+        t.strips.append(s)
+        index.add(s)
+        self.assertEqual(index.find_at(35), (2, s))
+        s = MockStrip(20, 25)
+        index.add(s)  # Out of order
+        self.assertEqual(index.find_at(21), (2, s))
+        self.assertEqual(index.find_at(31)[0], 3)
+        self.assertEqual(len(index), 4)
+
+    def testStripIndexCountInRange(self) -> None:
+        index = baking_utils.StripIndex(MockTrack([MockStrip(1, 10), MockStrip(10, 20), MockStrip(30, 40)]))
+        self.assertEqual(index.count_in_range(0, 100), 3)
+        self.assertEqual(index.count_in_range(12, 25), 1)
+        self.assertEqual(index.count_in_range(20, 30), 2, "Touching strips are in range")
+        self.assertEqual(index.count_in_range(21, 29), 0)
+        self.assertEqual(index.count_in_range(41, 50), 0)
+        self.assertEqual(baking_utils.StripIndex(MockTrack([])).count_in_range(0, 100), 0)
+
 
 class BakingContextTest(unittest.TestCase):
     def setUp(self) -> None:
@@ -64,6 +93,36 @@ class BakingContextTest(unittest.TestCase):
         errs = self.bc.validate_track()
         assert len(errs) == 0, errs[0]
 
+    def testValidationCache(self) -> None:
+        self.bc = self.project.create_mapping_1action_on_armature()
+        assert self.bc.current_object, "No object selected"
+        errs = self.bc.validate_current_object_cached()
+        self.assertTrue(errs, "No track selected")
+        self.assertIs(self.bc.validate_current_object_cached(), errs, "Cached")
+        self.project.add_track1()  # Track selection bumps the mapping revision
+        self.assertEqual(self.bc.validate_current_object_cached(), [])
+        errs = self.bc.validate_current_object_cached()
+        self.assertIs(self.bc.validate_current_object_cached(), errs, "Cached until invalidated")
+        baking_utils.ValidationCache.invalidate()
+        self.assertIsNot(self.bc.validate_current_object_cached(), errs)
+        errs = self.bc.validate_current_object_cached()
+        bpy.context.scene.frame_current += 1
+        self.assertIs(self.bc.validate_current_object_cached(), errs, "No custom frame range, the current frame doesn't matter")
+        self.bc.mprops.items[0].action = None  # Mapping changed, no depsgraph update yet
+        self.assertTrue(self.bc.validate_current_object_cached(), "Mapping revision changed")
+
+    def testValidationStripIndex(self) -> None:
+        self.bc = self.project.create_mapping_1action_on_armature()
+        self.project.add_track1()
+        track = self.bc.track1
+        index = baking_utils.ValidationCache.strip_index(track)
+        self.assertIs(baking_utils.ValidationCache.strip_index(track), index, "Cached")
+        track.strips.new("strip", 1, self.project.action_single)
+        index2 = baking_utils.ValidationCache.strip_index(track)
+        self.assertIsNot(index2, index, "Strip added")
+        self.assertEqual(len(index2), 1)
+        self.assertEqual(self.bc.validate_track(), ["Clash with 1 existing strips. #!RemoveStrips"])
+
     def testTrackValidation_1action(self) -> None:
         self.bc = self.project.create_mapping_1action_on_armature()
         self.trackValidation()
@@ -0,0 +1,77 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import bpy
+
+import rhubarb_lipsync.blender.ui_utils as ui_utils
+import sample_project
+from rhubarb_lipsync.blender.batch_pipeline import RunBatchPipeline, load_mapping_preset
+
+
+class BatchPipelineTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.project = sample_project.SampleProject()
+        self.project.create_capture()  # Fixes the executable path when needed
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.delete_capture_props())
+        # Set the trim-long-cues to hight number to avoid trimming for test consistency (extra X cues)
+        self.project.prefs.cue_list_prefs.highlight_long_cues = 1
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sounds = Path(self.tmp.name) / "sounds"
+        self.output = Path(self.tmp.name) / "out"
+        self.sounds.mkdir()
+        sample = self.project.sample
+        shutil.copy(sample.snd_file_path, self.sounds)
+        shutil.copy(sample.expected_json_path, self.sounds)  # Ignored by the pipeline
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def testPipeline(self) -> None:
+        self.project.create_mapping_2actions_on_armature()
+        ret = bpy.ops.rhubarb.run_batch_pipeline(sound_folder=str(self.sounds), output_folder=str(self.output), target_object="Armature")
+        ui_utils.assert_op_ret(ret)
+        report = RunBatchPipeline.last_report
+        self.assertEqual(len(report.takes), 1)
+        take = report.takes[0]
+        self.assertEqual(take.status, "Done", take.error)
+        self.assertEqual(take.cues, len(self.project.sample.expected_cues))
+        self.assertGreater(take.strips, 1)
+        for stage in ("capture", "bake", "export_json", "save_blend"):
+            self.assertIn(stage, take.timings)
+        self.assertTrue(Path(take.outputs["json"]).exists())
+        self.assertTrue(Path(take.outputs["blend"]).exists())
+        saved = json.loads((self.output / "report.json").read_text())
+        self.assertEqual(saved["failed"], 0)
+        self.assertIn("total", saved["timings"])
+        # Re-run reuses the capture
+        ui_utils.assert_op_ret(bpy.ops.rhubarb.run_batch_pipeline(sound_folder=str(self.sounds), output_folder=str(self.output), target_object="Armature"))
+        self.assertEqual(len(self.project.clist_props.items), 1)
+
+    def testMissingObject(self) -> None:
+        with self.assertRaises(RuntimeError):  # Operator reports an error
+            bpy.ops.rhubarb.run_batch_pipeline(sound_folder=str(self.sounds), output_folder=str(self.output), target_object="NoSuchObject")
+
+    def testMappingPreset(self) -> None:
+        obj = self.project.armature1
+        self.project.initialize_mapping(obj)
+        preset = Path(self.tmp.name) / "preset.json"
+        preset.write_text(
+            json.dumps(
+                {"A": self.project.action_single.name, "B": {"action": self.project.action_10.name, "frame_start": 2, "frame_count": 5}, "C": "NoSuchAction"}
+            )
+        )
+        missing = load_mapping_preset(self.project.mprops, obj, preset)
+        self.assertEqual(missing, ["C"])
+        items = {mi.key: mi for mi in self.project.mprops.items}
+        self.assertEqual(items["A"].action, self.project.action_single)
+        self.assertFalse(items["A"].custom_frame_ranage)
+        self.assertEqual(items["B"].action, self.project.action_10)
+        self.assertEqual(items["B"].frame_range, (2, 7))
+        self.assertIsNone(items["C"].action)
+
+
+if __name__ == '__main__':
+    unittest.main()
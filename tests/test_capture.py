@@ -1,10 +1,13 @@
+import tempfile
 import unittest
+from time import sleep
 
 import bpy
 
 import rhubarb_lipsync.blender.ui_utils as ui_utils
 import sample_project
 from helper import skip_no_aud
+from rhubarb_lipsync.blender.rhubarb_operators import ProcessSoundFilesBatch
 
 
 class CaptureTest(unittest.TestCase):
@@ -21,6 +24,47 @@ class CaptureTest(unittest.TestCase):
         self.project.capture()
         print("done")
 
+    @skip_no_aud
+    def testCaptureCached(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            prefs = self.project.prefs
+            prefs.use_cache = True
+            prefs.cache_folder = tmp
+            try:
+                self.project.capture()
+                # Same sound again, served from the cache
+                ret = bpy.ops.rhubarb.process_sound_file()
+                assert 'FINISHED' in ret, ret
+                assert self.project.jprops.status == "Cached"
+                self.project.assert_cues_matches_sample()
+            finally:
+                prefs.use_cache = False
+                prefs.cache_folder = ""
+
+    @skip_no_aud
+    def testCaptureBatch(self) -> None:
+        for i in range(3):
+            self.project.create_capture()
+            self.project.set_capture_sound()
+        ret = bpy.ops.rhubarb.process_sound_files_batch(captures_filter="EMPTY")
+        assert 'RUNNING_MODAL' in ret
+        for i in range(500):
+            op = ProcessSoundFilesBatch.last_op
+            if not op:
+                break
+            op.modal(bpy.context, None)
+            sleep(0.1)
+        assert not ProcessSoundFilesBatch.last_op, "Batch capture didn't finish"
+        clist = self.project.clist_props
+        assert clist.batch_job.progress == 100
+        assert not clist.batch_job.error, clist.batch_job.error
+        for capture in clist.items:
+            assert capture.job.status == "Done", f"{capture.job.status} {capture.job.error}"
+            res = self.project.sample.compare_cues_with_expected([ci.cue for ci in capture.cue_list.items])
+            assert res is None, res
+        # All the captures have cues now, nothing left to process
+        assert not ProcessSoundFilesBatch.batch_capture_indices(bpy.context, "EMPTY")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import sample_data
+from rhubarb_lipsync.rhubarb.cue_cache import CueCache
+from rhubarb_lipsync.rhubarb.mouth_cues import MouthCue
+
+
+class CueCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = pathlib.Path(self.tmp.name)
+        self.cache = CueCache(self.folder, 1024 * 1024)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    @property
+    def sample(self) -> sample_data.SampleData:
+        return sample_data.snd_en_male_electricity
+
+    def testSerializeRoundTrip(self) -> None:
+        cues = self.sample.expected_cues
+        data = CueCache.serialize(cues)
+        self.assertEqual(len(data), len(CueCache.header) + 4 + len(cues) * CueCache.record.size)
+        res = self.sample.compare_cues_with_expected(CueCache.deserialize(data))
+        self.assertIsNone(res, res)
+        with self.assertRaises(ValueError):
+            CueCache.deserialize(b"garbage")
+        with self.assertRaises(ValueError):
+            CueCache.deserialize(data[:-1])
+
+    def testKey(self) -> None:
+        snd = str(self.sample.snd_file_path)
+        other_snd = str(sample_data.snd_en_femal_3kittens.snd_file_path)
+        k = CueCache.build_key(snd, None, ["pocketSphinx", "True", "1.13.0"])
+        self.assertEqual(k, CueCache.build_key(snd, None, ["pocketSphinx", "True", "1.13.0"]))
+        self.assertNotEqual(k, CueCache.build_key(other_snd, None, ["pocketSphinx", "True", "1.13.0"]))
+        self.assertNotEqual(k, CueCache.build_key(snd, None, ["phonetic", "True", "1.13.0"]))
+        self.assertNotEqual(k, CueCache.build_key(snd, None, ["pocketSphinx", "False", "1.13.0"]))
+        self.assertNotEqual(k, CueCache.build_key(snd, None, ["pocketSphinx", "True", "1.12.0"]))
+        dialog = str(sample_data.snd_en_femal_3kittens.snd_file_path.with_suffix(".txt"))
+        self.assertNotEqual(k, CueCache.build_key(snd, dialog, ["pocketSphinx", "True", "1.13.0"]))
+
+    def testPutGet(self) -> None:
+        self.assertIsNone(self.cache.get("missing"))
+        cues = [MouthCue("A", 0, 0.5), MouthCue("X", 0.5, 1.25)]
+        self.cache.put("k1", cues)
+        cached = self.cache.get("k1")
+        self.assertEqual([(c.key, c.start, c.end) for c in cached], [("A", 0, 0.5), ("X", 0.5, 1.25)])
+        self.assertEqual(self.cache.clear(), 1)
+        self.assertIsNone(self.cache.get("k1"))
+
+    def testEvictLeastRecentlyUsed(self) -> None:
+        cues = [MouthCue("A", i, i + 1) for i in range(10)]
+        entry_size = len(CueCache.serialize(cues))
+        self.cache.max_size_bytes = entry_size * 2
+        self.cache.put("old", cues)
+        self.cache.put("used", cues)
+        # Make the mtimes distinct and deterministic, then mark the "used" as the recently used one
+        os.utime(self.cache.entry_path("old"), ns=(1_000_000_000, 1_000_000_000))
+        os.utime(self.cache.entry_path("used"), ns=(2_000_000_000, 2_000_000_000))
+        self.assertIsNotNone(self.cache.get("used"))
+        self.cache.put("new", cues)
+        self.assertIsNone(self.cache.get("old"))
+        self.assertIsNotNone(self.cache.get("used"))
+        self.assertIsNotNone(self.cache.get("new"))
+        self.assertLessEqual(self.cache.size_bytes, self.cache.max_size_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from typing import Optional
+
+import pytest
+
+from rhubarb_lipsync.rhubarb.cue_filter import CueFilterIndex, CueFilterQuery
+from rhubarb_lipsync.rhubarb.cue_table import CueTable
+from rhubarb_lipsync.rhubarb.mouth_cues import FrameConfig, MouthCue
+from test_cue_table import random_cues
+
+CUES = random_cues(500)
+
+
+def matches(c: MouthCue, q: CueFilterQuery) -> bool:
+    if q.keys is not None and c.key not in q.keys:
+        return False
+    if q.time_from is not None and c.end <= q.time_from:
+        return False
+    if q.time_to is not None and c.start >= q.time_to:
+        return False
+    if q.only_suspicious:
+        long = q.highlight_long > 0 and c.duration > q.highlight_long
+        short = q.highlight_short >= 0 and c.duration <= q.highlight_short
+        if c.key == "X" or not (long or short):
+            return False
+    return True
+
+
+def time_at(i: int) -> Optional[float]:
+    return CUES[i].start + 0.001
+
+
+@pytest.mark.parametrize(
+    "q",
+    [
+        CueFilterQuery(),
+        CueFilterQuery(keys=frozenset("GH")),
+        CueFilterQuery(keys=frozenset()),
+        CueFilterQuery(time_from=time_at(100), time_to=time_at(200)),
+        CueFilterQuery(time_from=CUES[100].start, time_to=CUES[200].start),
+        CueFilterQuery(time_to=time_at(10)),
+        CueFilterQuery(only_suspicious=True, highlight_long=0.2, highlight_short=0.01),
+        CueFilterQuery(only_suspicious=True, highlight_long=-1, highlight_short=0.01),
+        CueFilterQuery(keys=frozenset("AX"), only_suspicious=True, highlight_long=0.2, highlight_short=-1),
+        CueFilterQuery(keys=frozenset("ABCDEFGH"), time_from=time_at(50), only_suspicious=True, highlight_long=0.2, highlight_short=0.01),
+    ],
+)
+def test_query_matches_brute_force(q: CueFilterQuery) -> None:
+    index = CueFilterIndex(CueTable.from_cues(FrameConfig(1), CUES))
+    expected = [i for i, c in enumerate(CUES) if matches(c, q)]
+    assert index.query(q).tolist() == expected
+
+
+def test_flags() -> None:
+    index = CueFilterIndex(CueTable.from_cues(FrameConfig(1), CUES))
+    q = CueFilterQuery(keys=frozenset("G"))
+    flags = index.flags(q, 1 << 30)
+    assert len(flags) == len(CUES)
+    assert [i for i, f in enumerate(flags) if f] == [i for i, c in enumerate(CUES) if c.key == "G"]
+    assert CueFilterQuery().is_empty
+    assert not q.is_empty
@@ -0,0 +1,76 @@
+import io
+import json
+import pathlib
+import tempfile
+import unittest
+
+import sample_data
+from rhubarb_lipsync.rhubarb.cue_io import CueBinary, iter_json_cues, write_json_cues
+from rhubarb_lipsync.rhubarb.rhubarb_command import RhubarbParser
+from test_cue_table import keys_times, random_cues
+
+
+class CueIOTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = pathlib.Path(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    @property
+    def sample(self) -> sample_data.SampleData:
+        return sample_data.snd_en_male_electricity
+
+    def testStreamingParse(self) -> None:
+        for chunk_size in (1, 7, 64 * 1024):
+            cues = list(iter_json_cues(io.StringIO(self.sample.expected_json), chunk_size))
+            res = self.sample.compare_cues_with_expected(cues)
+            self.assertIsNone(res, f"chunk_size={chunk_size}: {res}")
+
+    def testStreamingParseErrors(self) -> None:
+        self.assertEqual(list(iter_json_cues(io.StringIO('{"metadata": {}}'))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_cues(io.StringIO('{"mouthCues": [ {"start": 0.00, "end": 0.28, "value": "X"}, {"start"')))
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_cues(io.StringIO('{"mouthCues": [ {"start": 0.00 "end"} ]}')))
+
+    def testStreamingWriteSameAsUnparse(self) -> None:
+        for cues in ([], self.sample.expected_cues, random_cues(100)):
+            f = io.StringIO()
+            write_json_cues(f, cues, "a.ogg")
+            self.assertEqual(f.getvalue(), RhubarbParser.unparse_mouth_cues(cues, "a.ogg"))
+
+    def testBinaryRoundTrip(self) -> None:
+        path = self.folder / f"a{CueBinary.file_suffix}"
+        cues = self.sample.expected_cues
+        CueBinary.write_cues(path, cues)
+        self.assertEqual(path.stat().st_size, CueBinary.header.size + len(cues) * 9)
+        res = self.sample.compare_cues_with_expected(CueBinary.read_cues(path))
+        self.assertIsNone(res, res)
+        cues = random_cues(1000)
+        CueBinary.write_cues(path, cues)
+        self.assertEqual(keys_times(CueBinary.read_cues(path)), [(k, round(s, 4), round(e, 4)) for k, s, e in keys_times(cues)])
+        CueBinary.write_cues(path, [])
+        self.assertEqual(CueBinary.read_cues(path), [])
+
+    def testBinaryCorrupted(self) -> None:
+        path = self.folder / f"a{CueBinary.file_suffix}"
+        CueBinary.write_cues(path, self.sample.expected_cues)
+        path.write_bytes(path.read_bytes()[:-1])
+        with self.assertRaises(ValueError):
+            CueBinary.read_cues(path)
+        CueBinary.write_cues(path, self.sample.expected_cues)
+        data = bytearray(path.read_bytes())
+        data[CueBinary.header.size] = 200  # Key of the first cue, negative as int8
+        path.write_bytes(bytes(data))
+        with self.assertRaises(ValueError):
+            CueBinary.read_cues(path)
+        path.write_bytes(b"{}")
+        with self.assertRaises(ValueError):
+            CueBinary.read_cues(path)
+        self.assertTrue(CueBinary.is_binary_path("a.RLPSCUES"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import random
+
+import numpy as np
+import pytest
+from pytest import approx
+
+from rhubarb_lipsync.rhubarb.cue_processor import CueProcessor
+from rhubarb_lipsync.rhubarb.cue_table import CueTable
+from rhubarb_lipsync.rhubarb.mouth_cues import FrameConfig, MouthCue, MouthCueFrames
+
+
+def random_cues(count: int, seed=1) -> list[MouthCue]:
+    rnd = random.Random(seed)
+    ret: list[MouthCue] = []
+    t = 0.0
+    for _ in range(count):
+        d = rnd.choice([0.005, 0.01, 0.04, 0.1, 0.3, 0.6])
+        ret.append(MouthCue(rnd.choice("ABCDEFGHXX"), t, t + d))
+        t += d
+    return ret
+
+
+def keys_times(cues: list[MouthCue]) -> list[tuple[str, float, float]]:
+    return [(c.key, round(c.start, 6), round(c.end, 6)) for c in cues]
+
+
+@pytest.mark.parametrize(
+    "fcfg",
+    [
+        FrameConfig(60, 1, 0),
+        FrameConfig(60, 1, 10),
+        FrameConfig(2997, 100, -2),
+        FrameConfig(5, 1, 0),
+    ],
+    ids=[
+        "60fps no offset",
+        "60fps +10 frames shift",
+        "29.97fps -2 frames offset",
+        "5fps no offset",
+    ],
+)
+class TestCueTable:
+    def test_frame_conversions_match_cue_frames(self, fcfg: FrameConfig) -> None:
+        cues = random_cues(500)
+        t = CueTable.from_cues(fcfg, cues)
+        cfs = [MouthCueFrames(c, fcfg) for c in cues]
+        assert t.start_frame_float.tolist() == approx([cf.start_frame_float for cf in cfs])
+        assert t.end_frame_float.tolist() == approx([cf.end_frame_float for cf in cfs])
+        assert t.start_frame.tolist() == [cf.start_frame for cf in cfs]
+        assert t.end_frame.tolist() == [cf.end_frame for cf in cfs]
+        assert t.start_frame_left.tolist() == [cf.start_frame_left for cf in cfs]
+        assert t.start_frame_right.tolist() == [cf.start_frame_right for cf in cfs]
+        assert t.end_frame_left.tolist() == [cf.end_frame_left for cf in cfs]
+        assert t.end_frame_right.tolist() == [cf.end_frame_right for cf in cfs]
+        assert t.intersects_frame.tolist() == [cf.intersects_frame for cf in cfs]
+        assert t.start_subframe[0].tolist() == [cf.start_subframe[0] for cf in cfs]
+        assert t.get_middle_start_frame(0.3).tolist() == approx([cf.get_middle_start_frame(0.3) for cf in cfs])
+        assert t.get_middle_end_frame_float(0.3).tolist() == approx([cf.get_middle_end_frame_float(0.3) for cf in cfs])
+
+    def test_round_trip(self, fcfg: FrameConfig) -> None:
+        cues = random_cues(50)
+        assert CueTable.from_cues(fcfg, cues).to_cues() == cues
+        assert len(CueTable.from_cues(fcfg, [])) == 0
+
+    def test_ensure_frame_intersection(self, fcfg: FrameConfig) -> None:
+        t, count = CueTable.from_cues(fcfg, random_cues(500)).ensure_frame_intersection()
+        assert count > 0
+        assert t.intersects_frame.all()
+        assert t.ensure_frame_intersection()[1] == 0
+
+
+class TestCueTablePasses:
+    fcfg = FrameConfig(60)
+
+    def test_trim(self) -> None:
+        cues = [MouthCue("A", 0, 1), MouthCue("X", 1, 2), MouthCue("B", 2, 2.1), MouthCue("C", 2.1, 3)]
+        t, count = CueTable.from_cues(self.fcfg, cues).trim_long_cues(0.2, 0.05)
+        assert count == 2
+        assert keys_times(t.to_cues()) == [("A", 0, 0.2), ("X", 0.2, 1), ("X", 1, 2), ("B", 2, 2.1), ("C", 2.1, 2.3), ("X", 2.3, 3)]
+        t, count = CueTable.from_cues(self.fcfg, cues).trim_long_cues(0.2, 0.05, append_x=False)
+        assert keys_times(t.to_cues()) == [("A", 0, 0.2), ("X", 1, 2), ("B", 2, 2.1), ("C", 2.1, 2.3)]
+
+    def test_trim_without_extended_shapes(self) -> None:
+        cues = [MouthCue("A", 0, 1), MouthCue("B", 1, 2)]
+        t, count = CueTable.from_cues(self.fcfg, cues).trim_long_cues(0.5, 0.05, use_extended_shapes=False)
+        assert count == 1, "The A is the silence"
+        assert keys_times(t.to_cues()) == [("A", 0, 1), ("B", 1, 1.5), ("A", 1.5, 2)]
+
+    def test_merge_double_x(self) -> None:
+        cues = [MouthCue("X", 0, 1), MouthCue("X", 1, 2), MouthCue("X", 2, 3), MouthCue("A", 3, 4), MouthCue("X", 4, 5), MouthCue("X", 5, 6)]
+        t, count = CueTable.from_cues(self.fcfg, cues).merge_double_x()
+        assert count == 3
+        assert keys_times(t.to_cues()) == [("X", 0, 3), ("A", 3, 4), ("X", 4, 6)]
+        assert t.merge_double_x()[1] == 0
+
+    def test_cue_processor_optimize(self) -> None:
+        cues = random_cues(2000)
+        cp = CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in cues])
+        report = cp.optimize_cues(0.2)
+        assert "ends trimmed" in report
+        t = cp.table
+        assert np.all(t.durations > 0)
+        assert np.all(np.diff(t.starts) > 0), "Order preserved"
+        assert t.intersects_frame.all()
+        sil = t.silence_mask(True)
+        assert not np.any(sil[1:] & sil[:-1]), "No double X"
+
+    def test_custom_optimization_steps(self) -> None:
+        cues = [MouthCue("A", 0, 1), MouthCue("X", 1, 2), MouthCue("X", 2, 3)]
+        cp = CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in cues])
+
+        def drop_a(cp: CueProcessor, t: CueTable, max_dur: float) -> tuple[CueTable, int]:
+            keep = t.keys != 0
+            return t.with_columns(t.keys[keep], t.starts[keep], t.ends[keep]), int(np.count_nonzero(~keep))
+
+        steps = [("A removed", drop_a), *CueProcessor.optimization_steps]
+        report = cp.optimize_cues(0.2, steps)
+        assert report == " A removed: 1 double X removed: 1"
+        assert keys_times([cf.cue for cf in cp.cue_frames]) == [("X", 1, 3)]
+
+    def test_register_optimization_step(self) -> None:
+        registered = list(CueProcessor.optimization_steps)
+        try:
+            calls = []
+
+            @CueProcessor.optimization_step("noop")
+            def noop(cp: CueProcessor, t: CueTable, max_dur: float) -> tuple[CueTable, int]:
+                calls.append(len(t))
+                return t, 0
+
+            assert CueProcessor.optimization_steps[-1] == ("noop", noop)
+            cp = CueProcessor(self.fcfg, [MouthCueFrames(MouthCue("A", 0, 1), self.fcfg)])
+            cp.optimize_cues(0.2)
+            assert calls == [2], "Runs last, after the trim added an X"
+        finally:
+            CueProcessor.optimization_steps[:] = registered
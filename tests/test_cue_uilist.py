@@ -0,0 +1,75 @@
+import unittest
+
+import bpy
+
+import sample_project
+from rhubarb_lipsync.blender.capture_properties import MouthCueListItem
+from rhubarb_lipsync.blender.cue_uilist import CueFilterCache, CueRowCache
+from rhubarb_lipsync.rhubarb.cue_filter import CueFilterQuery
+from rhubarb_lipsync.rhubarb.mouth_cues import MouthCue, MouthCueFrames
+
+
+class CueUIListTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.project = sample_project.SampleProject()
+        self.project.create_capture()
+        self.project.cue_list.add_cues([MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.52), MouthCue("H", 0.52, 1.25), MouthCue("B", 1.25, 1.3)])
+        self.clp = self.project.prefs.cue_list_prefs
+        CueRowCache.invalidate()
+        CueFilterCache.invalidate()
+
+    def rows(self):
+        return CueRowCache.rows(bpy.context, self.project.cue_list, self.clp)
+
+    def testRowsMatchCueFrames(self) -> None:
+        self.project.cprops.start_frame = 10
+        for subframes in (False, True):
+            bpy.context.scene.show_subframe = subframes
+            rows = self.rows()
+            frame_cfg = MouthCueListItem.frame_config_from_context(bpy.context)
+            for i, item in enumerate(self.project.cue_items):
+                cf = MouthCueFrames(item.cue, frame_cfg)
+                row = rows[i]
+                self.assertEqual(row.key, item.key)
+                self.assertEqual(row.start_frame, cf.start_frame_str)
+                self.assertEqual(row.start_time, f"{cf.start_time_str}s")
+                self.assertEqual(row.duration_frames, cf.duration_frames_str)
+                self.assertEqual(row.duration_time, f"{cf.duration_str}s")
+                self.assertEqual(row.end_frame, cf.end_frame_str)
+                self.assertEqual(row.end_time, f"{cf.end_time_str}s")
+                self.assertEqual(row.play_start, cf.start_frame_left)
+                self.assertEqual(row.play_frames, cf.duration_frames)
+        self.assertTrue(rows[0].inactive)
+        self.assertFalse(rows[0].alert, "Silence is never highlighted")
+        self.assertTrue(rows[2].alert, "Too long")
+
+    def testCacheInvalidation(self) -> None:
+        rows = self.rows()
+        self.assertIs(self.rows(), rows, "Cached")
+        self.assertEqual(rows[1].key, "A")
+        self.project.cue_items[1].key = "C"  # Edit bumps the list revision
+        rows2 = self.rows()
+        self.assertIsNot(rows2, rows)
+        self.assertEqual(rows2[1].key, "C")
+        bpy.context.scene.render.fps = 30
+        self.assertIsNot(self.rows(), rows2, "Fps changed")
+        rows3 = self.rows()
+        self.project.cprops.start_frame = 5
+        self.assertIsNot(self.rows(), rows3, "Start frame changed")
+        self.project.cue_list.clear()
+        self.assertEqual(len(self.rows()), 0)
+
+    def testFilterCache(self) -> None:
+        cl = self.project.cue_list
+        q = CueFilterQuery(keys=frozenset("AH"))
+        flags = CueFilterCache.flags(cl, q, 1)
+        self.assertEqual(flags, [0, 1, 1, 0])
+        self.assertIs(CueFilterCache.flags(cl, CueFilterQuery(keys=frozenset("HA")), 1), flags, "Same query, cached")
+        q = CueFilterQuery(only_suspicious=True, highlight_long=0.2, highlight_short=0.02)
+        self.assertEqual(CueFilterCache.flags(cl, q, 1), [0, 1, 1, 0])
+        self.project.cue_items[1].key = "X"
+        self.assertEqual(CueFilterCache.flags(cl, q, 1), [0, 0, 1, 0], "Cues changed, reindexed")
+
+
+if __name__ == '__main__':
+    unittest.main()
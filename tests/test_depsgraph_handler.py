@@ -0,0 +1,76 @@
+import unittest
+from types import SimpleNamespace
+
+import bpy
+
+import sample_project
+from rhubarb_lipsync.blender import baking_utils, capture_properties, mapping_utils
+from rhubarb_lipsync.blender.cue_uilist import CueRowCache
+from rhubarb_lipsync.blender.depsgraph_handler import DepsgraphHandler, HandlerStats
+from rhubarb_lipsync.rhubarb.mouth_cues import MouthCue
+
+
+class DepsgraphHandlerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.project = sample_project.SampleProject()
+        self.project.create_mapping_1action_on_armature()
+        DepsgraphHandler.stats = HandlerStats()
+
+    def fake_depsgraph(self, *ids: bpy.types.ID) -> SimpleNamespace:
+        return SimpleNamespace(updates=[SimpleNamespace(id=i) for i in ids])
+
+    def testCoalesced(self) -> None:
+        o = self.project.armature1
+        scene = bpy.context.scene
+        DepsgraphHandler.on_depsgraph_update_post(scene, self.fake_depsgraph(o, o, scene, o, scene))
+        stats = DepsgraphHandler.stats
+        self.assertEqual(stats.updates, 5)
+        self.assertEqual(stats.coalesced, 3)
+        self.assertEqual(stats.objects_processed, 1, "Each object processed once")
+        self.assertEqual(stats.scenes_processed, 1)
+        self.assertFalse(DepsgraphHandler.dirty_objects, "Processed right away in the background mode")
+
+    def testTimeBudget(self) -> None:
+        for o in (self.project.armature1, self.project.sphere1):
+            DepsgraphHandler.dirty_objects[o.session_uid] = o
+        DepsgraphHandler.scene_dirty = True
+        budget = DepsgraphHandler.TIME_BUDGET
+        try:
+            DepsgraphHandler.TIME_BUDGET = 0
+            self.assertEqual(DepsgraphHandler.process_pending(), DepsgraphHandler.DEFERRED_INTERVAL)
+            self.assertEqual(len(DepsgraphHandler.dirty_objects), 1, "One object processed even with the budget exceeded, the rest deferred")
+            self.assertEqual(DepsgraphHandler.stats.scenes_processed, 1)
+            self.assertEqual(DepsgraphHandler.stats.deferred, 1)
+            self.assertIsNone(DepsgraphHandler.process_pending(), "Last object, nothing left to defer")
+        finally:
+            DepsgraphHandler.TIME_BUDGET = budget
+        self.assertIsNone(DepsgraphHandler.process_pending())
+        self.assertFalse(DepsgraphHandler.dirty_objects)
+
+    def caches(self) -> list[dict]:
+        return [
+            mapping_utils.ActionCompatibilityIndex.fits,
+            capture_properties.CaptureIndex.indexes,
+            capture_properties.CueTimeIndex.times,
+            CueRowCache.caches,
+            baking_utils.ValidationCache.results,
+        ]
+
+    def testLoadPostClearsCaches(self) -> None:
+        bc = self.project.create_mapping_1action_on_armature()
+        bc.validate_current_object_cached()
+        mapping_utils.ActionCompatibilityIndex.does_fit(self.project.armature1, self.project.action_single)
+        self.project.create_capture()
+        self.project.cue_list.add_cues([MouthCue("A", 0, 0.5)])
+        self.project.cue_list.find_index_by_time(0.1)
+        CueRowCache.rows(bpy.context, self.project.cue_list, self.project.prefs.cue_list_prefs)
+        capture_properties.CaptureIndex.of(self.project.clist_props)
+        for cache in self.caches():
+            self.assertTrue(cache)
+        DepsgraphHandler.on_load_post()
+        for cache in self.caches():
+            self.assertFalse(cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import bpy
 
 import rhubarb_lipsync.blender.mapping_utils as mapping_utils
 import sample_project
+from rhubarb_lipsync.blender import action_support
 
 
 class BakingContextTest(unittest.TestCase):
@@ -51,3 +52,41 @@ class BakingContextTest(unittest.TestCase):
         self.assertIn(self.aasset, actions)
         self.assertNotIn(self.ashpky, actions)
         self.assertNotIn(self.ainvld, actions)
+
+    def testCompatibilityIndex(self) -> None:
+        o = self.project.armature1
+        index = mapping_utils.ActionCompatibilityIndex
+        self.assertIn(self.anrmal, self.list_action(False, True, False))
+        fcurves = list(action_support.get_action_fcurves(self.anrmal, action_support.get_action_slot_keys(self.anrmal)[0]))
+        fcurves[0].data_path = 'pose.bones["InvalidBone"].location'  # Changed through the python api, no depsgraph update
+        self.assertIn(self.anrmal, self.list_action(False, True, False), "Cached")
+        index.invalidate_action(self.anrmal)
+        self.assertNotIn(self.anrmal, self.list_action(False, True, False))
+        self.assertFalse(mapping_utils.does_action_fit_object(o, self.anrmal))
+
+    def testObjectDataSignature(self) -> None:
+        o = self.project.armature1
+        signature = mapping_utils.object_data_signature(o)
+        self.assertEqual(mapping_utils.object_data_signature(o), signature)
+        o["custom"] = 1.0
+        self.assertNotEqual(mapping_utils.object_data_signature(o), signature, "Custom property can be animated")
+        for change, msg in [
+            (lambda: o.constraints.new('COPY_LOCATION'), "Constraint influence can be animated"),
+            (lambda: o.pose.bones[0].__setitem__("custom", 1.0), "Bone custom property can be animated"),
+            (lambda: o.pose.bones[0].constraints.new('COPY_ROTATION'), "Bone constraint can be animated"),
+            (lambda: o.data.__setitem__("custom", 1.0), "Data custom property can be animated"),
+        ]:
+            signature = mapping_utils.object_data_signature(o)
+            change()
+            self.assertNotEqual(mapping_utils.object_data_signature(o), signature, msg)
+
+    def testDataPathMemo(self) -> None:
+        o = self.project.armature1
+        self.assertTrue(mapping_utils.does_action_fit_object(o, self.anrmal))
+        memo = mapping_utils.DataPathMemo.of(o)
+        self.assertTrue(memo.paths, "Resolved paths remembered")
+        self.assertFalse(memo.resolves('pose.bones["InvalidBone"].location', False))
+        self.assertIn(('pose.bones["InvalidBone"].location', False), memo.paths)
+        self.assertIs(mapping_utils.DataPathMemo.of(o), memo)
+        o["custom"] = 1.0
+        self.assertIsNot(mapping_utils.DataPathMemo.of(o), memo, "Signature changed, memo rebuilt")
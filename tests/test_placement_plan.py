@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from rhubarb_lipsync.rhubarb.cue_processor import CueProcessor
+from rhubarb_lipsync.rhubarb.mouth_cues import FrameConfig, MouthCue, MouthCueFrames
+from rhubarb_lipsync.rhubarb.placement_plan import PlacementPlan
+
+
+class PlacementPlanTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fcfg = FrameConfig(60)
+        cues = [MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.7), MouthCue("B", 0.7, 1), MouthCue("X", 1, 2)]
+        self.cp = CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in cues])
+
+    def testBuild(self) -> None:
+        plan = PlacementPlan.build(self.cp, 0.5, "BY_RATIO")
+        self.assertEqual(len(plan), 4)
+        self.assertEqual([s.track_slot for s in plan.strips], [0, 1, 0, 1])
+        self.assertEqual([s.auto_blend for s in plan.strips], [True, False, False, True])
+        x, a, b, _ = plan.strips
+        self.assertEqual(a.start, 30, "Previous cue is silence, starts at the cue start")
+        self.assertEqual(a.end, b.start + b.blend_in, "Overlaps with the following cue")
+        self.assertGreater(b.start, a.start)
+        self.assertEqual(b.end, 60, "Following cue is silence, ends at the cue end")
+        self.assertEqual(a.name, "Ⓐ.001")
+
+    def testNoBlending(self) -> None:
+        plan = PlacementPlan.build(self.cp, 0.5, "NO_BLENDING")
+        self.assertFalse(any(s.auto_blend for s in plan.strips))
+        self.assertEqual([(s.start, s.end) for s in plan.strips], [(0, 30), (30, 42), (42, 60), (60, 120)])
+
+    def testCached(self) -> None:
+        plan = PlacementPlan.cached(self.cp, 0.5, "BY_RATIO")
+        self.assertIs(PlacementPlan.cached(self.cp, 0.5, "BY_RATIO"), plan)
+        self.assertIsNot(PlacementPlan.cached(self.cp, 0.4, "BY_RATIO"), plan)
+        self.cp.cue_frames[1].cue.end = 0.6
+        self.assertIsNot(PlacementPlan.cached(self.cp, 0.5, "BY_RATIO"), plan, "Cues changed")
+
+    def testJson(self) -> None:
+        plan = PlacementPlan.build(self.cp, 0.5, "BY_RATIO")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "plan.json"
+            plan.save(path)
+            self.assertEqual(PlacementPlan.load(path), plan)
+            self.assertIsNone(PlacementPlan.load(Path(tmp) / "missing.json"))
+
+    def testDirtyRange(self) -> None:
+        plan = PlacementPlan.build(self.cp, 0.5, "BY_RATIO")
+        self.assertIsNone(plan.dirty_range(PlacementPlan.build(self.cp, 0.5, "BY_RATIO")))
+        self.assertEqual(plan.dirty_range(PlacementPlan.build(self.cp, 0.4, "BY_RATIO")), (0, 4, 4), "Different settings")
+        cues = [cf.cue for cf in self.cp.cue_frames]
+        changed = CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in [*cues[:2], MouthCue("C", 0.7, 1), *cues[3:]]])
+        self.assertEqual(PlacementPlan.build(changed, 0.5, "BY_RATIO").dirty_range(plan, 0), (2, 3, 3), "Only the B changed to C")
+        self.assertEqual(PlacementPlan.build(changed, 0.5, "BY_RATIO").dirty_range(plan), (0, 4, 4), "Neighbours included")
+
+    def testDirtyRangeShifted(self) -> None:
+        cues = [MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.7), MouthCue("B", 0.7, 1), MouthCue("X", 1, 2), MouthCue("C", 2, 2.2), MouthCue("X", 2.2, 3)]
+        plan = PlacementPlan.build(CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in cues]), 0.5, "BY_RATIO")
+        # Split the A to two cues. All the following cues shift by two strips (so stay on the same track)
+        split = [cues[0], MouthCue("A", 0.5, 0.6), MouthCue("D", 0.6, 0.65), MouthCue("A", 0.65, 0.7), *cues[2:]]
+        new_plan = PlacementPlan.build(CueProcessor(self.fcfg, [MouthCueFrames(c, self.fcfg) for c in split]), 0.5, "BY_RATIO")
+        start, old_end, new_end = new_plan.dirty_range(plan, 0)
+        self.assertEqual((start, new_end - old_end), (0, 2), "The X before blends into the changed A")
+        self.assertEqual([s.placement for s in plan.strips[old_end:]], [s.placement for s in new_plan.strips[new_end:]])
+        self.assertNotEqual(plan.strips[-1].name, new_plan.strips[-1].name, "Cue index shifted")
+
+
+if __name__ == '__main__':
+    unittest.main()
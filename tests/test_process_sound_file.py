@@ -1,14 +1,29 @@
 import logging
+import os
+import selectors
+import subprocess
+import sys
+import tempfile
 import unittest
 from functools import cached_property
 from pathlib import Path
 from time import sleep
+from unittest import mock
 
 import rhubarb_lipsync.rhubarb.rhubarb_command as rhubarb_command
 
 # import tests.sample_data
 import sample_data
-from rhubarb_lipsync.rhubarb.rhubarb_command import RhubarbCommandAsyncJob, RhubarbCommandWrapper, RhubarbParser
+from rhubarb_lipsync.rhubarb.cue_cache import CueCache
+from rhubarb_lipsync.rhubarb.rhubarb_command import (
+    RhubarbCommandAsyncJob,
+    RhubarbCommandPool,
+    RhubarbCommandWrapper,
+    RhubarbIOMultiplexer,
+    RhubarbParser,
+)
+from rhubarb_lipsync.rhubarb.segmented_capture import RhubarbSegmentedJob
+from test_segmented_capture import tone_with_gaps
 
 
 def enableDebug() -> None:
@@ -98,6 +113,15 @@ class RhubarbCommandWrapperTest(unittest.TestCase):
         assert self.wrapper.has_finished
         self.compare_testdata_with_current(self.data_short)
 
+    def testLipsync_async_threads(self) -> None:
+        # The reader threads fallback used when the IO multiplexer is not supported (Windows)
+        self.wrapper.lipsync_start(str(self.data_short.snd_file_path))
+        job = RhubarbCommandAsyncJob(self.wrapper, use_multiplexer=False)
+        wait_until_finished_async(job)
+        assert not job.multiplexed
+        assert not self.wrapper.was_started
+        self.compare_testdata_with_current(self.data_short)
+
     @unittest.skip("Takes very long. And the output differs a bit each run. Probably after multi-threadinig kicks in.")
     def testLipsync_async_long(self) -> None:
         self.wrapper.lipsync_start(str(self.data_long.snd_file_path))
@@ -106,6 +130,36 @@ class RhubarbCommandWrapperTest(unittest.TestCase):
         assert self.wrapper.has_finished
         self.compare_testdata_with_current(self.data_long)
 
+    def testLipsync_cached(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            self.wrapper.cache = CueCache(Path(tmp), 1024 * 1024)
+            job = RhubarbCommandAsyncJob(self.wrapper)
+            self.wrapper.lipsync_start(str(self.data_short.snd_file_path))
+            assert not self.wrapper.from_cache
+            wait_until_finished_async(job)
+            assert job.status == "Done"
+            assert len(self.wrapper.cache.entries()) == 1
+            # Second run is served from the cache without starting the process
+            job = RhubarbCommandAsyncJob(self.wrapper)
+            self.wrapper.lipsync_start(str(self.data_short.snd_file_path))
+            assert self.wrapper.from_cache
+            assert not self.wrapper.was_started
+            assert self.wrapper.has_finished
+            assert job.lipsync_check_progress_async() == 100
+            assert job.status == "Cached"
+            res = self.data_short.compare_cues_with_expected(job.get_lipsync_output_cues())
+            self.assertIsNone(res, res)
+
+    def testLipsync_cached_missing_dialog(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            self.wrapper.cache = CueCache(Path(tmp), 1024 * 1024)
+            # The cache key can't be built, runs without the cache. The missing file is reported by the rhubarb
+            self.wrapper.lipsync_start(str(self.data_short.snd_file_path), str(Path(tmp) / "missing_dialog.txt"))
+            assert self.wrapper.was_started
+            assert not self.wrapper.from_cache
+            assert self.wrapper.cache_key is None
+            self.wrapper.close_process()
+
     def testLipsync_cancel(self) -> None:
         job = RhubarbCommandAsyncJob(self.wrapper)
         assert not self.wrapper.was_started
@@ -140,6 +194,166 @@ class RhubarbCommandWrapperTest(unittest.TestCase):
         self.compare_testdata_with_current(self.data_short)
 
 
+def wait_until_pool_finished(pool: RhubarbCommandPool) -> list:
+    finished = []
+    for i in range(0, 2000):
+        finished += pool.check_progress()
+        if pool.has_finished:
+            return finished
+        assert len(pool.running) <= pool.max_running
+        sleep(0.1)
+    assert False, "Seems the pool in hanging up"
+
+
+class RhubarbCommandPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        enableDebug()
+        self.wrapper_test = RhubarbCommandWrapperTest()
+
+    @property
+    def data_short(self) -> sample_data.SampleData:
+        return self.wrapper_test.data_short
+
+    @property
+    def data_long(self) -> sample_data.SampleData:
+        return self.wrapper_test.data_long
+
+    def new_job(self) -> RhubarbCommandAsyncJob:
+        return RhubarbCommandAsyncJob(RhubarbCommandWrapper(self.wrapper_test.executable_path))
+
+    def testPool(self) -> None:
+        pool = RhubarbCommandPool(2)
+        for i in range(3):
+            pool.submit(i, self.new_job(), str(self.data_short.snd_file_path))
+        assert pool.progress == 0
+        assert not pool.has_finished
+        finished = wait_until_pool_finished(pool)
+        self.assertEqual(sorted(finished), [0, 1, 2])
+        assert pool.progress == 100
+        assert pool.failed_count == 0
+        for job in pool.jobs.values():
+            assert job.status == "Done"
+            res = self.data_short.compare_cues_with_expected(job.get_lipsync_output_cues())
+            self.assertIsNone(res, res)
+
+    def testPoolStartFailureOfLastJob(self) -> None:
+        pool = RhubarbCommandPool(1)
+        pool.submit(0, self.new_job(), str(self.data_short.snd_file_path))
+        failing = RhubarbCommandAsyncJob(RhubarbCommandWrapper(Path("/nonexistent/rhubarb")))
+        pool.submit(1, failing, str(self.data_short.snd_file_path))
+        finished = wait_until_pool_finished(pool)
+        self.assertEqual(sorted(finished), [0, 1], "The job which failed to start is reported too")
+        self.assertEqual(pool.failed_count, 1)
+        assert failing.last_exception
+
+    def testPoolCancel(self) -> None:
+        pool = RhubarbCommandPool(1)
+        pool.submit("long", self.new_job(), str(self.data_long.snd_file_path))
+        pool.submit("short", self.new_job(), str(self.data_short.snd_file_path))
+        pool.start_pending()
+        assert list(pool.running) == ["long"]
+        assert len(pool.pending) == 1
+        pool.cancel()
+        assert pool.has_finished
+        for job in pool.jobs.values():
+            assert job.status == "Stopped"
+
+
+@unittest.skipUnless(RhubarbIOMultiplexer.supported, "No IO multiplexer on Windows")
+class RhubarbIOMultiplexerTest(unittest.TestCase):
+    def new_job(self) -> RhubarbCommandAsyncJob:
+        cmd = RhubarbCommandWrapper(Path("rhubarb"))
+        cmd.process = subprocess.Popen([sys.executable, "-c", "pass"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return RhubarbCommandAsyncJob(cmd)
+
+    def wait_for_event(self, mux: RhubarbIOMultiplexer, job: RhubarbCommandAsyncJob) -> tuple:
+        for _ in range(50):
+            mux.dispatch()
+            if not job.queue.empty():
+                return job.queue.get_nowait()
+            sleep(0.1)
+        assert False, "No event received"
+
+    def testFailedRequest(self) -> None:
+        mux = RhubarbIOMultiplexer()
+        job = self.new_job()
+        job.cmd.process.stdout.close()  # The pipe can't be served
+        mux.register(job)
+        msg, e = self.wait_for_event(mux, job)
+        self.assertEqual(msg, "EXCEPTION")
+        mux.unregister(job)
+        assert mux.thread and mux.thread.is_alive(), "The IO thread survives a failed request"
+        job.cmd.process.wait()
+
+    def testThreadFailure(self) -> None:
+        mux = RhubarbIOMultiplexer()
+
+        class FailingSelector(selectors.DefaultSelector):  # type: ignore
+            def select(self, timeout=None):
+                raise OSError("Selector failed")
+
+        def run_failing_thread() -> None:
+            with mock.patch.object(rhubarb_command.selectors, "DefaultSelector", FailingSelector):
+                mux.ensure_started()
+                assert mux.thread
+                mux.thread.join(5)
+                assert not mux.thread.is_alive()
+
+        run_failing_thread()
+        open_fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+        for _ in range(3):
+            run_failing_thread()
+        if open_fds is not None:
+            self.assertEqual(len(os.listdir("/proc/self/fd")), open_fds, "The wake-up pipes of the failed threads closed")
+        job = self.new_job()
+        mux.register(job)  # A new thread started
+        self.assertEqual(self.wait_for_event(mux, job)[0], "EXIT")
+
+
+class RhubarbSegmentedJobTest(unittest.TestCase):
+    def setUp(self) -> None:
+        enableDebug()
+        self.wrapper_test = RhubarbCommandWrapperTest()
+
+    def testSegmented(self) -> None:
+        rate = 16000
+        samples = tone_with_gaps(rate, [(3, True), (0.5, False), (3, True), (0.5, False), (3, True)])
+        job = RhubarbSegmentedJob(lambda: RhubarbCommandWrapper(self.wrapper_test.executable_path), samples, rate, 3, min_segment_len=2)
+        assert job.status == "Stopped"
+        job.lipsync_start()
+        self.assertEqual(len(job.segments), 3)
+        tmp_dir = job.tmp_dir
+        assert tmp_dir and tmp_dir.exists()
+        for i in range(0, 1000):
+            job.lipsync_check_progress_async()
+            if job.has_finished:
+                break
+            sleep(0.1)
+        assert job.has_finished
+        assert not job.failed, job.last_exception
+        assert job.last_progress == 100
+        assert not tmp_dir.exists(), "Temporary segment files should be removed"
+        cues = job.get_lipsync_output_cues()
+        for a, b in zip(cues, cues[1:]):
+            self.assertAlmostEqual(a.end, b.start, msg="Gap between the stitched cues")
+
+    def testStreaming(self) -> None:
+        rate = 16000
+        samples = tone_with_gaps(rate, [(3, True), (0.5, False)] * 4)
+        job = RhubarbSegmentedJob(lambda: RhubarbCommandWrapper(self.wrapper_test.executable_path), samples, rate, 1, window_len=3.5)
+        job.lipsync_start()
+        self.assertEqual(len(job.segments), 4)
+        streamed = []
+        for i in range(0, 1000):
+            job.lipsync_check_progress_async()
+            streamed += job.take_new_cues()
+            if job.has_finished:
+                break
+            sleep(0.1)
+        assert job.has_finished and not job.failed, job.last_exception
+        self.assertEqual(streamed, job.get_lipsync_output_cues())
+
+
 class RhubarbParserTest(unittest.TestCase):
     def setUp(self) -> None:
         enableDebug()
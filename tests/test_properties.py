@@ -1,7 +1,11 @@
 import unittest
 
+import bpy
+
 import sample_project
 from helper import skip_no_aud
+from rhubarb_lipsync.blender.capture_properties import CueTimeIndex
+from rhubarb_lipsync.rhubarb.mouth_cues import FrameConfig, MouthCue
 
 
 class PropertiesTest(unittest.TestCase):
@@ -23,6 +27,62 @@ class PropertiesTest(unittest.TestCase):
         newName = self.project.cprops.get_sound_name_with_new_extension("wav")
         self.assertEqual(newName, 'en_male_electricity.wav')
 
+    def testCueListBulkAdd(self) -> None:
+        cl = self.project.cue_list
+        cues = [MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.75), MouthCue("H", 0.75, 1.25)]
+        cl.add_cues(cues[:2])
+        cl.add_cues(cues[2:])  # Append
+        self.assertEqual([i.cue.key for i in cl.items], ["X", "A", "H"])
+        self.assertEqual([i.cue.end for i in cl.items], [0.5, 0.75, 1.25])
+        keys, starts, ends = cl.cue_columns()
+        self.assertEqual(starts.tolist(), [0, 0.5, 0.75])
+        self.assertEqual(ends.tolist(), [0.5, 0.75, 1.25])
+        self.assertEqual(cl.cue_table(FrameConfig(1)).to_cues(), cues)
+
+    def testCueListAppendTail(self) -> None:
+        cl = self.project.cue_list
+        cues = [MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.75), MouthCue("H", 0.75, 1.25), MouthCue("B", 1.25, 1.5)]
+        cl.add_cues(cues[:3])
+        revision = cl.revision
+        cl.add_cues(cues[3:])  # Shorter than the list, only the new item written
+        self.assertGreater(cl.revision, revision)
+        self.assertEqual(cl.cue_table(FrameConfig(1)).to_cues(), cues)
+        # A list of an older version, the keys stored as strings are converted by the whole rewrite
+        cl.uses_key_index = False
+        cl.items[1]["key"] = "C"
+        cl.add_cues([MouthCue("X", 1.5, 2)])
+        self.assertTrue(cl.uses_key_index)
+        self.assertEqual([c.key for c in cl.cue_table(FrameConfig(1)).to_cues()], ["X", "C", "H", "B", "X"])
+
+    def testCueListLegacyKeys(self) -> None:
+        cl = self.project.cue_list
+        cl.add_cues([MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.75)])
+        # Simulate the list stored by an older version, the key as string and no key_index
+        cl.uses_key_index = False
+        cl.items[1]["key"] = "B"
+        self.assertEqual(cl.items[1].key, "B")
+        self.assertEqual([c.key for c in cl.cue_table(FrameConfig(1)).to_cues()], ["X", "B"])
+        cl.items[1].key = "C"
+        self.assertNotIn("key", cl.items[1])
+        self.assertEqual(cl.items[1].key, "C")
+
+    def testFindCueByTime(self) -> None:
+        cl = self.project.cue_list
+        cl.add_cues([MouthCue("X", 0, 0.5), MouthCue("A", 0.5, 0.75), MouthCue("H", 0.75, 1.25)])
+        self.assertEqual([cl.find_index_by_time(t) for t in (-1, 0, 0.6, 0.75, 2)], [-1, 0, 1, 2, 2])
+        self.assertIsNone(cl.find_cue_by_time(-1))
+        self.assertEqual(cl.find_cue_by_time(0.6).key, "A")
+        self.assertEqual(cl.find_cue_by_time(0.75).key, "H")
+        self.assertIsNone(cl.find_cue_by_time(1.25), "After the last cue")
+        starts, _ = CueTimeIndex.of(cl)
+        self.assertIs(CueTimeIndex.of(cl)[0], starts, "Cached")
+        cl.add_cues([MouthCue("B", 1.25, 1.5)])
+        self.assertEqual(cl.find_cue_by_time(1.3).key, "B", "Rebuilt")
+        props = self.project.cprops
+        props.start_frame = 11
+        fps = bpy.context.scene.render.fps
+        self.assertAlmostEqual(props.frame2cue_time(bpy.context, 11 + fps), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
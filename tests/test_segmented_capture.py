@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from rhubarb_lipsync.rhubarb.mouth_cues import MouthCue
+from rhubarb_lipsync.rhubarb.segmented_capture import (
+    CueStitcher,
+    SoundSegment,
+    cue_agreement,
+    find_silences,
+    plan_segments,
+    read_wav,
+    stitch_segments,
+    write_wav,
+)
+
+
+def tone_with_gaps(rate: int, parts: list[tuple[float, bool]]) -> np.ndarray:
+    """Sine tone interrupted by silent gaps. Each part is (duration, is_loud)"""
+    chunks = []
+    for dur, loud in parts:
+        n = int(dur * rate)
+        t = np.arange(n) / rate
+        chunks.append(0.5 * np.sin(2 * np.pi * 220 * t) if loud else np.zeros(n))
+    return np.concatenate(chunks).astype(np.float32)
+
+
+class SegmentedCaptureTest(unittest.TestCase):
+    rate = 16000
+
+    def testFindSilences(self) -> None:
+        samples = tone_with_gaps(self.rate, [(1, True), (0.5, False), (1, True), (0.1, False), (1, True)])
+        silences = find_silences(samples, self.rate)
+        self.assertEqual(len(silences), 1, "The short gap should be ignored")
+        s, e = silences[0]
+        self.assertAlmostEqual(s, 1, delta=0.02)
+        self.assertAlmostEqual(e, 1.5, delta=0.02)
+        self.assertEqual(find_silences(np.zeros(self.rate), self.rate), [(0.0, 1.0)])
+        self.assertEqual(find_silences(np.zeros(0), self.rate), [])
+
+    def testPlanSegments(self) -> None:
+        silences = [(9, 10), (19, 21), (29, 31), (50, 51)]
+        segs = plan_segments(60, silences, 3, min_segment_len=5, overlap=0.2)
+        self.assertEqual([(s.own_start, s.own_end) for s in segs], [(0, 20), (20, 30), (30, 60)])
+        self.assertEqual(segs[0].start, 0)
+        self.assertAlmostEqual(segs[1].start, 19.8)
+        self.assertAlmostEqual(segs[1].end, 30.2)
+        self.assertEqual(segs[-1].end, 60)
+        # Too short to be split, or no silences to split at
+        self.assertEqual(len(plan_segments(60, silences, 3, min_segment_len=40)), 1)
+        self.assertEqual(len(plan_segments(60, [], 3, min_segment_len=5)), 1)
+
+    def testStitch(self) -> None:
+        seg1 = SoundSegment(0, 10.2, 0, 10)
+        seg2 = SoundSegment(9.8, 20, 10, 20)
+        cues1 = [MouthCue("A", 0, 4), MouthCue("B", 4, 9), MouthCue("X", 9, 10.2)]
+        cues2 = [MouthCue("X", 0, 1), MouthCue("C", 1, 10.2)]
+        stitched = stitch_segments([(seg1, cues1), (seg2, cues2)])
+        self.assertEqual([(c.key, c.start, c.end) for c in stitched], [("A", 0, 4), ("B", 4, 9), ("X", 9, 10.8), ("C", 10.8, 20)])
+
+    def testStitchIncremental(self) -> None:
+        segs = [SoundSegment(0, 10.2, 0, 10), SoundSegment(9.8, 20.2, 10, 20), SoundSegment(19.8, 30, 20, 30)]
+        st = CueStitcher(segs)
+        st.add(1, [MouthCue("X", 0, 1), MouthCue("C", 1, 10.4)])
+        self.assertEqual(st.take_ready(), [], "The first segment is not done yet")
+        st.add(0, [MouthCue("A", 0, 4), MouthCue("X", 4, 10.2)])
+        ready = st.take_ready()
+        # The last cue (C) is held back since it could get merged with the next segment
+        self.assertEqual([(c.key, c.start, c.end) for c in ready], [("A", 0, 4), ("X", 4, 10.8)])
+        assert not st.is_complete
+        st.add(2, [MouthCue("C", 0, 1), MouthCue("X", 1, 10.2)])
+        ready = st.take_ready()
+        self.assertEqual([(c.key, c.start, c.end) for c in ready], [("C", 10.8, 20), ("C", 20, 20.8), ("X", 20.8, 30)])
+        assert st.is_complete
+        self.assertEqual(st.take_ready(), [])
+
+    def testAgreement(self) -> None:
+        a = [MouthCue("A", 0, 1), MouthCue("B", 1, 2)]
+        self.assertEqual(cue_agreement(a, a), 1)
+        b = [MouthCue("A", 0, 1), MouthCue("C", 1, 2)]
+        self.assertAlmostEqual(cue_agreement(a, b), 0.5, delta=0.01)
+        self.assertEqual(cue_agreement([], []), 1)
+
+    def testWavRoundTrip(self) -> None:
+        samples = tone_with_gaps(self.rate, [(0.5, True), (0.5, False)])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.wav")
+            write_wav(path, samples, self.rate)
+            read, rate = read_wav(path)
+        self.assertEqual(rate, self.rate)
+        self.assertEqual(len(read), len(samples))
+        np.testing.assert_allclose(read, samples, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,3 +24,59 @@ class SoundOperatorsTest(unittest.TestCase):
 
         ui_utils.assert_op_ret(bpy.ops.rhubarb.place_sound_strip())
         self.assertEqual(len(find_sound_strips_by_sound(bpy.context)), 1)
+
+    @skip_no_aud
+    def test_sound_strip_index(self) -> None:
+        self.project.create_capture()
+        self.project.set_capture_sound()
+        sound = self.project.cprops.sound
+        strips = ui_utils.find_sound_strips_by_sound(bpy.context, sound)
+        self.assertEqual(len(strips), 1)
+        self.assertIn(sound.session_uid, ui_utils.SoundStripIndex.by_sound)
+
+        # Another strip with a different Sound of the same file
+        strips_coll = ui_utils.get_strips_from_sequence_editor(bpy.context)
+        other = strips_coll.new_sound("other", sound.filepath, 2, 1)
+        strips = ui_utils.find_sound_strips_by_sound(bpy.context, sound)  # Strip count changed, rebuilt
+        self.assertEqual(len(strips), 2)
+        self.assertEqual(strips[0].sound, sound, "Exact Sound match first")
+        self.assertEqual(strips[1], other)
+
+    @skip_no_aud
+    def test_capture_index(self) -> None:
+        clist = self.project.clist_props
+        sounds = []
+        for i in range(3):
+            self.project.create_capture()
+            snd = self.project.sample.to_sound(bpy.context)  # Each call creates a new strip (and a Sound) on channel 1
+            self.project.set_capture_sound(snd)
+            sounds.append(snd)
+        strips = ui_utils.find_sound_strips_by_sound(bpy.context, sounds[1])
+        self.assertEqual(clist.find_capture_by_strip(strips[0]), clist.items[1], "Exact Sound match")
+        clist.selected_item = clist.items[2]
+        self.assertEqual(clist.index, 2)
+
+        strips[0].channel = 3
+        strips[0].frame_start = 5
+        ui_utils.SoundStripIndex.invalidate()
+        self.assertEqual(clist.sync_from_strips(bpy.context), 1, "Only the moved strip changed")
+        self.assertEqual((clist.items[1].channel_number, clist.items[1].start_frame), (3, 5))
+
+        clist.items[1].sound = None  # Invalidates the index
+        self.assertEqual(clist.find_capture_by_strip(strips[0]), clist.items[2], "Same file match")
+
+    @skip_no_aud
+    def test_sync_captures_sharing_sound(self) -> None:
+        clist = self.project.clist_props
+        self.project.create_capture()
+        self.project.set_capture_sound()
+        sound = self.project.cprops.sound
+        self.project.create_capture()
+        self.project.set_capture_sound(sound)  # Both captures use the same Sound, with a single strip
+        strip = ui_utils.find_sound_strips_by_sound(bpy.context, sound)[0]
+        strip.channel = 4
+        strip.frame_start = 7
+        ui_utils.SoundStripIndex.invalidate()
+        self.assertEqual(clist.sync_from_strips(bpy.context), 2, "Both captures synced")
+        self.assertEqual([(c.channel_number, c.start_frame) for c in clist.items], [(4, 7), (4, 7)])
+        self.assertEqual(clist.find_capture_by_strip(strip), clist.items[0], "Both placed on the strip, the first one")